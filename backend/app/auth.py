@@ -1,24 +1,37 @@
+import hashlib
+import time
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from typing import Optional
-from jose import JWTError, jwt
-import bcrypt
+from jose import JWTError, jwk, jwt
+from jose.backends.base import Key
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from app.config import get_settings
 from app.models import TokenData
+from app.utils.cache import TTLCache
+from app.utils.passwords import password_hasher
+from app.utils.logger import logger
 
 settings = get_settings()
 
-# bcrypt used directly to avoid passlib version conflicts
+# Verified tokens, keyed by SHA-256 of the raw token; each entry expires with the token's `exp`
+_token_cache = TTLCache(maxsize=settings.TOKEN_CACHE_MAX_ENTRIES)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
+# bcrypt used directly (to avoid passlib version conflicts), off the event loop
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
+
 
+async def get_password_hash(password: str) -> str:
+    return await password_hasher.hash(password)
 
-def get_password_hash(password: str) -> str:
-    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    return password_hasher.needs_rehash(hashed_password)
 
 
 def get_modules_for_role(role: str) -> list:
@@ -34,15 +47,35 @@ def get_modules_for_role(role: str) -> list:
     return role_modules.get(role, ["VCT"])
 
 
+# ─── RS256 Keys ───────────────────────────────────────────────────────────────
+# PEM parsing is done once per process; python-jose uses the prepared key as is.
+
+@lru_cache(maxsize=1)
+def _signing_key() -> Key:
+    return jwk.construct(settings.PRIVATE_KEY.replace("\\n", "\n"), algorithm="RS256")
+
+
+@lru_cache(maxsize=1)
+def _verification_key() -> Key:
+    return jwk.construct(settings.PUBLIC_KEY.replace("\\n", "\n"), algorithm="RS256")
+
+
+def load_jwt_keys() -> None:
+    """Parse the RS256 key pair up front (called from the app lifespan)."""
+    try:
+        _signing_key()
+        _verification_key()
+    except Exception as e:
+        logger.warning(f"RS256 keys could not be loaded at startup: {str(e)}")
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (
         expires_delta or timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     to_encode.update({"exp": expire})
-    # python-jose accepts raw PEM bytes for RS256
-    private_key_pem = settings.PRIVATE_KEY.replace("\\n", "\n").encode()
-    return jwt.encode(to_encode, private_key_pem, algorithm="RS256")
+    return jwt.encode(to_encode, _signing_key(), algorithm="RS256")
 
 
 def decode_token(token: str) -> TokenData:
@@ -51,20 +84,28 @@ def decode_token(token: str) -> TokenData:
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    cache_key = hashlib.sha256(token.encode()).digest()
+    cached = _token_cache.get(cache_key)
+    if cached is not None:
+        return cached.model_copy()
+
     try:
-        # python-jose accepts raw PEM bytes for RS256
-        public_key_pem = settings.PUBLIC_KEY.replace("\\n", "\n").encode()
-        payload = jwt.decode(token, public_key_pem, algorithms=["RS256"])
+        payload = jwt.decode(token, _verification_key(), algorithms=["RS256"])
         user_id: str = payload.get("sub")
         email: str = payload.get("email")
         role: str = payload.get("role")
         modules: list = payload.get("modules", [])
         if user_id is None:
             raise credentials_exception
-        return TokenData(user_id=user_id, email=email, role=role, modules=modules)
+        token_data = TokenData(user_id=user_id, email=email, role=role, modules=modules)
     except JWTError:
         raise credentials_exception
 
+    ttl = payload.get("exp", 0) - time.time()
+    if ttl > 0:
+        _token_cache.set(cache_key, token_data, ttl=ttl)
+    return token_data.model_copy()
+
 
 def require_module(module: str):
     async def checker(
@@ -14,6 +14,31 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = "mongodb://localhost:27017"
     DATABASE_NAME: str = "musb_research"
+    VERIFY_QUERY_PLANS: bool = False  # Fail startup if a registered query shape resolves to a COLLSCAN
+
+    # In-process caches
+    STUDY_CACHE_TTL_SECONDS: int = 60
+    STUDY_CACHE_MAX_ENTRIES: int = 512
+    PARTICIPANT_CACHE_TTL_SECONDS: int = 30
+    PARTICIPANT_CACHE_MAX_ENTRIES: int = 4096
+
+    # Audit log entries are buffered and written in batches (durable=True writes bypass the buffer)
+    AUDIT_FLUSH_BATCH_SIZE: int = 200
+    AUDIT_FLUSH_INTERVAL_SECONDS: float = 1.0
+    AUDIT_QUEUE_MAX: int = 10000
+
+    # One-time passcodes: "mongo" shares codes across workers, "memory" is per process (tests)
+    OTP_STORE: str = "mongo"
+    OTP_TTL_MINUTES: int = 10
+
+    # Auth rate limits: "mongo" shares counters across workers, "memory" is per process
+    RATE_LIMIT_STORE: str = "mongo"
+    RATE_LIMIT_MEMORY_MAX_KEYS: int = 100_000
+    RATE_LIMIT_DEFAULT_PER_MINUTE: int = 200  # Every API request, per client and worker (counted in memory)
+    TRUSTED_PROXY_HOPS: int = 0  # Reverse proxies in front of the app that append to X-Forwarded-For
+
+    # Dashboard counts are refreshed in the background at this interval (0 = count on every request)
+    STATS_SNAPSHOT_INTERVAL_SECONDS: int = 30
 
     # Security
     SECRET_KEY: str = "CHANGE_THIS_IN_PRODUCTION_VERY_LONG_SECRET_KEY"
@@ -25,6 +50,35 @@ class Settings(BaseSettings):
     # RS256 key pair (optional, only if using RS256)
     PRIVATE_KEY: str = ""
     PUBLIC_KEY: str = ""
+    BCRYPT_ROUNDS: int = 12  # Changing this rehashes each user's password at their next login
+    BCRYPT_MAX_CONCURRENCY: int = 2  # Concurrent hashes per worker; the rest queue
+    TOKEN_CACHE_MAX_ENTRIES: int = 10000  # Verified access tokens kept per worker (until their exp)
+
+    # Task schedules
+    SCHEDULE_INSERT_BATCH_SIZE: int = 1000  # Task instances per insert_many when materializing
+    COMPLIANCE_SWEEP_INTERVAL_SECONDS: int = 300  # How often PENDING tasks past due are marked OVERDUE (0 = never)
+
+    # Screening eligibility
+    ELIGIBILITY_CACHE_MAX_ENTRIES: int = 1000  # Compiled study criteria kept per worker
+    ELIGIBILITY_CACHE_TTL_SECONDS: int = 3600
+    ELIGIBILITY_REEVALUATE_BATCH_SIZE: int = 500  # Participants re-screened per chunk when criteria change
+
+    # Data log batch ingestion
+    LOG_INGEST_CHUNK_SIZE: int = 1000  # Entries validated, encrypted and inserted together
+    LOG_BATCH_MAX_ITEMS: int = 50000  # Entries accepted per request
+    LOG_ROLLUP_TYPES: list[str] = ["VITALS", "SLEEP"]  # Types folded into hourly/daily/weekly buckets
+
+    # Coordinator vitals analytics
+    VITALS_ANALYTICS_CACHE_MAX_ENTRIES: int = 5000  # Participants cached per worker
+    VITALS_ANALYTICS_CACHE_TTL_SECONDS: int = 3600
+    VITALS_ANALYTICS_MAX_READINGS: int = 20000  # Most recent readings analyzed per participant
+    VITALS_ANALYTICS_CHUNK_SIZE: int = 25  # Uncached participants loaded and analyzed together
+
+    # Bulk decryption (exports and list endpoints)
+    DECRYPT_POOL: str = "thread"  # thread, process
+    DECRYPT_WORKERS: int = 0  # 0 = one per CPU
+    DECRYPT_CHUNK_SIZE: int = 256
+    DECRYPT_INLINE_MAX: int = 32  # Batches this small are cheaper to decrypt inline than to hand off
 
     # CORS
     ALLOWED_ORIGINS: Any = [
@@ -65,6 +119,18 @@ class Settings(BaseSettings):
     SMTP_EMAIL: str = ""
     SMTP_PASSWORD: str = ""
     EMAIL_FROM: str = "noreply@musbresearch.com"
+    SMTP_POOL_SIZE: int = 2  # Pooled connections (and concurrent sends) per worker
+    SMTP_TIMEOUT_SECONDS: int = 10
+    EMAIL_OUTBOX_POLL_SECONDS: float = 5.0
+    EMAIL_MAX_ATTEMPTS: int = 5
+    EMAIL_RETRY_BASE_SECONDS: int = 30  # Doubles after every failed attempt
+    EMAIL_RETRY_MAX_SECONDS: int = 3600
+
+    # Realtime push (SSE / WebSocket)
+    REALTIME_SOURCE: str = "auto"  # auto, change_stream, poll
+    REALTIME_POLL_SECONDS: float = 2.0  # Poll interval when change streams are unavailable
+    REALTIME_HEARTBEAT_SECONDS: int = 20
+    REALTIME_QUEUE_SIZE: int = 100  # Undelivered events per connection before it is told to resync
 
     class Config:
         env_file = ".env"
@@ -1,4 +1,7 @@
+import asyncio
+from typing import Optional
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel
 from app.config import get_settings
 
 settings = get_settings()
@@ -9,23 +12,95 @@ db = None
 
 from app.utils.logger import logger
 
+# ─── Index Registry ───────────────────────────────────────────────────────────
+# Routers declare the indexes their queries rely on (and a canonical example
+# of each hot query) at import time; startup creates them in one pass.
+
+_index_registry: dict[str, list[IndexModel]] = {}
+_query_shapes: list[dict] = []
+
+
+def register_indexes(collection: str, *indexes: IndexModel) -> None:
+    """Declare indexes that must exist on a collection."""
+    _index_registry.setdefault(collection, []).extend(indexes)
+
+
+def register_query_shape(
+    collection: str,
+    filter: dict,
+    sort: Optional[list] = None,
+    name: Optional[str] = None,
+) -> None:
+    """Declare a canonical query whose plan must be served by an index."""
+    _query_shapes.append({
+        "collection": collection,
+        "filter": filter,
+        "sort": sort,
+        "name": name or f"{collection}:{','.join(filter.keys())}",
+    })
+
+
+async def _create_collection_indexes(collection: str, indexes: list[IndexModel]) -> None:
+    try:
+        await db[collection].create_indexes(indexes)
+    except Exception as e:
+        logger.error(f"Failed to initialize indexes on '{collection}': {str(e)}")
+
+
 async def initialize_indexes():
-    """Ensure unique indexes to prevent data conflicts between modules."""
+    """Create every registered index, one collection per concurrent task."""
     global db
     if db is None:
         return
-    
-    try:
-        # User uniqueness (Shared collection)
-        await db["users"].create_index("email", unique=True)
-        # Study slug uniqueness (Shared collection)
-        await db["studies"].create_index("slug", unique=True)
-        # Device fingerprinting uniqueness (Optional but good)
-        await db["users"].create_index("deviceFingerprint", sparse=True)
-        
-        logger.info("Database indexes initialized successfully.")
-    except Exception as e:
-        logger.error(f"Failed to initialize indexes: {str(e)}")
+
+    await asyncio.gather(*(
+        _create_collection_indexes(collection, indexes)
+        for collection, indexes in _index_registry.items()
+    ))
+    logger.info(
+        f"Database indexes initialized for {len(_index_registry)} collections."
+    )
+
+
+def _plan_stages(plan) -> list[str]:
+    """Collect every `stage` name from a (possibly nested) explain plan."""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+async def verify_query_plans() -> list[str]:
+    """
+    Explain every registered query shape and return the names of those whose
+    winning plan contains a COLLSCAN. Raises RuntimeError if any are found.
+    """
+    if db is None:
+        raise RuntimeError("Database is not connected.")
+
+    async def _explain(shape: dict) -> Optional[str]:
+        cursor = db[shape["collection"]].find(shape["filter"])
+        if shape["sort"]:
+            cursor = cursor.sort(shape["sort"])
+        plan = await cursor.limit(1).explain()
+        winning = plan.get("queryPlanner", {}).get("winningPlan", {})
+        if "COLLSCAN" in _plan_stages(winning):
+            return shape["name"]
+        return None
+
+    results = await asyncio.gather(*(_explain(shape) for shape in _query_shapes))
+    offenders = [name for name in results if name]
+    if offenders:
+        raise RuntimeError(f"Queries resolved by COLLSCAN: {', '.join(offenders)}")
+    logger.info(f"Verified {len(_query_shapes)} query plans: no collection scans.")
+    return offenders
+
 
 async def connect_db():
     """Create database connection on startup."""
@@ -40,6 +115,8 @@ async def connect_db():
     db = client[settings.DATABASE_NAME]
     logger.info(f"Connected to MongoDB: {settings.DATABASE_NAME} (Shared Cluster)")
     await initialize_indexes()
+    if settings.VERIFY_QUERY_PLANS:
+        await verify_query_plans()
 
 
 async def close_db():
@@ -302,6 +302,16 @@ class MessageOut(BaseModel):
         json_encoders = {ObjectId: str}
 
 
+class ConversationOut(BaseModel):
+    id: str
+    participantIds: list[str]
+    otherUserId: Optional[str] = None
+    lastMessage: Optional[str] = None  # Preview of the latest message
+    lastSenderId: Optional[str] = None
+    lastMessageAt: datetime
+    unreadCount: int = 0
+
+
 class ContactMessageCreate(BaseModel):
     firstName: str
     lastName: str
@@ -1,12 +1,17 @@
 from datetime import datetime, timezone
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException
-from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from app.database import get_db
 from app.auth import require_admin, require_coordinator_or_admin
 from app.utils.security import decrypt_data
+from app.utils.pagination import paginate, set_next_cursor
+from app.utils.studies import resolve_study, invalidate_study
+from app.utils.stats import get_counts, admin_dashboard_stats, recruitment_funnel
+from app.utils.study_counters import reconcile_study_counters
+from app.utils.conversations import reconcile_conversations
+from app.utils.compliance import reconcile_compliance
 
 router = APIRouter(prefix="/api/admin", tags=["Admin Dashboard"])
 
@@ -18,29 +23,7 @@ async def get_dashboard_stats(
     """
     Get aggregated statistics for the coordinator console.
     """
-    total_leads = await db["participants"].count_documents({})
-    screened = await db["participants"].count_documents({"status": "SCREENED"})
-    consented = await db["participants"].count_documents({"status": "CONSENTED"})
-    enrolled = await db["participants"].count_documents({"status": "ENROLLED"})
-    active = await db["participants"].count_documents({"status": "ACTIVE"})
-    
-    # Calculate global compliance
-    completed = await db["taskInstances"].count_documents({"status": "COMPLETED"})
-    total_tasks = await db["taskInstances"].count_documents({})
-    compliance_rate = round((completed / max(total_tasks, 1)) * 100, 1) if total_tasks > 0 else 0
-    
-    # Get open adverse events
-    open_aes = await db["adverseEvents"].count_documents({"status": {"$ne": "Resolved"}})
-    
-    return {
-        "totalLeads": total_leads,
-        "screened": screened,
-        "consented": consented,
-        "enrolled": enrolled,
-        "activeParticipants": active + enrolled,
-        "openAEs": open_aes,
-        "complianceRate": compliance_rate
-    }
+    return admin_dashboard_stats(await get_counts(db))
 
 @router.get("/recruitment-funnel")
 async def get_recruitment_funnel(
@@ -50,11 +33,10 @@ async def get_recruitment_funnel(
     """
     Get data for the recruitment funnel chart.
     """
-    leads = await db["participants"].count_documents({})
-    screened = await db["participants"].count_documents({"status": {"$in": ["SCREENED", "CONSENTED", "ENROLLED", "ACTIVE", "COMPLETED"]}})
-    consented = await db["participants"].count_documents({"status": {"$in": ["CONSENTED", "ENROLLED", "ACTIVE", "COMPLETED"]}})
-    enrolled = await db["participants"].count_documents({"status": {"$in": ["ENROLLED", "ACTIVE", "COMPLETED"]}})
-    
+    funnel = recruitment_funnel(await get_counts(db))
+    leads, screened = funnel["leads"], funnel["screened"]
+    consented, enrolled = funnel["consented"], funnel["enrolled"]
+
     return [
         {"label": "Started Inquiry", "value": leads, "color": "bg-cyan-500", "width": "100%"},
         {"label": "Completed Screener", "value": screened, "color": "bg-cyan-600", "width": f"{int((screened/max(leads,1))*100)}%"},
@@ -64,27 +46,32 @@ async def get_recruitment_funnel(
 
 @router.get("/users")
 async def list_users(
+    response: Response,
     role: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     current_user=Depends(require_coordinator_or_admin),
     db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """
-    Get a list of all users for team management.
+    Get a list of all users for team management, newest first, paged by `cursor`.
     """
     query = {}
     if role:
         query["role"] = role
 
-    users = []
-    async for u in db["users"].find(query).sort("createdAt", -1).limit(100):
-        users.append({
+    docs, next_cursor = await paginate(db["users"], query, "createdAt", limit=limit, cursor=cursor)
+    set_next_cursor(response, next_cursor)
+    return [
+        {
             "id": str(u["_id"]),
             "name": decrypt_data(u.get("name")),
             "email": u["email"],
             "role": u.get("role", "PARTICIPANT"),
             "createdAt": u["createdAt"]
-        })
-    return users
+        }
+        for u in docs
+    ]
 
 @router.post("/studies/{study_id}/approve")
 async def approve_study(
@@ -96,13 +83,7 @@ async def approve_study(
     Approve a study that is currently UNDER_REVIEW.
     Sets status to ACTIVE.
     """
-    # Search by ID or Slug
-    study = None
-    try:
-        study = await db["studies"].find_one({"_id": ObjectId(study_id)})
-    except Exception:
-        study = await db["studies"].find_one({"slug": study_id})
-
+    study = await resolve_study(db, study_id, fields=("status",))
     if not study:
         raise HTTPException(status_code=404, detail="Study not found")
 
@@ -115,10 +96,50 @@ async def approve_study(
             "approvedBy": current_user.user_id
         }}
     )
+    invalidate_study(study["_id"], study.get("slug"))
     
     return {"status": "success", "message": "Study approved and is now ACTIVE"}
 
 
+@router.post("/studies/reconcile-counters")
+async def reconcile_counters(
+    current_user=Depends(require_admin),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """
+    Rebuild every study's materialized participant counters from the
+    participants collection (repairs drift from legacy or out-of-band writes).
+    """
+    updated = await reconcile_study_counters(db)
+    return {"status": "success", "studiesUpdated": updated}
+
+
+@router.post("/messages/reconcile-conversations")
+async def reconcile_message_threads(
+    current_user=Depends(require_admin),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """
+    Rebuild every conversation (preview and unread counters) from the messages
+    collection, threading messages sent before conversations existed.
+    """
+    updated = await reconcile_conversations(db)
+    return {"status": "success", "conversationsUpdated": updated}
+
+
+@router.post("/participants/reconcile-compliance")
+async def reconcile_participant_compliance(
+    current_user=Depends(require_admin),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """
+    Rebuild every participant's task compliance counters and stored score
+    from the taskInstances collection.
+    """
+    updated = await reconcile_compliance(db)
+    return {"status": "success", "participantsUpdated": updated}
+
+
 # ─── Admin: Invite Staff ──────────────────────────────────────────────────────
 
 from pydantic import BaseModel
@@ -144,7 +165,7 @@ async def invite_staff(
     import secrets
     temp_password = secrets.token_urlsafe(12)
     # Use bcrypt (same as the login verify_password) so the invited user can actually log in
-    hashed = _hash_pw(temp_password)
+    hashed = await _hash_pw(temp_password)
 
     now = datetime.now(timezone.utc)
     doc = {
@@ -1,19 +1,32 @@
 from datetime import datetime, timezone
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
 import logging
 
-from app.database import get_db
+from app.database import get_db, register_indexes, register_query_shape
 from app.models import AdverseEventCreate, AdverseEventOut
 from app.auth import get_current_user, require_admin
 from app.utils.security import encrypt_data, decrypt_data
 from app.utils.email import send_email_notification
+from app.utils.participants import get_current_participant
+from app.utils.studies import STUDY_SUMMARY_FIELDS, resolve_study
+from app.utils.pagination import paginate, set_next_cursor
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/adverse-events", tags=["Safety / Adverse Events"])
 
+register_indexes(
+    "adverseEvents",
+    IndexModel([("reportedAt", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("participantId", ASCENDING), ("reportedAt", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("status", ASCENDING)]),
+)
+register_query_shape("adverseEvents", {}, [("reportedAt", -1), ("_id", -1)], name="adverseEvents:recent")
+register_query_shape("adverseEvents", {"participantId": ""}, [("reportedAt", -1), ("_id", -1)])
+
 
 def _map_ae(doc: dict) -> AdverseEventOut:
     return AdverseEventOut(
@@ -33,14 +46,11 @@ def _map_ae(doc: dict) -> AdverseEventOut:
 @router.post("/", response_model=AdverseEventOut, status_code=status.HTTP_201_CREATED)
 async def report_ae(
     body: AdverseEventCreate,
+    participant: dict = Depends(get_current_participant),
     current_user=Depends(get_current_user),
     db=Depends(get_db)
 ):
     """Participant: report an adverse event or symptom."""
-    participant = await db["participants"].find_one({"userId": current_user.user_id})
-    if not participant:
-        raise HTTPException(status_code=404, detail="Participant profile not found")
-
     now = datetime.now(timezone.utc)
     doc = {
         "participantId": str(participant["_id"]),
@@ -62,12 +72,7 @@ async def report_ae(
             # Get study info and coordinator
             study_id = participant.get("studyId")
             if study_id:
-                # Try to find study by ID or slug
-                if ObjectId.is_valid(study_id):
-                    study = await db["studies"].find_one({"_id": ObjectId(study_id)})
-                else:
-                    study = await db["studies"].find_one({"slug": study_id})
-
+                study = await resolve_study(db, study_id, fields=STUDY_SUMMARY_FIELDS)
                 if study:
                     coordinator_id = study.get("coordinatorId")
                     if coordinator_id and ObjectId.is_valid(coordinator_id):
@@ -110,46 +115,56 @@ async def report_ae(
 
 # ─── Admin: List All AEs ─────────────────────────────────────────────────────
 
+async def _page_aes(db, response: Response, limit: int, cursor: Optional[str]) -> List[AdverseEventOut]:
+    docs, next_cursor = await paginate(db["adverseEvents"], {}, "reportedAt", limit=limit, cursor=cursor)
+    set_next_cursor(response, next_cursor)
+    return [_map_ae(doc) for doc in docs]
+
+
 @router.get("/", response_model=List[AdverseEventOut])
 async def list_aes(
+    response: Response,
+    limit: int = Query(200, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     current_user=Depends(require_admin),
     db=Depends(get_db)
 ):
-    """Admin: view all adverse events across the platform."""
-    result = []
-    async for doc in db["adverseEvents"].find().sort("reportedAt", -1).limit(200):
-        result.append(_map_ae(doc))
-    return result
+    """Admin: view all adverse events across the platform, paged by `cursor`."""
+    return await _page_aes(db, response, limit, cursor)
 
 
 # ─── Admin: List All AEs (alias) ─────────────────────────────────────────────
 
 @router.get("/all", response_model=List[AdverseEventOut])
 async def list_all_aes(
+    response: Response,
+    limit: int = Query(200, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     current_user=Depends(require_admin),
     db=Depends(get_db)
 ):
     """Admin: alias endpoint for /all path used by the frontend."""
-    result = []
-    async for doc in db["adverseEvents"].find().sort("reportedAt", -1).limit(200):
-        result.append(_map_ae(doc))
-    return result
+    return await _page_aes(db, response, limit, cursor)
 
 
 
 # ─── Participant: My AEs ──────────────────────────────────────────────────────
 
 @router.get("/me", response_model=List[AdverseEventOut])
-async def my_aes(current_user=Depends(get_current_user), db=Depends(get_db)):
-    """Participant: view own reported AEs."""
-    participant = await db["participants"].find_one({"userId": current_user.user_id})
-    if not participant:
-        raise HTTPException(status_code=404, detail="Participant profile not found")
-
-    result = []
-    async for doc in db["adverseEvents"].find({"participantId": str(participant["_id"])}).sort("reportedAt", -1):
-        result.append(_map_ae(doc))
-    return result
+async def my_aes(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
+    participant: dict = Depends(get_current_participant),
+    current_user=Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """Participant: view own reported AEs, paged by `cursor`."""
+    docs, next_cursor = await paginate(
+        db["adverseEvents"], {"participantId": str(participant["_id"])}, "reportedAt", limit=limit, cursor=cursor,
+    )
+    set_next_cursor(response, next_cursor)
+    return [_map_ae(doc) for doc in docs]
 
 
 # ─── Admin: Update AE Status ─────────────────────────────────────────────────
@@ -1,17 +1,26 @@
 from datetime import datetime, timezone
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
-from app.database import get_db
+from app.database import get_db, register_indexes, register_query_shape
 from app.models import (
     AssessmentCreate, AssessmentOut, 
     FormResponseCreate, FormResponseOut
 )
 from app.auth import get_current_user, require_admin
+from app.utils.participants import resolve_participant
+from app.utils.pagination import paginate, set_next_cursor
 
 router = APIRouter(prefix="/api/assessments", tags=["Assessments"])
 
+register_indexes(
+    "form_responses",
+    IndexModel([("participantId", ASCENDING), ("submittedAt", DESCENDING), ("_id", DESCENDING)]),
+)
+register_query_shape("form_responses", {"participantId": ""}, [("submittedAt", -1), ("_id", -1)])
+
 def _map_assessment(doc: dict) -> AssessmentOut:
     return AssessmentOut(
         id=str(doc["_id"]),
@@ -63,7 +72,7 @@ async def submit_response(
     db=Depends(get_db)
 ):
     """Participant: Submit answers for an assessment."""
-    participant = await db["participants"].find_one({"userId": current_user.user_id})
+    participant = await resolve_participant(db, current_user.user_id)
     if not participant:
          raise HTTPException(status_code=403, detail="Not a trial participant")
 
@@ -78,10 +87,13 @@ async def submit_response(
 @router.get("/responses/{participant_id}", response_model=List[FormResponseOut])
 async def get_participant_responses(
     participant_id: str,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     current_user=Depends(get_current_user),
     db=Depends(get_db)
 ):
-    """Get all submissions for a specific participant (Admin or the participant themselves)."""
+    """Get a participant's submissions, newest first, paged by `cursor` (Admin or the participant themselves)."""
     if not ObjectId.is_valid(participant_id):
         raise HTTPException(status_code=400, detail="Invalid participant ID")
     participant = await db["participants"].find_one({"_id": ObjectId(participant_id)})
@@ -91,8 +103,11 @@ async def get_participant_responses(
     if current_user.role != "ADMIN" and participant["userId"] != current_user.user_id:
         raise HTTPException(status_code=403, detail="Forbidden")
 
-    cursor = db["form_responses"].find({"participantId": participant_id}).sort("submittedAt", -1)
-    return [_map_response(doc) async for doc in cursor]
+    docs, next_cursor = await paginate(
+        db["form_responses"], {"participantId": participant_id}, "submittedAt", limit=limit, cursor=cursor,
+    )
+    set_next_cursor(response, next_cursor)
+    return [_map_response(doc) for doc in docs]
 
 # --- Single Assessment (must be LAST to avoid capturing 'responses' as an ID) ---
 
@@ -1,13 +1,26 @@
 from datetime import datetime, timezone
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Request # type: ignore
-from app.database import get_db # type: ignore
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response # type: ignore
+from pymongo import ASCENDING, DESCENDING, IndexModel # type: ignore
+from app.database import get_db, register_indexes, register_query_shape # type: ignore
 from app.auth import get_current_user # type: ignore
 from app.models import AuditLogCreate, AuditLogOut, UserRole # type: ignore
-from app.utils.security import encrypt_data, decrypt_data # type: ignore
+from app.utils.security import decrypt_data # type: ignore
+from app.utils.audit_writer import audit_writer # type: ignore
+from app.utils.pagination import paginate, set_next_cursor # type: ignore
 
 router = APIRouter(prefix="/api/audit", tags=["HIPAA Audit Logs"])
 
+register_indexes(
+    "audit_logs",
+    IndexModel([("timestamp", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("userId", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("action", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)]),
+)
+register_query_shape("audit_logs", {}, [("timestamp", -1), ("_id", -1)], name="audit_logs:recent")
+register_query_shape("audit_logs", {"userId": ""}, [("timestamp", -1), ("_id", -1)])
+register_query_shape("audit_logs", {"action": ""}, [("timestamp", -1), ("_id", -1)])
+
 # ---------------------------------------------------------------------------
 # Helper: Write Audit Log (Internal Use)
 # ---------------------------------------------------------------------------
@@ -19,9 +32,12 @@ async def log_audit_event(
     resource: str,
     details: Optional[str] = None,
     request: Optional[Request] = None,
+    durable: bool = False,
 ):
     """
     Core function to record sensitive actions for HIPAA compliance.
+    Entries are buffered and batch-written; pass `durable=True` for actions
+    that must be on disk before the response is sent.
     """
     ip_address = (request.client.host if request and request.client else "unknown")
     user_agent = request.headers.get("user-agent") if request else "unknown"
@@ -30,13 +46,13 @@ async def log_audit_event(
         "userId": user_id,
         "action": action,
         "resource": resource,
-        "details": encrypt_data(str(details)) if details is not None else None,
+        "details": details,
         "ipAddress": ip_address,
         "userAgent": user_agent,
         "timestamp": datetime.now(timezone.utc),
     }
 
-    await db["audit_logs"].insert_one(log_entry)
+    await audit_writer.write(db, log_entry, durable=durable)
 
 
 # ---------------------------------------------------------------------------
@@ -45,9 +61,11 @@ async def log_audit_event(
 
 @router.get("/", response_model=List[AuditLogOut])
 async def get_audit_logs(
+    response: Response,
     limit: int = 100,
     action: Optional[str] = None,
     user_id: Optional[str] = None,
+    cursor: Optional[str] = None,
     current_user=Depends(get_current_user),
     db=Depends(get_db),
 ):
@@ -67,9 +85,10 @@ async def get_audit_logs(
     if user_id:
         query["userId"] = user_id
 
+    docs, next_cursor = await paginate(db["audit_logs"], query, "timestamp", limit=limit, cursor=cursor)
+    set_next_cursor(response, next_cursor)
     logs = []
-    cursor = db["audit_logs"].find(query).sort("timestamp", -1).limit(limit)
-    async for doc in cursor:
+    for doc in docs:
         logs.append(AuditLogOut(
             id=str(doc["_id"]),
             userId=doc["userId"],
@@ -5,12 +5,14 @@ from pydantic import BaseModel
 from typing import Optional
 from app.utils.rate_limit import rate_limit_check
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
-from app.database import get_db
+from app.database import get_db, register_indexes, register_query_shape
 from app.models import UserCreate, UserOut, Token, VerificationRequest, VerificationCheck, UpdatePassword, PasswordResetRequest
 from app.auth import (
     verify_password,
     get_password_hash,
+    password_needs_rehash,
     create_access_token,
     get_current_user,
     get_modules_for_role,
@@ -18,11 +20,22 @@ from app.auth import (
 from app.config import get_settings
 from app.routes.audit import log_audit_event
 from app.utils.security import encrypt_data, decrypt_data
+from app.utils.compliance import initial_compliance
 from app.utils.otp import generate_otp, verify_otp
 from app.utils.email import send_email_notification
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
+register_indexes(
+    "users",
+    IndexModel([("email", ASCENDING)], unique=True),
+    IndexModel([("deviceFingerprint", ASCENDING)], sparse=True),
+    IndexModel([("role", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("createdAt", DESCENDING), ("_id", DESCENDING)]),
+)
+register_query_shape("users", {"email": ""})
+register_query_shape("users", {"deviceFingerprint": ""})
+
 
 @router.post("/register", response_model=UserOut, status_code=status.HTTP_201_CREATED)
 async def register(request: Request, user_in: UserCreate, db=Depends(get_db)):
@@ -68,7 +81,7 @@ async def register(request: Request, user_in: UserCreate, db=Depends(get_db)):
     user_doc = {
         "name": encrypt_data(user_in.name),
         "email": user_in.email,
-        "passwordHash": get_password_hash(user_in.password),
+        "passwordHash": await get_password_hash(user_in.password),
         "role": "PARTICIPANT",
         "deviceFingerprint": user_in.deviceFingerprint,
         "createdAt": now,
@@ -84,6 +97,7 @@ async def register(request: Request, user_in: UserCreate, db=Depends(get_db)):
         "timezone": "UTC",
         "createdAt": now,
         "updatedAt": now,
+        **initial_compliance(),
     })
 
     # HIPAA Audit: Log successful registration
@@ -111,13 +125,20 @@ async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends
     await rate_limit_check(request, "/api/auth/login")
 
     user = await db["users"].find_one({"email": form_data.username})
-    if not user or not verify_password(form_data.password, user.get("passwordHash", "")):
+    if not user or not await verify_password(form_data.password, user.get("passwordHash", "")):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    # Transparently upgrade hashes made with a different BCRYPT_ROUNDS
+    if password_needs_rehash(user["passwordHash"]):
+        await db["users"].update_one(
+            {"_id": user["_id"], "passwordHash": user["passwordHash"]},
+            {"$set": {"passwordHash": await get_password_hash(form_data.password)}},
+        )
+
     token = create_access_token(data={
         "sub": str(user["_id"]),
         "email": user["email"],
@@ -203,6 +224,7 @@ async def google_upsert(request: Request, body: GoogleUpsertRequest, db=Depends(
             "timezone": "UTC",
             "createdAt": now,
             "updatedAt": now,
+            **initial_compliance(),
         })
     else:
         # Update Google metadata on repeat logins
@@ -274,7 +296,7 @@ async def send_verification(request: Request, body: VerificationRequest, db=Depe
                 detail="No account found with that email address."
             )
 
-    otp = generate_otp(body.identifier, body.purpose)
+    otp = await generate_otp(body.identifier, body.purpose)
     
     channel = "Phone" if body.type == "PHONE" else "Email"
     if channel == "Email":
@@ -301,7 +323,7 @@ async def check_verification(request: Request, body: VerificationCheck, db=Depen
     # Rate limiting: max 10 OTP checks per 15 minutes (allow some failed attempts)
     await rate_limit_check(request, "/api/auth/verify/check")
 
-    is_valid = verify_otp(body.identifier, body.code, body.purpose)
+    is_valid = await verify_otp(body.identifier, body.code, body.purpose)
 
     if not is_valid:
         raise HTTPException(status_code=400, detail="Invalid or expired verification code.")
@@ -364,7 +386,7 @@ async def update_password(
         )
 
     # Verify Current Password
-    if not verify_password(body.currentPassword, user["passwordHash"]):
+    if not await verify_password(body.currentPassword, user["passwordHash"]):
          raise HTTPException(
              status_code=status.HTTP_401_UNAUTHORIZED, 
              detail="Current password incorrect."
@@ -372,14 +394,14 @@ async def update_password(
 
     # Optional OTP Verification for high-security action
     if body.code:
-        if not verify_otp(user["email"], body.code, "LOGIN"):
+        if not await verify_otp(user["email"], body.code, "LOGIN"):
              raise HTTPException(
                  status_code=status.HTTP_400_BAD_REQUEST, 
                  detail="Invalid or expired verification code."
              )
 
     # Update Password
-    new_hash = get_password_hash(body.newPassword)
+    new_hash = await get_password_hash(body.newPassword)
     await db["users"].update_one(
         {"_id": user["_id"]},
         {"$set": {
@@ -406,7 +428,7 @@ async def update_password(
 async def reset_password(request: Request, body: PasswordResetRequest, db=Depends(get_db)):
     """Reset a forgotten password using an OTP sent to email."""
     # 1. Verify the OTP
-    is_valid = verify_otp(body.email, body.code, "RESET")
+    is_valid = await verify_otp(body.email, body.code, "RESET")
     if not is_valid:
         raise HTTPException(status_code=400, detail="Invalid or expired verification code.")
         
@@ -423,7 +445,7 @@ async def reset_password(request: Request, body: PasswordResetRequest, db=Depend
         )
         
     # 3. Hash new password and update
-    new_hash = get_password_hash(body.newPassword)
+    new_hash = await get_password_hash(body.newPassword)
     now = datetime.now(timezone.utc)
     
     await db["users"].update_one(
@@ -1,16 +1,52 @@
-from datetime import datetime, timezone
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from bson import ObjectId
-from pydantic import BaseModel
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pydantic import BaseModel, ValidationError
 from typing import Any
 
-from app.database import get_db
-from app.auth import get_current_user, require_admin
-from app.utils.security import encrypt_data, decrypt_data
+from app.config import get_settings
+from app.database import get_db, register_indexes, register_query_shape
+from app.auth import get_current_user, require_admin, require_coordinator_or_admin
+from app.utils.security import encrypt_data, encrypt_bulk, decrypt_fields
+from app.utils.loaders import RequestLoaders, get_loaders
+from app.utils.participants import get_current_participant
+from app.utils.pagination import paginate, set_next_cursor
+from app.utils.log_rollups import ROLLUPS, bucket_start, map_buckets, rebuild_rollups, record_rollups
+from app.utils.studies import resolve_study
+from app.utils.study_counters import ENROLLED_STATUSES
+from app.utils.vitals_analytics import cohort_summary, mark_logs_updated, participant_analytics
 import json
 
 router = APIRouter(prefix="/api/logs", tags=["Data Logs"])
+settings = get_settings()
+
+register_indexes(
+    "dataLogs",
+    IndexModel([("participantId", ASCENDING), ("loggedAt", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("participantId", ASCENDING), ("type", ASCENDING), ("loggedAt", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("type", ASCENDING), ("loggedAt", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("loggedAt", DESCENDING), ("_id", DESCENDING)]),
+)
+register_query_shape("dataLogs", {"participantId": ""}, [("loggedAt", -1), ("_id", -1)])
+register_query_shape("dataLogs", {"participantId": "", "type": "VITALS"}, [("loggedAt", -1), ("_id", -1)])
+register_query_shape("dataLogs", {}, [("loggedAt", -1), ("_id", -1)], name="dataLogs:all")
+register_indexes(
+    "dataLogs",
+    # Device re-syncs resend readings: a (deviceId, seq) pair is stored once per participant
+    IndexModel(
+        [("participantId", ASCENDING), ("deviceId", ASCENDING), ("seq", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"deviceId": {"$type": "string"}, "seq": {"$type": "number"}},
+        name="device_seq_unique",
+    ),
+)
+
+ALLOWED_LOG_TYPES = ["SUPPLEMENT", "VITALS", "SYMPTOM", "SURVEY", "MOOD", "SLEEP"]
+DUPLICATE_KEY = 11000
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonlines")
 
 
 # ─── Models ───────────────────────────────────────────────────────────────────
@@ -20,6 +56,8 @@ class LogCreate(BaseModel):
     data: dict[str, Any]         # Flexible payload: dose, bp, hr, etc.
     notes: Optional[str] = None
     loggedAt: Optional[datetime] = None
+    deviceId: Optional[str] = None  # With seq, identifies a device reading for deduplication
+    seq: Optional[int] = None
 
 
 class LogOut(BaseModel):
@@ -33,12 +71,12 @@ class LogOut(BaseModel):
 
 # ─── Helpers ──────────────────────────────────────────────────────────────────
 
-def _map_log(doc: dict) -> LogOut:
+def _map_log(doc: dict, plain: dict) -> LogOut:
     decrypted_data = {}
-    raw_data = doc.get("data", "{}")
+    raw_data = plain["data"] if plain["data"] is not None else "{}"
     if isinstance(raw_data, str):
         try:
-            decrypted_data = json.loads(decrypt_data(raw_data))
+            decrypted_data = json.loads(raw_data)
         except Exception:
             decrypted_data = {}
     else:
@@ -49,72 +87,340 @@ def _map_log(doc: dict) -> LogOut:
         participantId=doc["participantId"],
         type=doc["type"],
         data=decrypted_data,
-        notes=decrypt_data(doc.get("notes")),
+        notes=plain["notes"],
         loggedAt=doc["loggedAt"],
     )
 
 
+async def _map_logs(docs: List[dict]) -> List[LogOut]:
+    """Map a page of logs, decrypting every payload and note in one bulk call."""
+    plain = await decrypt_fields(docs, ("data", "notes"))
+    return [_map_log(doc, fields) for doc, fields in zip(docs, plain)]
+
+
 # ─── Participant: Submit a Log Entry ─────────────────────────────────────────
 
 @router.post("/", response_model=LogOut, status_code=status.HTTP_201_CREATED)
 async def submit_log(
     body: LogCreate,
+    participant: dict = Depends(get_current_participant),
     current_user=Depends(get_current_user),
     db=Depends(get_db),
 ):
     """Participant: submit a supplement dose, vitals reading, or symptom log."""
-    participant = await db["participants"].find_one({"userId": current_user.user_id})
-    if not participant:
-        raise HTTPException(status_code=404, detail="Participant profile not found")
-
-    allowed_types = ["SUPPLEMENT", "VITALS", "SYMPTOM", "SURVEY", "MOOD", "SLEEP"]
-    if body.type not in allowed_types:
-        raise HTTPException(status_code=400, detail=f"Log type must be one of: {allowed_types}")
+    if body.type not in ALLOWED_LOG_TYPES:
+        raise HTTPException(status_code=400, detail=f"Log type must be one of: {ALLOWED_LOG_TYPES}")
 
     now = datetime.now(timezone.utc)
+    payload = json.dumps(body.data)
+    doc = _log_doc(body, str(participant["_id"]), current_user.user_id, now)
+    doc["data"], doc["notes"] = encrypt_data(payload), encrypt_data(body.notes)
+    try:
+        await db["dataLogs"].insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=409, detail="This device reading has already been logged")
+    await record_rollups(db, [(doc, body.data)])
+    await mark_logs_updated(db, doc["participantId"])
+    return _map_log(doc, {"data": payload, "notes": body.notes})
+
+
+# ─── Participant: Batch Ingestion ─────────────────────────────────────────────
+
+def _log_doc(entry: LogCreate, participant_id: str, user_id: str, now: datetime) -> dict:
     doc = {
-        "participantId": str(participant["_id"]),
-        "userId": current_user.user_id,
-        "type": body.type,
-        "data": encrypt_data(json.dumps(body.data)),
-        "notes": encrypt_data(body.notes),
-        "loggedAt": body.loggedAt or now,
+        "participantId": participant_id,
+        "userId": user_id,
+        "type": entry.type,
+        "loggedAt": entry.loggedAt or now,
         "createdAt": now,
     }
-    result = await db["dataLogs"].insert_one(doc)
-    created = await db["dataLogs"].find_one({"_id": result.inserted_id})
-    return _map_log(created)
+    if entry.deviceId is not None and entry.seq is not None:
+        doc["deviceId"], doc["seq"] = entry.deviceId, entry.seq
+    return doc
+
+
+class _Malformed:
+    """Stands in for an NDJSON line that is not valid JSON, so it still gets a result."""
+
+
+async def _batch_items(request: Request) -> AsyncIterator[Any]:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type in NDJSON_TYPES:
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield _parse_line(line)
+        if buffer.strip():
+            yield _parse_line(buffer)
+        return
+
+    try:
+        items = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    for item in items:
+        yield item
+
+
+def _parse_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError:
+        return _Malformed()
+
+
+async def _ingest_chunk(db, chunk: list[tuple[int, Any]], participant_id: str, user_id: str) -> list[dict]:
+    """Validate, encrypt and insert one chunk; returns a result per item."""
+    now = datetime.now(timezone.utc)
+    results: list[dict] = []
+    docs: list[dict] = []
+    doc_indexes: list[int] = []
+    plain_data: list[dict] = []
+    payloads: list[Optional[str]] = []
+    for index, raw in chunk:
+        if isinstance(raw, _Malformed):
+            results.append({"index": index, "status": "INVALID", "error": "Malformed JSON"})
+            continue
+        try:
+            entry = LogCreate.model_validate(raw)
+        except ValidationError as e:
+            err = e.errors()[0]
+            field = ".".join(str(part) for part in err["loc"])
+            results.append({"index": index, "status": "INVALID", "error": f"{field}: {err['msg']}" if field else err["msg"]})
+            continue
+        if entry.type not in ALLOWED_LOG_TYPES:
+            results.append({"index": index, "status": "INVALID", "error": f"Log type must be one of: {ALLOWED_LOG_TYPES}"})
+            continue
+        docs.append(_log_doc(entry, participant_id, user_id, now))
+        doc_indexes.append(index)
+        plain_data.append(entry.data)
+        payloads.extend((json.dumps(entry.data), entry.notes))
+
+    if not docs:
+        return results
+
+    encrypted = await encrypt_bulk(payloads)
+    for i, doc in enumerate(docs):
+        doc["data"], doc["notes"] = encrypted[2 * i], encrypted[2 * i + 1]
+
+    errors: dict[int, dict] = {}
+    try:
+        await db["dataLogs"].insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        errors = {err["index"]: err for err in e.details.get("writeErrors", [])}
+
+    created: list[tuple[dict, dict]] = []
+    for i, (index, doc) in enumerate(zip(doc_indexes, docs)):
+        err = errors.get(i)
+        if err is None:
+            created.append((doc, plain_data[i]))
+            results.append({"index": index, "status": "CREATED", "id": str(doc["_id"])})
+        elif err.get("code") == DUPLICATE_KEY:
+            results.append({"index": index, "status": "DUPLICATE"})
+        else:
+            results.append({"index": index, "status": "FAILED", "error": err.get("errmsg")})
+    await record_rollups(db, created)
+    return results
+
+
+@router.post("/batch")
+async def submit_log_batch(
+    request: Request,
+    participant: dict = Depends(get_current_participant),
+    current_user=Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """
+    Participant/device: submit many log entries at once, as a JSON array or
+    as NDJSON (`Content-Type: application/x-ndjson`, one entry per line,
+    streamed). Entries carrying `deviceId` + `seq` are stored at most once, so
+    a device can safely resend a sync. Returns a result per entry, by index;
+    a batch over LOG_BATCH_MAX_ITEMS is cut off with `truncated: true`.
+    """
+    participant_id = str(participant["_id"])
+    chunk_size = settings.LOG_INGEST_CHUNK_SIZE
+    results: list[dict] = []
+    chunk: list[tuple[int, Any]] = []
+    received = 0
+    truncated = False
+
+    async for item in _batch_items(request):
+        if received >= settings.LOG_BATCH_MAX_ITEMS:
+            truncated = True
+            break
+        chunk.append((received, item))
+        received += 1
+        if len(chunk) >= chunk_size:
+            results.extend(await _ingest_chunk(db, chunk, participant_id, current_user.user_id))
+            chunk = []
+    if chunk:
+        results.extend(await _ingest_chunk(db, chunk, participant_id, current_user.user_id))
+
+    results.sort(key=lambda r: r["index"])
+    counts = {"CREATED": 0, "DUPLICATE": 0, "INVALID": 0, "FAILED": 0}
+    for r in results:
+        counts[r["status"]] += 1
+    if counts["CREATED"]:
+        await mark_logs_updated(db, participant_id)
+    return {
+        "received": received,
+        "created": counts["CREATED"],
+        "duplicates": counts["DUPLICATE"],
+        "invalid": counts["INVALID"],
+        "failed": counts["FAILED"],
+        "truncated": truncated,
+        "results": results,
+    }
 
 
 # ─── Participant: My Logs ─────────────────────────────────────────────────────
 
 @router.get("/me", response_model=List[LogOut])
 async def my_logs(
+    response: Response,
     type: Optional[str] = Query(None, description="Filter by log type"),
     limit: int = Query(50, le=200),
+    cursor: Optional[str] = Query(None, description="Next-page cursor from X-Next-Cursor"),
+    participant: dict = Depends(get_current_participant),
     current_user=Depends(get_current_user),
     db=Depends(get_db),
 ):
     """Participant: retrieve own data logs."""
-    participant = await db["participants"].find_one({"userId": current_user.user_id})
-    if not participant:
-        raise HTTPException(status_code=404, detail="Participant profile not found")
-
     query: dict = {"participantId": str(participant["_id"])}
     if type:
         query["type"] = type
 
-    result = []
-    async for doc in db["dataLogs"].find(query).sort("loggedAt", -1).limit(limit):
-        result.append(_map_log(doc))
-    return result
+    docs, next_cursor = await paginate(db["dataLogs"], query, "loggedAt", limit=limit, cursor=cursor)
+    set_next_cursor(response, next_cursor)
+    return await _map_logs(docs)
+
+
+# ─── Participant: Trends ──────────────────────────────────────────────────────
+
+# Default window per granularity when `start` is omitted
+TREND_WINDOWS = {"hour": timedelta(hours=48), "day": timedelta(days=30), "week": timedelta(weeks=26)}
+
+
+@router.get("/me/trends")
+async def my_trends(
+    type: str = Query("VITALS", description="Log type with rollups (see LOG_ROLLUP_TYPES)"),
+    granularity: str = Query("day", pattern="^(hour|day|week)$"),
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    metric: Optional[str] = Query(None, pattern="^[A-Za-z0-9_]+$", description="Only this metric"),
+    participant: dict = Depends(get_current_participant),
+    current_user=Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """Participant: min/max/mean/count per metric per time bucket, oldest first, read from the rollups."""
+    if type not in settings.LOG_ROLLUP_TYPES:
+        raise HTTPException(status_code=400, detail=f"Trends are available for: {settings.LOG_ROLLUP_TYPES}")
+    end = end or datetime.now(timezone.utc)
+    start = start or end - TREND_WINDOWS[granularity]
+    query = {
+        "participantId": str(participant["_id"]),
+        "type": type,
+        "granularity": granularity,
+        "bucketStart": {"$gte": bucket_start(start, granularity), "$lte": end},
+    }
+    docs = await db[ROLLUPS].find(query, {"bucketStart": 1, "metrics": 1}).sort("bucketStart", 1).to_list(None)
+    return {"type": type, "granularity": granularity, "buckets": await map_buckets(docs, metric)}
+
+
+# ─── Admin: Rebuild Rollups ───────────────────────────────────────────────────
+
+@router.post("/rollups/rebuild")
+async def rebuild_log_rollups(
+    participant_id: Optional[str] = Query(None, description="Only this participant"),
+    current_user=Depends(require_admin),
+    db=Depends(get_db),
+):
+    """
+    Admin: recompute trend rollups from the raw logs (after changing
+    LOG_ROLLUP_TYPES, or to backfill logs stored before rollups existed).
+    """
+    folded = await rebuild_rollups(db, participant_id)
+    return {"status": "success", "logsFolded": folded}
+
+
+# ─── Coordinator: Vitals Analytics ────────────────────────────────────────────
+
+async def _check_study_access(current_user, study_refs: list, loaders: RequestLoaders) -> None:
+    """HIPAA: coordinators only see participants of the studies they are assigned to (by id or slug)."""
+    if current_user.role != "COORDINATOR":
+        return
+    coordinator_user = await loaders.users.load(current_user.user_id)
+    assigned = set((coordinator_user or {}).get("assignedStudies", []))
+    if not assigned.intersection(ref for ref in study_refs if ref):
+        raise HTTPException(status_code=403, detail="Access denied")
+
+
+ANALYTICS_PROJECTION = {"studyId": 1, "enrolledAt": 1, "logsUpdatedAt": 1}
+
+
+@router.get("/analytics/participant/{participant_id}")
+async def participant_vitals_analytics(
+    participant_id: str,
+    current_user=Depends(require_coordinator_or_admin),
+    db=Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
+):
+    """
+    Coordinator/Admin: baseline, change from baseline per timepoint, daily and
+    rolling means, and out-of-range flags for each VITALS/SLEEP/MOOD metric.
+    """
+    if not ObjectId.is_valid(participant_id):
+        raise HTTPException(status_code=400, detail="Invalid participant ID")
+    participant = await db["participants"].find_one({"_id": ObjectId(participant_id)}, ANALYTICS_PROJECTION)
+    if not participant:
+        raise HTTPException(status_code=404, detail="Participant not found")
+    await _check_study_access(current_user, [participant.get("studyId")], loaders)
+    return (await participant_analytics(db, [participant]))[0]
+
+
+@router.get("/analytics/study/{study_id}")
+async def study_vitals_analytics(
+    study_id: str,
+    current_user=Depends(require_coordinator_or_admin),
+    db=Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
+):
+    """
+    Coordinator/Admin: per-participant vitals summaries (without the daily
+    series) for every enrolled participant of a study, plus cohort aggregates.
+    """
+    study = await resolve_study(db, study_id, fields=("slug",))
+    if not study:
+        raise HTTPException(status_code=404, detail="Study not found")
+    refs = list({str(study["_id"]), study.get("slug")} - {None})
+    await _check_study_access(current_user, refs, loaders)
+
+    participants = await db["participants"].find(
+        {"studyId": {"$in": refs}, "status": {"$in": list(ENROLLED_STATUSES)}}, ANALYTICS_PROJECTION,
+    ).to_list(None)
+    analytics = await participant_analytics(db, participants)
+    return {
+        "studyId": str(study["_id"]),
+        "participants": [
+            {**a, "metrics": {k: {f: v for f, v in m.items() if f != "daily"} for k, m in a["metrics"].items()}}
+            for a in analytics
+        ],
+        "cohort": cohort_summary(analytics),
+    }
 
 
 # ─── Admin: All Logs (must be before /{participant_id} to avoid route conflict) ─
 @router.get("/all", response_model=List[LogOut])
 async def list_all_logs(
+    response: Response,
     type: Optional[str] = Query(None),
     limit: int = Query(200, le=500),
+    cursor: Optional[str] = Query(None),
     current_user=Depends(require_admin),
     db=Depends(get_db),
 ):
@@ -123,10 +429,9 @@ async def list_all_logs(
     if type:
         query["type"] = type
 
-    result = []
-    async for doc in db["dataLogs"].find(query).sort("loggedAt", -1).limit(limit):
-        result.append(_map_log(doc))
-    return result
+    docs, next_cursor = await paginate(db["dataLogs"], query, "loggedAt", limit=limit, cursor=cursor)
+    set_next_cursor(response, next_cursor)
+    return await _map_logs(docs)
 
 
 # ─── Admin: All Logs for a Participant ───────────────────────────────────────
@@ -134,9 +439,13 @@ async def list_all_logs(
 @router.get("/{participant_id}", response_model=List[LogOut])
 async def participant_logs(
     participant_id: str,
+    response: Response,
     type: Optional[str] = Query(None),
+    limit: int = Query(200, le=500),
+    cursor: Optional[str] = Query(None),
     current_user=Depends(get_current_user),
     db=Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
 ):
     """Admin/Coordinator: view all logs for a specific participant."""
     from bson import ObjectId
@@ -157,8 +466,8 @@ async def participant_logs(
             raise HTTPException(status_code=403, detail="Access denied")
 
         # Check if coordinator is assigned to this study
-        coordinator_user = await db["users"].find_one({"_id": ObjectId(current_user.user_id)})
-        assigned_studies = coordinator_user.get("assignedStudies", [])
+        coordinator_user = await loaders.users.load(current_user.user_id)
+        assigned_studies = (coordinator_user or {}).get("assignedStudies", [])
 
         if study_id not in assigned_studies:
             raise HTTPException(status_code=403, detail="Access denied")
@@ -167,7 +476,6 @@ async def participant_logs(
     if type:
         query["type"] = type
 
-    result = []
-    async for doc in db["dataLogs"].find(query).sort("loggedAt", -1).limit(200):
-        result.append(_map_log(doc))
-    return result
+    docs, next_cursor = await paginate(db["dataLogs"], query, "loggedAt", limit=limit, cursor=cursor)
+    set_next_cursor(response, next_cursor)
+    return await _map_logs(docs)
@@ -1,15 +1,25 @@
 from datetime import datetime, timezone
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
 from pydantic import BaseModel
 
-from app.database import get_db
+from app.database import get_db, register_indexes, register_query_shape
 from app.auth import get_current_user, require_admin
 from app.utils.security import encrypt_data, decrypt_data
+from app.utils.participants import get_current_participant
+from app.utils.pagination import paginate, set_next_cursor
 
 router = APIRouter(prefix="/api/documents", tags=["Documents"])
 
+register_indexes(
+    "documents",
+    IndexModel([("participantId", ASCENDING), ("uploadedAt", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("uploadedAt", DESCENDING), ("_id", DESCENDING)]),
+)
+register_query_shape("documents", {"participantId": ""}, [("uploadedAt", -1), ("_id", -1)])
+
 
 class DocumentOut(BaseModel):
     id: str
@@ -43,23 +53,22 @@ def _map_doc(doc: dict) -> DocumentOut:
 
 @router.get("/me", response_model=List[DocumentOut])
 async def my_documents(
+    response: Response,
     category: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
+    participant: dict = Depends(get_current_participant),
     current_user=Depends(get_current_user),
     db=Depends(get_db),
 ):
-    """Participant: list all documents linked to my profile."""
-    participant = await db["participants"].find_one({"userId": current_user.user_id})
-    if not participant:
-        raise HTTPException(status_code=404, detail="Participant profile not found")
-
+    """Participant: list documents linked to my profile, paged by `cursor`."""
     query: dict = {"participantId": str(participant["_id"])}
     if category:
         query["category"] = category
 
-    result = []
-    async for doc in db["documents"].find(query).sort("uploadedAt", -1):
-        result.append(_map_doc(doc))
-    return result
+    docs, next_cursor = await paginate(db["documents"], query, "uploadedAt", limit=limit, cursor=cursor)
+    set_next_cursor(response, next_cursor)
+    return [_map_doc(doc) for doc in docs]
 
 
 # ─── Admin: Upload / Link a Document ─────────────────────────────────────────
@@ -94,19 +103,21 @@ async def upload_document(
 
 @router.get("/", response_model=List[DocumentOut])
 async def list_all_documents(
+    response: Response,
     participant_id: Optional[str] = Query(None),
+    limit: int = Query(200, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     current_user=Depends(require_admin),
     db=Depends(get_db),
 ):
-    """Admin: list all documents, optionally filtered by participant."""
+    """Admin: list all documents, optionally filtered by participant, paged by `cursor`."""
     query = {}
     if participant_id:
         query["participantId"] = participant_id
 
-    result = []
-    async for doc in db["documents"].find(query).sort("uploadedAt", -1).limit(200):
-        result.append(_map_doc(doc))
-    return result
+    docs, next_cursor = await paginate(db["documents"], query, "uploadedAt", limit=limit, cursor=cursor)
+    set_next_cursor(response, next_cursor)
+    return [_map_doc(doc) for doc in docs]
 
 
 # ─── Delete Document ──────────────────────────────────────────────────────────
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import time
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from jose import jwt
+
+from app.config import get_settings
+from app.auth import decode_token
+from app.utils.realtime import event_bus
+
+router = APIRouter(prefix="/api/events", tags=["Events"])
+settings = get_settings()
+
+# Browsers cannot set headers on EventSource/WebSocket, so both endpoints take the access token as `?token=`
+
+
+def _token_expiry(token: str) -> Optional[float]:
+    # Only called after decode_token has verified the signature
+    exp = jwt.get_unverified_claims(token).get("exp")
+    return float(exp) if exp else None
+
+
+def _expired(expires_at: Optional[float]) -> bool:
+    return expires_at is not None and time.time() >= expires_at
+
+
+# ─── Server-Sent Events ───────────────────────────────────────────────────────
+
+@router.get("/stream")
+async def stream_events(request: Request, token: str = Query(..., description="Access token")):
+    """
+    Push new notifications and messages for the current user as Server-Sent
+    Events. The stream ends when the token expires; reconnect with a fresh one.
+    """
+    current_user = decode_token(token)
+    expires_at = _token_expiry(token)
+
+    async def _events():
+        sub = event_bus.subscribe(current_user.user_id, current_user.role)
+        try:
+            yield "retry: 5000\n\n"
+            while not _expired(expires_at):
+                event = await sub.next(settings.REALTIME_HEARTBEAT_SECONDS)
+                if event is None:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                event_id = f"id: {event['id']}\n" if event.get("id") else ""
+                yield f"{event_id}event: {event['type']}\ndata: {json.dumps(event.get('data', {}))}\n\n"
+        finally:
+            event_bus.unsubscribe(sub)
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ─── WebSocket ────────────────────────────────────────────────────────────────
+
+@router.websocket("/ws")
+async def events_socket(websocket: WebSocket, token: str = Query(...)):
+    """Same feed as /stream over a WebSocket: JSON `{id, type, data}` frames plus periodic pings."""
+    try:
+        current_user = decode_token(token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    expires_at = _token_expiry(token)
+    await websocket.accept()
+    sub = event_bus.subscribe(current_user.user_id, current_user.role)
+
+    async def _send():
+        while not _expired(expires_at):
+            event = await sub.next(settings.REALTIME_HEARTBEAT_SECONDS)
+            await websocket.send_json(event or {"type": "ping"})
+        await websocket.close(code=1008)
+
+    async def _receive():
+        # Client frames are ignored; reading is how a disconnect is noticed
+        while True:
+            await websocket.receive_text()
+
+    sender, receiver = asyncio.create_task(_send()), asyncio.create_task(_receive())
+    try:
+        await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (sender, receiver):
+            task.cancel()
+        for task in (sender, receiver):
+            try:
+                await task
+            except (asyncio.CancelledError, WebSocketDisconnect, RuntimeError):
+                pass
+        event_bus.unsubscribe(sub)
@@ -4,37 +4,66 @@ Endpoint: /api/export/{dataset}
 """
 import csv
 import io
+import json
 from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Sequence
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.responses import StreamingResponse
 
 from app.database import get_db
 from app.auth import require_admin, get_current_user, require_coordinator_or_admin
 from app.models import UserRole
-from app.utils.security import decrypt_data
+from app.utils.security import decrypt_fields
 from app.routes.audit import log_audit_event
 
 router = APIRouter(prefix="/api/export", tags=["Data Export"])
 
 
-def _csv_response(rows: list[dict], filename: str) -> StreamingResponse:
-    """Convert a list of dicts to a streaming CSV download."""
-    if not rows:
-        output = io.StringIO()
-        output.write("No data available\n")
-        output.seek(0)
-        return StreamingResponse(
-            iter([output.getvalue()]),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={filename}"},
-        )
-    output = io.StringIO()
-    writer = csv.DictWriter(output, fieldnames=rows[0].keys())
-    writer.writeheader()
-    writer.writerows(rows)
-    output.seek(0)
+# Rows pulled from the cursor, formatted and flushed to the client per chunk
+EXPORT_BATCH_SIZE = 1000
+
+
+RowFn = Callable[[dict, dict], dict]
+
+
+async def _csv_rows(cursor, encrypted: Sequence[str], row_fn: RowFn) -> AsyncIterator[str]:
+    """
+    Format cursor batches into CSV text chunks as they arrive. The `encrypted`
+    fields of each batch are decrypted in one bulk call and handed to
+    `row_fn(doc, plaintext)`.
+    """
+    buffer = io.StringIO()
+    writer = None
+    batch: list[dict] = []
+
+    async def _flush() -> str:
+        nonlocal writer
+        plain = await decrypt_fields(batch, encrypted)
+        rows = [row_fn(doc, fields) for doc, fields in zip(batch, plain)]
+        batch.clear()
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=rows[0].keys())
+            writer.writeheader()
+        writer.writerows(rows)
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return chunk
+
+    async for doc in cursor.batch_size(EXPORT_BATCH_SIZE):
+        batch.append(doc)
+        if len(batch) >= EXPORT_BATCH_SIZE:
+            yield await _flush()
+    if batch:
+        yield await _flush()
+    if writer is None:
+        yield "No data available\n"
+
+
+def _csv_response(cursor, encrypted: Sequence[str], row_fn: RowFn, filename: str) -> StreamingResponse:
+    """Stream a cursor as a CSV download without materializing the dataset."""
     return StreamingResponse(
-        iter([output.getvalue()]),
+        _csv_rows(cursor, encrypted, row_fn),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename={filename}"},
     )
@@ -42,101 +71,116 @@ def _csv_response(rows: list[dict], filename: str) -> StreamingResponse:
 
 # ── Demographics (DM) ─────────────────────────────────────────────────────────
 
+DM_ENCRYPTED = ("gender", "age", "country")
+
+
+def _dm_row(doc: dict, plain: dict) -> dict:
+    return {
+        "SUBJID": (str(doc["_id"]))[-8:].upper(),
+        "STUDYID": doc.get("studyId", ""),
+        "ARM": doc.get("studyArm", ""),
+        "SEX": plain["gender"] or "",
+        "AGE": plain["age"] or "",
+        "COUNTRY": plain["country"] or "",
+        "ENRLDT": str(doc.get("enrolledAt", "")),
+        "STATUS": doc.get("status", ""),
+    }
+
+
 @router.get("/demographics")
 async def export_demographics(
     current_user=Depends(require_coordinator_or_admin),
     db=Depends(get_db),
 ):
     """CDISC DM: Subject Demographics export."""
-    rows = []
-    async for doc in db["participants"].find({}).limit(5000):
-        rows.append({
-            "SUBJID": (str(doc["_id"]))[-8:].upper(),
-            "STUDYID": doc.get("studyId", ""),
-            "ARM": doc.get("studyArm", ""),
-            "SEX": decrypt_data(doc.get("gender", "")) or "",
-            "AGE": decrypt_data(doc.get("age", "")) or "",
-            "COUNTRY": decrypt_data(doc.get("country", "")) or "",
-            "ENRLDT": str(doc.get("enrolledAt", "")),
-            "STATUS": doc.get("status", ""),
-        })
-    await log_audit_event(db, current_user.user_id, "EXPORT_CSV", "demographics")
-    return _csv_response(rows, "demographics_DM.csv")
+    await log_audit_event(db, current_user.user_id, "EXPORT_CSV", "demographics", durable=True)
+    return _csv_response(db["participants"].find({}), DM_ENCRYPTED, _dm_row, "demographics_DM.csv")
 
 
 # ── ePRO / Assessments (QS) ───────────────────────────────────────────────────
 
+QS_ENCRYPTED = ("response",)
+
+
+def _qs_row(doc: dict, plain: dict) -> dict:
+    return {
+        "SUBJID": doc.get("participantId", ""),
+        "QSTEST": doc.get("type", ""),
+        "QSCAT": doc.get("category", ""),
+        "QSORRES": plain["response"] or "",
+        "QSDTC": str(doc.get("completedAt", doc.get("createdAt", ""))),
+        "STATUS": doc.get("status", ""),
+    }
+
+
 @router.get("/epro")
 async def export_epro(
     current_user=Depends(require_coordinator_or_admin),
     db=Depends(get_db),
 ):
     """CDISC QS: ePRO and Assessment Data export."""
-    rows = []
-    async for doc in db["assessments"].find({}).limit(5000):
-        rows.append({
-            "SUBJID": doc.get("participantId", ""),
-            "QSTEST": doc.get("type", ""),
-            "QSCAT": doc.get("category", ""),
-            "QSORRES": decrypt_data(doc.get("response", "")) or "",
-            "QSDTC": str(doc.get("completedAt", doc.get("createdAt", ""))),
-            "STATUS": doc.get("status", ""),
-        })
-    await log_audit_event(db, current_user.user_id, "EXPORT_CSV", "epro_assessments")
-    return _csv_response(rows, "ePRO_assessment_QS.csv")
+    await log_audit_event(db, current_user.user_id, "EXPORT_CSV", "epro_assessments", durable=True)
+    return _csv_response(db["assessments"].find({}), QS_ENCRYPTED, _qs_row, "ePRO_assessment_QS.csv")
 
 
 # ── Adverse Events (AE) ───────────────────────────────────────────────────────
 
+AE_ENCRYPTED = ("description", "actionTaken")
+
+
+def _ae_row(doc: dict, plain: dict) -> dict:
+    return {
+        "SUBJID": doc.get("participantId", ""),
+        "AETERM": plain["description"] or "",
+        "AESEV": doc.get("severity", ""),
+        "AESTDTC": str(doc.get("onsetDate", "")),
+        "AEENDDTC": str(doc.get("resolvedAt", "")),
+        "AEOUT": doc.get("status", ""),
+        "AEACN": plain["actionTaken"] or "",
+        "AERPTDT": str(doc.get("reportedAt", "")),
+    }
+
+
 @router.get("/adverse-events")
 async def export_adverse_events(
     current_user=Depends(require_coordinator_or_admin),
     db=Depends(get_db),
 ):
     """CDISC AE: Adverse Events safety export."""
-    rows = []
-    async for doc in db["adverseEvents"].find({}).limit(5000):
-        rows.append({
-            "SUBJID": doc.get("participantId", ""),
-            "AETERM": decrypt_data(doc.get("description", "")) or "",
-            "AESEV": doc.get("severity", ""),
-            "AESTDTC": str(doc.get("onsetDate", "")),
-            "AEENDDTC": str(doc.get("resolvedAt", "")),
-            "AEOUT": doc.get("status", ""),
-            "AEACN": decrypt_data(doc.get("actionTaken", "")) or "",
-            "AERPTDT": str(doc.get("reportedAt", "")),
-        })
-    await log_audit_event(db, current_user.user_id, "EXPORT_CSV", "adverse_events")
-    return _csv_response(rows, "adverse_events_AE.csv")
+    await log_audit_event(db, current_user.user_id, "EXPORT_CSV", "adverse_events", durable=True)
+    return _csv_response(db["adverseEvents"].find({}), AE_ENCRYPTED, _ae_row, "adverse_events_AE.csv")
 
 
 # ── Vital Signs & Device Data (VS) ────────────────────────────────────────────
 
+VS_ENCRYPTED = ("data", "notes")
+
+
+def _vs_row(doc: dict, plain: dict) -> dict:
+    raw_data = plain["data"] if plain["data"] is not None else {}
+    if isinstance(raw_data, str):
+        try:
+            raw_data = json.loads(raw_data)
+        except Exception:
+            raw_data = {}
+    return {
+        "SUBJID": doc.get("participantId", ""),
+        "VSTEST": doc.get("type", ""),
+        "VSORRES": json.dumps(raw_data),
+        "VSDTC": str(doc.get("loggedAt", "")),
+        "NOTES": plain["notes"] or "",
+    }
+
+
 @router.get("/vitals")
 async def export_vitals(
     current_user=Depends(require_coordinator_or_admin),
     db=Depends(get_db),
 ):
     """CDISC VS: Vital Signs and device data export."""
-    rows = []
-    async for doc in db["dataLogs"].find({"type": {"$in": ["VITALS", "SUPPLEMENT", "SLEEP", "MOOD"]}}).limit(5000):
-        import json
-        raw_data = doc.get("data", {})
-        if isinstance(raw_data, str):
-            try:
-                from app.utils.security import decrypt_data as _dec
-                raw_data = json.loads(_dec(raw_data))
-            except Exception:
-                raw_data = {}
-        rows.append({
-            "SUBJID": doc.get("participantId", ""),
-            "VSTEST": doc.get("type", ""),
-            "VSORRES": json.dumps(raw_data),
-            "VSDTC": str(doc.get("loggedAt", "")),
-            "NOTES": decrypt_data(doc.get("notes", "")) or "",
-        })
-    await log_audit_event(db, current_user.user_id, "EXPORT_CSV", "vitals_device_data")
-    return _csv_response(rows, "vitals_device_VS.csv")
+    await log_audit_event(db, current_user.user_id, "EXPORT_CSV", "vitals_device_data", durable=True)
+    cursor = db["dataLogs"].find({"type": {"$in": ["VITALS", "SUPPLEMENT", "SLEEP", "MOOD"]}})
+    return _csv_response(cursor, VS_ENCRYPTED, _vs_row, "vitals_device_VS.csv")
 
 
 # ── Stats Summary ─────────────────────────────────────────────────────────────
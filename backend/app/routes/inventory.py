@@ -1,14 +1,23 @@
 from datetime import datetime, timezone
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
 
-from app.database import get_db
+from app.database import get_db, register_indexes, register_query_shape
 from app.models import KitInstanceCreate, KitInstanceOut
 from app.auth import require_admin, require_coordinator_or_admin
+from app.utils.pagination import paginate, set_next_cursor
 
 router = APIRouter(prefix="/api/inventory", tags=["Inventory"])
 
+register_indexes(
+    "inventory",
+    IndexModel([("expirationDate", ASCENDING), ("_id", ASCENDING)]),
+    IndexModel([("status", ASCENDING), ("expirationDate", ASCENDING), ("_id", ASCENDING)]),
+)
+register_query_shape("inventory", {"status": "AVAILABLE"}, [("expirationDate", 1), ("_id", 1)])
+
 def _map_kit(doc: dict) -> KitInstanceOut:
     return KitInstanceOut(
         id=str(doc["_id"]),
@@ -23,8 +32,11 @@ def _map_kit(doc: dict) -> KitInstanceOut:
 
 @router.get("/", response_model=List[KitInstanceOut])
 async def list_kits(
+    response: Response,
     status_val: Optional[str] = Query(None, alias="status"),
     type_val: Optional[str] = Query(None, alias="type"),
+    limit: int = Query(200, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     current_user=Depends(require_coordinator_or_admin),
     db=Depends(get_db)
 ):
@@ -34,11 +46,12 @@ async def list_kits(
     if type_val:
         query["type"] = type_val
 
-    cursor = db["inventory"].find(query).sort("expirationDate", 1).limit(200)
-    kits = []
-    async for doc in cursor:
-        kits.append(_map_kit(doc))
-    return kits
+    # Soonest-expiring first, paged by `cursor` (X-Next-Cursor)
+    docs, next_cursor = await paginate(
+        db["inventory"], query, "expirationDate", limit=limit, cursor=cursor, direction=ASCENDING,
+    )
+    set_next_cursor(response, next_cursor)
+    return [_map_kit(doc) for doc in docs]
 
 @router.post("/", response_model=KitInstanceOut, status_code=status.HTTP_201_CREATED)
 async def create_kit(
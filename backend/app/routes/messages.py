@@ -1,43 +1,144 @@
 from datetime import datetime, timezone
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
-from app.database import get_db
-from app.models import MessageCreate, MessageOut, ContactMessageCreate, ContactMessageOut
+from app.database import get_db, register_indexes, register_query_shape
+from app.models import MessageCreate, MessageOut, ConversationOut, ContactMessageCreate, ContactMessageOut
 from app.auth import get_current_user
-from app.utils.security import encrypt_data, decrypt_data
+from app.utils.security import encrypt_data, decrypt_data, decrypt_bulk
 from app.utils.email import notify_coordinator_new_message
+from app.utils.notifications import create_notification
+from app.utils.pagination import paginate, set_next_cursor
+from app.utils.conversations import (
+    CONVERSATIONS, conversation_id, conversation_members, decrement_unread, record_message, unread_for,
+)
 
 router = APIRouter(prefix="/api/messages", tags=["Messages"])
 
+register_indexes(
+    "messages",
+    IndexModel([("senderId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("receiverId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)]),
+)
+register_indexes("contact_messages", IndexModel([("createdAt", DESCENDING), ("_id", DESCENDING)]))
+register_query_shape(
+    "messages",
+    {"$or": [{"senderId": ""}, {"receiverId": ""}]},
+    [("createdAt", -1), ("_id", -1)],
+    name="messages:inbox",
+)
 
-def _map_msg(doc: dict) -> MessageOut:
+
+def _map_msg(doc: dict, content: str) -> MessageOut:
     return MessageOut(
         id=str(doc["_id"]),
         senderId=doc["senderId"],
         receiverId=doc.get("receiverId"),
-        content=decrypt_data(doc["content"]),
+        content=content,
         read=doc.get("read", False),
         createdAt=doc["createdAt"],
     )
 
 
+async def _map_msgs(docs: List[dict]) -> List[MessageOut]:
+    """Map a page of messages, decrypting every body in one bulk call."""
+    contents = await decrypt_bulk(doc["content"] for doc in docs)
+    return [_map_msg(doc, content) for doc, content in zip(docs, contents)]
+
+
 @router.get("", response_model=List[MessageOut])
-async def get_my_messages(current_user=Depends(get_current_user), db=Depends(get_db)):
-    """Get all messages for the current user (sent and received)."""
+async def get_my_messages(
+    response: Response,
+    limit: int = Query(100, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+    current_user=Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """Get the current user's messages (sent and received), newest first, paged by `cursor`."""
     query = {
         "$or": [
             {"senderId": current_user.user_id},
             {"receiverId": current_user.user_id}
         ]
     }
+    docs, next_cursor = await paginate(db["messages"], query, "createdAt", limit=limit, cursor=cursor)
+    set_next_cursor(response, next_cursor)
+    return await _map_msgs(docs)
+
+
+# ─── Conversations ────────────────────────────────────────────────────────────
+
+@router.get("/conversations", response_model=List[ConversationOut])
+async def list_conversations(
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="Next-page cursor from X-Next-Cursor"),
+    current_user=Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """The current user's threads, most recently active first, with preview and unread count."""
+    uid = current_user.user_id
+    docs, next_cursor = await paginate(
+        db[CONVERSATIONS], {"participants": uid}, "updatedAt", limit=limit, cursor=cursor,
+    )
+    set_next_cursor(response, next_cursor)
+    previews = await decrypt_bulk((doc.get("lastMessage") or {}).get("preview") for doc in docs)
     result = []
-    async for doc in db["messages"].find(query).sort("createdAt", -1).limit(100):
-        result.append(_map_msg(doc))
+    for doc, preview in zip(docs, previews):
+        last = doc.get("lastMessage") or {}
+        others = [p for p in doc["participants"] if p != uid]
+        result.append(ConversationOut(
+            id=doc["_id"],
+            participantIds=doc["participants"],
+            otherUserId=others[0] if others else uid,
+            lastMessage=preview,
+            lastSenderId=last.get("senderId"),
+            lastMessageAt=doc["updatedAt"],
+            unreadCount=unread_for(doc, uid),
+        ))
     return result
 
 
+def _own_conversation(conv_id: str, user_id: str) -> None:
+    if user_id not in conversation_members(conv_id):
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+
+@router.get("/conversations/{conv_id}", response_model=List[MessageOut])
+async def get_conversation(
+    conv_id: str,
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="Next-page cursor from X-Next-Cursor"),
+    current_user=Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """One thread's history, newest first, paged by `cursor`."""
+    _own_conversation(conv_id, current_user.user_id)
+    docs, next_cursor = await paginate(
+        db["messages"], {"conversationId": conv_id}, "createdAt", limit=limit, cursor=cursor,
+    )
+    set_next_cursor(response, next_cursor)
+    return await _map_msgs(docs)
+
+
+@router.patch("/conversations/{conv_id}/read")
+async def mark_conversation_read(
+    conv_id: str,
+    current_user=Depends(get_current_user),
+    db=Depends(get_db),
+):
+    """Mark every message the current user received in a thread as read."""
+    uid = current_user.user_id
+    _own_conversation(conv_id, uid)
+    result = await db["messages"].update_many(
+        {"conversationId": conv_id, "receiverId": uid, "read": False},
+        {"$set": {"read": True}},
+    )
+    await decrement_unread(db, conv_id, uid, result.modified_count)
+    return {"message": "Marked as read", "updated": result.modified_count}
 
 
 @router.post("", response_model=MessageOut)
@@ -59,6 +160,7 @@ async def send_message(
     doc = {
         "senderId": current_user.user_id,
         "receiverId": body.receiverId,
+        "conversationId": conversation_id(current_user.user_id, body.receiverId),
         "studyId": body.studyId,
         "content": encrypt_data(body.content),
         "read": False,
@@ -66,19 +168,18 @@ async def send_message(
     }
     result = await db["messages"].insert_one(doc)
     created = await db["messages"].find_one({"_id": result.inserted_id})
+    await record_message(db, created, body.content)
 
     # ── Real-time Notification Logic ──
     
     # 1. Create In-App Notification Record
-    notification_doc = {
+    await create_notification(db, {
         "userId": body.receiverId,
         "title": f"New message from {current_user.email}",
         "content": body.content[:100],
         "type": "MESSAGE",
-        "status": "UNREAD",
         "createdAt": now
-    }
-    await db["notifications"].insert_one(notification_doc)
+    })
 
     # 2. If receiver is COORDINATOR, send Gmail Remainder (Mocked)
     if receiver.get("role") == "COORDINATOR":
@@ -93,7 +194,7 @@ async def send_message(
             message_excerpt=body.content[:50]
         )
 
-    return _map_msg(created)
+    return (await _map_msgs([created]))[0]
 
 
 @router.patch("/{message_id}/read")
@@ -103,10 +204,16 @@ async def mark_read(
     db=Depends(get_db)
 ):
     """Mark a message as read."""
-    await db["messages"].update_one(
-        {"_id": ObjectId(message_id), "receiverId": current_user.user_id},
-        {"$set": {"read": True}}
+    if not ObjectId.is_valid(message_id):
+        raise HTTPException(status_code=400, detail="Invalid message ID")
+    # Only an unread -> read flip moves the thread's unread counter
+    before = await db["messages"].find_one_and_update(
+        {"_id": ObjectId(message_id), "receiverId": current_user.user_id, "read": False},
+        {"$set": {"read": True}},
+        projection={"conversationId": 1},
     )
+    if before and before.get("conversationId"):
+        await decrement_unread(db, before["conversationId"], current_user.user_id, 1)
     return {"message": "Marked as read"}
 
 
@@ -135,17 +242,23 @@ async def submit_contact_form(
 
 @router.get("/contact", response_model=List[ContactMessageOut])
 async def get_contact_messages(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     current_user=Depends(get_current_user),
     db=Depends(get_db)
 ):
-    """Admin only: Get all contact form submissions."""
+    """Admin only: Get contact form submissions, newest first, paged by `cursor`."""
     if current_user.role not in ["ADMIN", "COORDINATOR"]:
         raise HTTPException(status_code=403, detail="Not authorized")
 
+    docs, next_cursor = await paginate(db["contact_messages"], {}, "createdAt", limit=limit, cursor=cursor)
+    set_next_cursor(response, next_cursor)
+    messages = await decrypt_bulk(doc.get("message", "") for doc in docs)
     result = []
-    async for doc in db["contact_messages"].find().sort("createdAt", -1):
+    for doc, message in zip(docs, messages):
         mapped = {k: v for k, v in doc.items() if k != "_id"}
-        mapped["message"] = decrypt_data(mapped.get("message", ""))
+        mapped["message"] = message
         result.append(ContactMessageOut(
             id=str(doc["_id"]),
             **mapped
@@ -1,13 +1,30 @@
-from datetime import datetime, timezone
-from typing import List, Optional
-from fastapi import APIRouter, Depends
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
-from app.database import get_db
+from app.database import get_db, register_indexes, register_query_shape
 from app.auth import require_coordinator_or_admin
+from app.utils.notifications import (
+    get_inbox, is_read, mark_all_read as mark_all_read_for, mark_read, unread_count, visible_to,
+)
+from app.utils.realtime import notification_payload
 
 router = APIRouter(prefix="/api/notifications", tags=["Notifications"])
 
+register_indexes(
+    "notifications",
+    IndexModel([("userId", ASCENDING), ("createdAt", DESCENDING)]),
+    IndexModel([("userId", ASCENDING), ("status", ASCENDING)]),
+)
+register_query_shape(
+    "notifications",
+    {"userId": {"$in": ["ADMIN", ""]}},
+    [("createdAt", -1)],
+    name="notifications:feed",
+)
+register_query_shape("notifications", {"userId": "", "status": "UNREAD"}, name="notifications:unread")
+
 
 @router.get("/")
 async def get_notifications(
@@ -15,25 +32,24 @@ async def get_notifications(
     db=Depends(get_db)
 ):
     """Get all notifications for admin users (includes ADMIN-targeted and personal)."""
-    query = {
-        "$or": [
-            {"userId": "ADMIN"},         # Broadcast to all admins
-            {"userId": current_user.user_id},  # Personal notifications
-        ]
-    }
+    docs, inbox = await asyncio.gather(
+        db["notifications"].find(visible_to(current_user.user_id)).sort("createdAt", -1).limit(50).to_list(None),
+        get_inbox(db, current_user.user_id),
+    )
+    # Broadcast status is per reader, not the shared document's own field
+    return [
+        {**notification_payload(doc), "status": "READ" if is_read(doc, inbox) else "UNREAD"}
+        for doc in docs
+    ]
 
-    notifications = []
-    async for doc in db["notifications"].find(query).sort("createdAt", -1).limit(50):
-        notifications.append({
-            "id": str(doc["_id"]),
-            "title": doc.get("title", "Notification"),
-            "content": doc.get("content", ""),
-            "type": doc.get("type", "INFO"),
-            "status": doc.get("status", "UNREAD"),
-            "studyId": doc.get("studyId"),
-            "createdAt": doc.get("createdAt", datetime.now(timezone.utc)),
-        })
-    return notifications
+
+@router.get("/unread-count")
+async def get_unread_count(
+    current_user=Depends(require_coordinator_or_admin),
+    db=Depends(get_db)
+):
+    """Unread notifications for the current user (personal and broadcast), for the bell badge."""
+    return {"unread": await unread_count(db, current_user.user_id)}
 
 
 @router.patch("/mark-all-read")
@@ -41,17 +57,8 @@ async def mark_all_read(
     current_user=Depends(require_coordinator_or_admin),
     db=Depends(get_db)
 ):
-    """Mark all admin notifications as read."""
-    await db["notifications"].update_many(
-        {
-            "$or": [
-                {"userId": "ADMIN"},
-                {"userId": current_user.user_id},
-            ],
-            "status": "UNREAD"
-        },
-        {"$set": {"status": "READ"}}
-    )
+    """Mark all of the current user's notifications as read (broadcasts only for this user)."""
+    await mark_all_read_for(db, current_user.user_id)
     return {"message": "All marked as read"}
 
 
@@ -62,8 +69,13 @@ async def mark_notification_read(
     db=Depends(get_db)
 ):
     """Mark a notification as read."""
-    await db["notifications"].update_one(
-        {"_id": ObjectId(notification_id)},
-        {"$set": {"status": "READ"}}
+    if not ObjectId.is_valid(notification_id):
+        raise HTTPException(status_code=400, detail="Invalid notification ID")
+    doc = await db["notifications"].find_one(
+        {"_id": ObjectId(notification_id), **visible_to(current_user.user_id)},
+        {"userId": 1, "status": 1, "createdAt": 1},
     )
+    if not doc:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    await mark_read(db, current_user.user_id, doc)
     return {"message": "Marked as read"}
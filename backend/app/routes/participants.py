@@ -1,40 +1,62 @@
+import asyncio
 from datetime import datetime, timezone
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo import ASCENDING, DESCENDING, IndexModel
 import json
 
-from app.database import get_db
+from app.database import get_db, register_indexes, register_query_shape
 from app.models import ParticipantOut, ScreenerSubmit, ScreenerOut, ConsentSign, ConsentOut
 from app.auth import get_current_user, require_admin, require_coordinator_or_admin
 from app.utils.security import encrypt_data, decrypt_data
 from app.utils.randomization import randomize_participant
+from app.utils.loaders import RequestLoaders, get_loaders
+from app.utils.studies import resolve_study
+from app.utils.participants import get_current_participant, invalidate_participant
+from app.utils.study_counters import ENROLLED_STATUSES, record_status_transition
+from app.utils.schedules import materialize_schedule
+from app.utils.compliance import COMPLIANCE_DEFAULTS, compliance_summary
+from app.utils.eligibility import get_predicate
+from app.utils.pagination import paginate, set_next_cursor
 from app.routes.audit import log_audit_event
 
 router = APIRouter(prefix="/api/participants", tags=["Participants"])
 
-
-async def _map_participant(p: dict, db, user: Optional[dict] = None) -> ParticipantOut:
+register_indexes(
+    "participants",
+    IndexModel([("userId", ASCENDING)]),
+    IndexModel([("studyId", ASCENDING), ("status", ASCENDING)]),
+    IndexModel([("studyId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("status", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("createdAt", DESCENDING), ("_id", DESCENDING)]),
+)
+register_indexes("screenerResponses", IndexModel([("participantId", ASCENDING)]))
+register_indexes("consents", IndexModel([("participantId", ASCENDING)]))
+register_query_shape("participants", {"userId": ""})
+register_query_shape("participants", {"studyId": "", "status": "ENROLLED"})
+register_query_shape("participants", {}, [("createdAt", -1), ("_id", -1)], name="participants:list")
+register_query_shape("participants", {"studyId": ""}, [("createdAt", -1), ("_id", -1)], name="participants:list_by_study")
+register_query_shape("screenerResponses", {"participantId": ""})
+
+
+async def _map_participant(p: dict, loaders: RequestLoaders) -> ParticipantOut:
     study_title = None
     coordinator_id = None
     coordinator_name = None
-    
-    if p.get("studyId"):
-        study_id_str = p["studyId"]
-        study = None
-        if ObjectId.is_valid(study_id_str):
-            study = await db["studies"].find_one({"_id": ObjectId(study_id_str)})
-        if not study:
-            study = await db["studies"].find_one({"slug": study_id_str})
-            
-        if study:
-            study_title = study.get("title")
-            coordinator_id = study.get("coordinatorId")
-            
-            if coordinator_id and ObjectId.is_valid(coordinator_id):
-                coord_user = await db["users"].find_one({"_id": ObjectId(coordinator_id)})
-                if coord_user:
-                    coordinator_name = decrypt_data(coord_user.get("name"))
+
+    user, study = await asyncio.gather(
+        loaders.users.load(p.get("userId")),
+        loaders.studies.load(p.get("studyId")),
+    )
+    if study:
+        study_title = study.get("title")
+        coordinator_id = study.get("coordinatorId")
+
+        coord_user = await loaders.users.load(coordinator_id)
+        if coord_user:
+            coordinator_name = decrypt_data(coord_user.get("name"))
 
     out = ParticipantOut(
         id=str(p["_id"]),
@@ -60,27 +82,79 @@ async def _map_participant(p: dict, db, user: Optional[dict] = None) -> Particip
 
 @router.get("", response_model=List[ParticipantOut])
 async def list_participants(
+    response: Response,
     study_id: Optional[str] = Query(None),
     status: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     current_user=Depends(require_coordinator_or_admin),
-    db=Depends(get_db)
+    db=Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
 ):
-    """Admin: list all participants, optionally filtered."""
+    """Admin: list all participants, optionally filtered, paged by `cursor`."""
     query = {}
     if study_id:
         query["studyId"] = study_id
     if status:
         query["status"] = status
 
-    result = []
-    async for p in db["participants"].find(query).sort("createdAt", -1).limit(100):
-        user_id_str = p.get("userId")
-        user = None
-        if user_id_str and ObjectId.is_valid(user_id_str):
-            user = await db["users"].find_one({"_id": ObjectId(user_id_str)})
-        item = await _map_participant(p, db, user)
-        result.append(item)
-    return result
+    participants, next_cursor = await paginate(db["participants"], query, "createdAt", limit=limit, cursor=cursor)
+    set_next_cursor(response, next_cursor)
+    return await asyncio.gather(*(_map_participant(p, loaders) for p in participants))
+
+
+# ─── Coordinator: Cohort Compliance ──────────────────────────────────────────
+
+COMPLIANCE_PROJECTION = {"userId": 1, "studyId": 1, "status": 1, "armId": 1, "compliance": 1, "complianceScore": 1}
+
+
+@router.get("/compliance/{study_id}")
+async def cohort_compliance(
+    study_id: str,
+    response: Response,
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    max_score: Optional[int] = Query(None, ge=0, le=100),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
+    current_user=Depends(require_coordinator_or_admin),
+    db=Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
+):
+    """
+    Coordinator/Admin: a study's enrolled participants ordered by stored
+    compliance score (least adherent first by default), optionally only those
+    at or below `max_score`. Paged by `cursor` (X-Next-Cursor).
+    """
+    study = await resolve_study(db, study_id, fields=("slug",))
+    if not study:
+        raise HTTPException(status_code=404, detail="Study not found")
+    refs = list({str(study["_id"]), study.get("slug")} - {None})
+
+    # HIPAA: coordinators only see the studies they are assigned to
+    if current_user.role == "COORDINATOR":
+        coordinator_user = await loaders.users.load(current_user.user_id)
+        if not set((coordinator_user or {}).get("assignedStudies", [])).intersection(refs):
+            raise HTTPException(status_code=403, detail="Access denied")
+
+    query: dict = {"studyId": {"$in": refs}, "status": {"$in": list(ENROLLED_STATUSES)}}
+    if max_score is not None:
+        query["complianceScore"] = {"$lte": max_score}
+    participants, next_cursor = await paginate(
+        db["participants"], query, "complianceScore",
+        limit=limit, cursor=cursor, direction=ASCENDING if order == "asc" else DESCENDING,
+        projection=COMPLIANCE_PROJECTION,
+    )
+    set_next_cursor(response, next_cursor)
+    return [
+        {
+            "participantId": str(p["_id"]),
+            "userId": p.get("userId"),
+            "status": p.get("status", "LEAD"),
+            "armId": p.get("armId"),
+            **compliance_summary(p),
+        }
+        for p in participants
+    ]
 
 
 # ─── Admin: Single Participant ────────────────────────────────────────────────
@@ -89,7 +163,8 @@ async def list_participants(
 async def get_participant(
     participant_id: str,
     current_user=Depends(require_coordinator_or_admin),
-    db=Depends(get_db)
+    db=Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
 ):
     if not ObjectId.is_valid(participant_id):
         raise HTTPException(status_code=400, detail="Invalid participant ID")
@@ -105,17 +180,13 @@ async def get_participant(
             raise HTTPException(status_code=403, detail="Access denied")
 
         # Check if coordinator is assigned to this study
-        coordinator_user = await db["users"].find_one({"_id": ObjectId(current_user.user_id)})
-        assigned_studies = coordinator_user.get("assignedStudies", [])
+        coordinator_user = await loaders.users.load(current_user.user_id)
+        assigned_studies = (coordinator_user or {}).get("assignedStudies", [])
 
         if study_id not in assigned_studies:
             raise HTTPException(status_code=403, detail="Access denied")
 
-    user_id_str = p.get("userId")
-    user = None
-    if user_id_str and ObjectId.is_valid(user_id_str):
-        user = await db["users"].find_one({"_id": ObjectId(user_id_str)})
-    return await _map_participant(p, db, user)
+    return await _map_participant(p, loaders)
 
 
 # ─── Admin: Update Status ────────────────────────────────────────────────────
@@ -135,10 +206,15 @@ async def update_participant_status(
     if new_status not in allowed:
         raise HTTPException(status_code=400, detail=f"Invalid status. Allowed: {allowed}")
 
-    await db["participants"].update_one(
+    before = await db["participants"].find_one_and_update(
         {"_id": ObjectId(participant_id)},
-        {"$set": {"status": new_status, "updatedAt": datetime.now(timezone.utc)}}
+        {"$set": {"status": new_status, "updatedAt": datetime.now(timezone.utc)}},
+        projection={"studyId": 1, "status": 1},
+        return_document=ReturnDocument.BEFORE,
     )
+    invalidate_participant(participant_id=participant_id)
+    if before:
+        await record_status_transition(db, before, {**before, "status": new_status})
     return {"message": f"Status updated to {new_status}"}
 
 
@@ -147,19 +223,16 @@ async def update_participant_status(
 @router.post("/screener", response_model=ScreenerOut, status_code=status.HTTP_201_CREATED)
 async def submit_screener(
     body: ScreenerSubmit,
+    participant: dict = Depends(get_current_participant),
     current_user=Depends(get_current_user),
     db=Depends(get_db)
 ):
-    """Participant submits their eligibility screener answers."""
-    participant = await db["participants"].find_one({"userId": current_user.user_id})
-    if not participant:
-        raise HTTPException(status_code=404, detail="No participant profile for this user.")
-
-    responses = body.responses
-    is_eligible = (
-        int(responses.get("age", 0)) >= 18 and
-        responses.get("smoker", "yes") == "no"
-    )
+    """Participant submits their eligibility screener answers, judged against the study's criteria."""
+    study, predicate = await get_predicate(db, body.studyId)
+    if not study:
+        raise HTTPException(status_code=404, detail="Study not found")
+    failed = predicate.failures(body.responses)
+    is_eligible = not failed
 
     responses_str = json.dumps(body.responses)
     
@@ -169,16 +242,21 @@ async def submit_screener(
         "studyId": body.studyId,
         "responses": encrypt_data(responses_str),
         "isEligible": is_eligible,
+        "failedCriteria": failed,
         "completedAt": now,
     }
     result = await db["screenerResponses"].insert_one(screener_doc)
 
     # Update participant status
     new_status = "SCREENED" if is_eligible else "LEAD"
-    await db["participants"].update_one(
+    before = await db["participants"].find_one_and_update(
         {"_id": participant["_id"]},
-        {"$set": {"status": new_status, "studyId": body.studyId, "updatedAt": now}}
+        {"$set": {"status": new_status, "studyId": body.studyId, "updatedAt": now}},
+        projection={"studyId": 1, "status": 1},
+        return_document=ReturnDocument.BEFORE,
     )
+    invalidate_participant(current_user.user_id)
+    await record_status_transition(db, before, {"studyId": body.studyId, "status": new_status})
 
     return ScreenerOut(
         id=str(result.inserted_id),
@@ -211,6 +289,7 @@ async def get_screener_responses(
         "studyId": doc["studyId"],
         "responses": responses,
         "isEligible": doc["isEligible"],
+        "failedCriteria": doc.get("failedCriteria", []),
         "completedAt": doc["completedAt"]
     }
 
@@ -218,28 +297,24 @@ async def get_screener_responses(
 # ─── My Profile (Participant self) ───────────────────────────────────────────
 
 @router.get("/me/profile", response_model=ParticipantOut)
-async def my_profile(current_user=Depends(get_current_user), db=Depends(get_db)):
+async def my_profile(
+    participant: dict = Depends(get_current_participant),
+    current_user=Depends(get_current_user),
+    db=Depends(get_db),
+    loaders: RequestLoaders = Depends(get_loaders),
+):
     """Participant: view own profile."""
-    p = await db["participants"].find_one({"userId": current_user.user_id})
-    if not p:
-        raise HTTPException(status_code=404, detail="Profile not found")
-    user = None
-    if current_user.user_id and ObjectId.is_valid(current_user.user_id):
-        user = await db["users"].find_one({"_id": ObjectId(current_user.user_id)})
-    return await _map_participant(p, db, user)
+    return await _map_participant(participant, loaders)
 
 
 @router.patch("/me/profile")
 async def update_my_profile(
     body: dict,
+    participant: dict = Depends(get_current_participant),
     current_user=Depends(get_current_user),
     db=Depends(get_db)
 ):
     """Participant: update own profile (e.g., timezone)."""
-    p = await db["participants"].find_one({"userId": current_user.user_id})
-    if not p:
-        raise HTTPException(status_code=404, detail="Profile not found")
-
     update_data = {}
     if "timezone" in body:
         update_data["timezone"] = body["timezone"]
@@ -254,6 +329,7 @@ async def update_my_profile(
             {"userId": current_user.user_id},
             {"$set": update_data}
         )
+        invalidate_participant(current_user.user_id)
 
     return {"message": "Profile updated successfully"}
 
@@ -263,14 +339,11 @@ async def update_my_profile(
 @router.post("/consent", response_model=ConsentOut)
 async def sign_consent(
     body: ConsentSign,
+    participant: dict = Depends(get_current_participant),
     current_user=Depends(get_current_user),
     db=Depends(get_db)
 ):
     """Participant signs the informed consent form."""
-    participant = await db["participants"].find_one({"userId": current_user.user_id})
-    if not participant:
-        raise HTTPException(status_code=404, detail="Participant not found")
-
     now = datetime.now(timezone.utc)
     consent_doc = {
         "participantId": str(participant["_id"]),
@@ -282,10 +355,14 @@ async def sign_consent(
     result = await db["consents"].insert_one(consent_doc)
     
     # Update participant status
-    await db["participants"].update_one(
+    before = await db["participants"].find_one_and_update(
         {"_id": participant["_id"]},
-        {"$set": {"status": "CONSENTED", "consentedAt": now, "studyId": body.studyId}}
+        {"$set": {"status": "CONSENTED", "consentedAt": now, "studyId": body.studyId}},
+        projection={"studyId": 1, "status": 1},
+        return_document=ReturnDocument.BEFORE,
     )
+    invalidate_participant(current_user.user_id)
+    await record_status_transition(db, before, {"studyId": body.studyId, "status": "CONSENTED"})
     
     return ConsentOut(
         id=str(result.inserted_id),
@@ -299,16 +376,14 @@ async def sign_consent(
 
 @router.post("/me/enroll")
 async def enroll_me(
+    participant: dict = Depends(get_current_participant),
     current_user=Depends(get_current_user),
     db=Depends(get_db)
 ):
     """
     Finalize enrollment for the current authenticated participant.
     """
-    p = await db["participants"].find_one({"userId": current_user.user_id})
-    if not p:
-        raise HTTPException(status_code=404, detail="Participant profile not found")
-    return await _enroll_logic(p, db)
+    return await _enroll_logic(participant, db)
 
 @router.post("/{participant_id}/enroll")
 async def enroll_participant(
@@ -333,11 +408,7 @@ async def _enroll_logic(p: dict, db):
     study_id = p.get("studyId")
     if not study_id:
         raise HTTPException(status_code=400, detail="Participant is not assigned to a study")
-    study = None
-    if ObjectId.is_valid(study_id):
-        study = await db["studies"].find_one({"_id": ObjectId(study_id)})
-    if not study:
-        study = await db["studies"].find_one({"slug": study_id})
+    study = await resolve_study(db, study_id, fields=("randomizationEnabled", "arms"))
     if not study:
         raise HTTPException(status_code=404, detail="Assigned study not found")
 
@@ -347,15 +418,26 @@ async def _enroll_logic(p: dict, db):
         arm_id = randomize_participant(study["arms"])
     
     now = datetime.now(timezone.utc)
-    await db["participants"].update_one(
-        {"_id": p["_id"]},
-        {"$set": {
-            "status": "ENROLLED",
-            "armId": arm_id,
-            "enrolledAt": now,
-            "updatedAt": now
-        }}
+    # Guard on status so a stale cached profile cannot enroll twice
+    before = await db["participants"].find_one_and_update(
+        {"_id": p["_id"], "status": {"$in": ["CONSENTED", "SCREENED"]}},
+        [
+            {"$set": {
+                "status": "ENROLLED",
+                "armId": {"$literal": arm_id},
+                "enrolledAt": now,
+                "updatedAt": now
+            }},
+            COMPLIANCE_DEFAULTS,
+        ],
+        projection={"studyId": 1, "status": 1},
+        return_document=ReturnDocument.BEFORE,
     )
+    invalidate_participant(p.get("userId"), p["_id"])
+    if not before:
+        raise HTTPException(status_code=400, detail="Participant must have signed consent and passed screening.")
+    await record_status_transition(db, before, {**before, "status": "ENROLLED"})
+    await materialize_schedule(db, study_id, [{"_id": p["_id"], "enrolledAt": now}])
 
     return {
         "message": "Participant enrolled successfully",
@@ -369,24 +451,25 @@ async def _enroll_logic(p: dict, db):
 async def withdraw_me(
     request: Request,
     reason: Optional[str] = None,
+    participant: dict = Depends(get_current_participant),
     current_user=Depends(get_current_user),
     db=Depends(get_db)
 ):
     """Participant: Withdraw from the study (GDPR Right to Withdraw)."""
-    participant = await db["participants"].find_one({"userId": current_user.user_id})
-    if not participant:
-        raise HTTPException(status_code=404, detail="Participant profile not found")
-
     now = datetime.now(timezone.utc)
-    await db["participants"].update_one(
+    before = await db["participants"].find_one_and_update(
         {"_id": participant["_id"]},
         {"$set": {
             "status": "WITHDRAWN",
             "withdrawalReason": encrypt_data(reason),
             "withdrawnAt": now,
             "updatedAt": now
-        }}
+        }},
+        projection={"studyId": 1, "status": 1},
+        return_document=ReturnDocument.BEFORE,
     )
+    invalidate_participant(current_user.user_id)
+    await record_status_transition(db, before, {**(before or {}), "status": "WITHDRAWN"})
 
     
     await log_audit_event(
@@ -395,7 +478,8 @@ async def withdraw_me(
         action="WITHDRAW",
         resource=f"Participant:{participant['_id']}",
         details=f"Reason: {reason if reason else 'No reason provided'}",
-        request=request
+        request=request,
+        durable=True,
     )
     
     return {"message": "You have successfully withdrawn from the study. Your data will be handled according to policy."}
@@ -403,48 +487,40 @@ async def withdraw_me(
 
 # ─── Participant Engagement: Reports (Section 4.4) ───────────────────────────
 
+REPORT_PIPELINE = [
+    {"$limit": 1},
+    {"$lookup": {
+        "from": "users",
+        "let": {"uid": {"$convert": {"input": "$userId", "to": "objectId", "onError": None, "onNull": None}}},
+        "pipeline": [{"$match": {"$expr": {"$eq": ["$_id", "$$uid"]}}}, {"$project": {"name": 1}}],
+        "as": "user",
+    }},
+    {"$project": {"studyId": 1, "compliance": 1, "complianceScore": 1, "user": {"$arrayElemAt": ["$user", 0]}}},
+]
+
+
 @router.get("/me/report")
 async def get_my_report(
     current_user=Depends(get_current_user),
-    db=Depends(get_db)
+    db=Depends(get_db),
 ):
-    """Generate a summary report for the participant."""
-    participant = await db["participants"].find_one({"userId": current_user.user_id})
-    if not participant:
-        raise HTTPException(status_code=404, detail="Participant not found")
-    
-    # Gather some stats for the report
-    completed_tasks = await db["taskInstances"].count_documents({
-        "participantId": str(participant["_id"]),
-        "status": "COMPLETED"
-    })
-    
-    pending_tasks = await db["taskInstances"].count_documents({
-        "participantId": str(participant["_id"]),
-        "status": {"$in": ["PENDING", "OVERDUE"]}
-    })
-    
-    study = None
-    if participant.get("studyId"):
-        study_id_str = participant["studyId"]
-        if ObjectId.is_valid(study_id_str):
-            study = await db["studies"].find_one({"_id": ObjectId(study_id_str)})
-        if not study:
-            study = await db["studies"].find_one({"slug": study_id_str})
-
-    user = None
-    if current_user.user_id and ObjectId.is_valid(current_user.user_id):
-        user = await db["users"].find_one({"_id": ObjectId(current_user.user_id)})
-    name = decrypt_data(user.get("name")) if user and user.get("name") else "Participant"
+    """
+    Generate a summary report for the participant: one read of the profile
+    (stored compliance counters, user name joined in) plus the cached study title.
+    """
+    docs = await db["participants"].aggregate([{"$match": {"userId": current_user.user_id}}, *REPORT_PIPELINE]).to_list(1)
+    if not docs:
+        raise HTTPException(status_code=404, detail="Participant profile not found")
+    participant = docs[0]
+
+    study = await resolve_study(db, participant.get("studyId"), fields=("title",))
+    user = participant.get("user") or {}
+    name = decrypt_data(user.get("name")) if user.get("name") else "Participant"
 
     return {
         "participantName": name,
         "reportGeneratedAt": datetime.now(timezone.utc),
         "studyTitle": study["title"] if study else "Not Enrolled",
-        "progress": {
-            "completedTasks": completed_tasks,
-            "pendingTasks": pending_tasks,
-            "complianceScore": int((completed_tasks / max(completed_tasks + pending_tasks, 1)) * 100)
-        },
+        "progress": compliance_summary(participant),
         "message": "Thank you for your valuable contribution to clinical research."
     }
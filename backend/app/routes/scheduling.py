@@ -1,15 +1,24 @@
 from datetime import datetime, timezone
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
 
-from app.database import get_db
+from app.database import get_db, register_indexes, register_query_shape
 from app.models import AppointmentCreate, AppointmentOut
 from app.auth import require_admin, require_coordinator_or_admin
+from app.utils.pagination import paginate, set_next_cursor
 from app.utils.security import encrypt_data, decrypt_data
 
 router = APIRouter(prefix="/api/scheduling", tags=["Scheduling"])
 
+register_indexes(
+    "appointments",
+    IndexModel([("scheduledAt", ASCENDING), ("_id", ASCENDING)]),
+    IndexModel([("participantId", ASCENDING), ("scheduledAt", ASCENDING), ("_id", ASCENDING)]),
+)
+register_query_shape("appointments", {"participantId": ""}, [("scheduledAt", 1), ("_id", 1)])
+
 def _map_appointment(doc: dict) -> AppointmentOut:
     return AppointmentOut(
         id=str(doc["_id"]),
@@ -24,8 +33,11 @@ def _map_appointment(doc: dict) -> AppointmentOut:
 
 @router.get("/", response_model=List[AppointmentOut])
 async def list_appointments(
+    response: Response,
     participantId: Optional[str] = Query(None),
     status_val: Optional[str] = Query(None, alias="status"),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     current_user=Depends(require_coordinator_or_admin),
     db=Depends(get_db)
 ):
@@ -35,11 +47,12 @@ async def list_appointments(
     if status_val:
         query["status"] = status_val
 
-    cursor = db["appointments"].find(query).sort("scheduledAt", 1).limit(100)
-    appointments = []
-    async for doc in cursor:
-        appointments.append(_map_appointment(doc))
-    return appointments
+    # Earliest first, paged by `cursor` (X-Next-Cursor)
+    docs, next_cursor = await paginate(
+        db["appointments"], query, "scheduledAt", limit=limit, cursor=cursor, direction=ASCENDING,
+    )
+    set_next_cursor(response, next_cursor)
+    return [_map_appointment(doc) for doc in docs]
 
 @router.post("/", response_model=AppointmentOut, status_code=status.HTTP_201_CREATED)
 async def create_appointment(
@@ -2,12 +2,24 @@ from datetime import datetime, timezone
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from pydantic import BaseModel
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
-from app.database import get_db
+from app.database import get_db, register_indexes, register_query_shape
 from app.auth import get_current_user
+from app.utils.stats import get_counts, sponsor_stats as compute_sponsor_stats
+from app.utils.study_counters import study_participant_totals
 
 router = APIRouter(prefix="/api/sponsor", tags=["Sponsor"])
 
+register_indexes(
+    "leads",
+    IndexModel([("sponsorUserId", ASCENDING)]),
+    IndexModel([("status", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("createdAt", DESCENDING), ("_id", DESCENDING)]),
+)
+register_indexes("leadAttachments", IndexModel([("leadId", ASCENDING)]))
+register_query_shape("leads", {"sponsorUserId": ""})
+
 
 class SponsorStudyOut(BaseModel):
     id: str
@@ -39,20 +51,7 @@ async def sponsor_stats(
     if current_user.role not in ("SPONSOR", "ADMIN", "COORDINATOR"):
         raise HTTPException(status_code=403, detail="Insufficient permissions")
 
-    total_studies = await db["studies"].count_documents({})
-    active_studies = await db["studies"].count_documents({"status": {"$in": ["ACTIVE", "RECRUITING"]}})
-    total_participants = await db["participants"].count_documents({})
-    enrolled = await db["participants"].count_documents({"status": {"$in": ["ENROLLED", "ACTIVE", "COMPLETED"]}})
-    completed = await db["participants"].count_documents({"status": "COMPLETED"})
-    completion_rate = round((completed / total_participants * 100) if total_participants > 0 else 0, 1)
-
-    return SponsorStatsOut(
-        totalStudies=total_studies,
-        activeStudies=active_studies,
-        totalParticipants=total_participants,
-        enrolledParticipants=enrolled,
-        completionRate=completion_rate,
-    )
+    return SponsorStatsOut(**compute_sponsor_stats(await get_counts(db)))
 
 
 # ─── Sponsor: Studies Overview ────────────────────────────────────────────────
@@ -66,27 +65,16 @@ async def sponsor_studies(
     if current_user.role not in ("SPONSOR", "ADMIN", "COORDINATOR"):
         raise HTTPException(status_code=403, detail="Insufficient permissions")
 
+    projection = {"title": 1, "status": 1, "condition": 1, "createdAt": 1, "participantCounts": 1}
     result = []
-    async for study in db["studies"].find().sort("createdAt", -1).limit(50):
-        study_id = str(study["_id"])
-        total = await db["participants"].count_documents({"studyId": study_id})
-        enrolled = await db["participants"].count_documents({
-            "studyId": study_id,
-            "status": {"$in": ["ENROLLED", "ACTIVE", "COMPLETED"]}
-        })
-        completed = await db["participants"].count_documents({
-            "studyId": study_id,
-            "status": "COMPLETED"
-        })
+    async for study in db["studies"].find({}, projection).sort("createdAt", -1).limit(50):
         result.append(SponsorStudyOut(
-            id=study_id,
+            id=str(study["_id"]),
             title=study["title"],
             status=study.get("status", "DRAFT"),
-            participantCount=total,
-            enrolledCount=enrolled,
-            completedCount=completed,
             condition=study.get("condition"),
             createdAt=study.get("createdAt", datetime.now(timezone.utc)),
+            **study_participant_totals(study),
         ))
     return result
 
@@ -97,7 +85,10 @@ from app.models import StudyCreate, StudyOut
 import re
 from bson import ObjectId
 from app.utils.email import notify_admin_new_study_inquiry
+from app.utils.notifications import create_notification
 from app.utils.security import decrypt_data
+from app.utils.studies import resolve_study, invalidate_study
+from app.utils.eligibility import apply_study_update
 from app.config import get_settings
 
 @router.post("/studies", response_model=StudyOut)
@@ -124,6 +115,7 @@ async def launch_study(
     doc["sponsorId"] = current_user.user_id
     doc["createdAt"] = datetime.now(timezone.utc)
     doc["updatedAt"] = datetime.now(timezone.utc)
+    doc["participantCounts"] = {}
 
     # If it's being submitted as an inquiry, set status to UNDER_REVIEW and notify admin
     is_inquiry = False
@@ -150,12 +142,11 @@ async def launch_study(
 
         # Save in-app notification for all admins to see on the bell icon
         study_title = study_in.title
-        await db["notifications"].insert_one({
+        await create_notification(db, {
             "userId": "ADMIN",  # special target: all admin users see this
             "title": f"New Study Inquiry: {study_title}",
             "content": f"Sponsor {sponsor_name} ({current_user.email}) has submitted a study inquiry and is awaiting approval.",
             "type": "STUDY_INQUIRY",
-            "status": "UNREAD",
             "studyId": str(result.inserted_id),
             "createdAt": doc["createdAt"],
         })
@@ -182,15 +173,7 @@ async def get_study_details(
     if current_user.role not in ("SPONSOR", "ADMIN", "COORDINATOR"):
         raise HTTPException(status_code=403, detail="Insufficient permissions")
 
-    study = await db["studies"].find_one({"slug": slug})
-    if not study:
-        # Fallback to ID
-        from bson import ObjectId
-        try:
-            study = await db["studies"].find_one({"_id": ObjectId(slug)})
-        except:
-            study = None
-
+    study = await resolve_study(db, slug)
     if not study:
         raise HTTPException(status_code=404, detail="Study not found")
 
@@ -209,15 +192,7 @@ async def update_study(
     if current_user.role not in ("SPONSOR", "ADMIN"):
         raise HTTPException(status_code=403, detail="Insufficient permissions")
 
-    # Find study
-    study = await db["studies"].find_one({"slug": slug})
-    if not study:
-        from bson import ObjectId
-        try:
-            study = await db["studies"].find_one({"_id": ObjectId(slug)})
-        except:
-            study = None
-    
+    study = await resolve_study(db, slug, fields=("sponsorId",))
     if not study:
         raise HTTPException(status_code=404, detail="Study not found")
 
@@ -226,12 +201,16 @@ async def update_study(
         raise HTTPException(status_code=403, detail="You can only manage your own studies")
 
     # Filter out immutable fields
-    update_data = {k: v for k, v in study_update.items() if k not in ("id", "_id", "createdAt", "sponsorId")}
+    update_data = {
+        k: v for k, v in study_update.items()
+        if k not in ("id", "_id", "createdAt", "sponsorId", "eligibilityVersion")
+    }
     update_data["updatedAt"] = datetime.now(timezone.utc)
     
-    await db["studies"].update_one({"_id": study["_id"]}, {"$set": update_data})
-    
-    updated = await db["studies"].find_one({"_id": study["_id"]})
+    updated = await apply_study_update(db, study["_id"], update_data)
+    invalidate_study(study["_id"], study.get("slug"))
+    if not updated:
+        raise HTTPException(status_code=404, detail="Study not found")
     updated["id"] = str(updated.pop("_id"))
     return updated
 
@@ -326,7 +305,7 @@ async def submit_lead(
         else f"Qualified Lead: {product_name}" if step == 2
         else f"New Preliminary Lead: {product_name}"
     )
-    await db["notifications"].insert_one({
+    await create_notification(db, {
         "userId": "ADMIN",
         "title": notif_title,
         "content": (
@@ -334,7 +313,6 @@ async def submit_lead(
             f"(Status: {status}). Routed to {route_email}."
         ),
         "type": "LEAD_SUBMISSION",
-        "status": "UNREAD",
         "leadId": lead_id,
         "createdAt": now,
     })
@@ -2,13 +2,25 @@ from datetime import datetime, timezone
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
 
-from app.database import get_db
+from app.database import get_db, register_indexes, register_query_shape
 from app.models import StudyCreate, StudyOut
 from app.auth import require_admin
+from app.utils.studies import resolve_study, invalidate_study
+from app.utils.eligibility import apply_study_update, reevaluate_study
 
 router = APIRouter(prefix="/api/studies", tags=["Studies"])
 
+register_indexes(
+    "studies",
+    IndexModel([("slug", ASCENDING)], unique=True),
+    IndexModel([("status", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)]),
+    IndexModel([("createdAt", DESCENDING), ("_id", DESCENDING)]),
+)
+register_query_shape("studies", {"slug": ""})
+register_query_shape("studies", {"status": {"$in": ["RECRUITING", "ACTIVE"]}}, [("createdAt", -1)])
+
 
 def _map_study(doc: dict) -> StudyOut:
     return StudyOut(
@@ -90,8 +102,7 @@ async def list_studies(
 @router.get("/{study_id}", response_model=StudyOut)
 async def get_study(study_id: str, db=Depends(get_db)):
     """Get a single study by ID or slug."""
-    query = {"_id": ObjectId(study_id)} if ObjectId.is_valid(study_id) else {"slug": study_id}
-    doc = await db["studies"].find_one(query)
+    doc = await resolve_study(db, study_id)
     if not doc:
         raise HTTPException(status_code=404, detail="Study not found")
     return _map_study(doc)
@@ -109,6 +120,7 @@ async def create_study(
     doc["createdAt"] = now
     doc["updatedAt"] = now
     doc["createdBy"] = current_user.user_id
+    doc["participantCounts"] = {}
     result = await db["studies"].insert_one(doc)
     created = await db["studies"].find_one({"_id": result.inserted_id})
     return _map_study(created)
@@ -121,18 +133,33 @@ async def update_study(
     current_user=Depends(require_admin),
     db=Depends(get_db)
 ):
-    """Admin only: Update a study."""
+    """
+    Admin only: Update a study. Changing an eligibility criterion bumps the study's
+    `eligibilityVersion` and re-screens its LEAD/SCREENED participants in the
+    background.
+    """
     updates["updatedAt"] = datetime.now(timezone.utc)
-    await db["studies"].update_one(
-        {"_id": ObjectId(study_id)},
-        {"$set": updates}
-    )
-    doc = await db["studies"].find_one({"_id": ObjectId(study_id)})
+    doc = await apply_study_update(db, ObjectId(study_id), updates)
+    invalidate_study(study_id, updates.get("slug"))
     if not doc:
         raise HTTPException(status_code=404, detail="Study not found")
     return _map_study(doc)
 
 
+@router.post("/{study_id}/reevaluate-eligibility")
+async def reevaluate_eligibility(
+    study_id: str,
+    current_user=Depends(require_admin),
+    db=Depends(get_db)
+):
+    """Admin only: re-screen the study's LEAD/SCREENED participants against its current criteria now."""
+    study = await resolve_study(db, study_id, fields=("_id",))
+    if not study:
+        raise HTTPException(status_code=404, detail="Study not found")
+    result = await reevaluate_study(db, study_id)
+    return {"status": "success", **result}
+
+
 @router.delete("/{study_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_study(
     study_id: str,
@@ -144,3 +171,4 @@ async def delete_study(
         {"_id": ObjectId(study_id)},
         {"$set": {"status": "CLOSED", "updatedAt": datetime.now(timezone.utc)}}
     )
+    invalidate_study(study_id)
@@ -9,19 +9,26 @@ Only users with role=SUPER_ADMIN may access these endpoints.
 
 from datetime import datetime, timezone
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from pydantic import BaseModel
 from bson import ObjectId
+from pymongo import DESCENDING, IndexModel
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
-from app.database import get_db
+from app.database import get_db, register_indexes
 from app.auth import require_super_admin, get_password_hash
 from app.utils.security import encrypt_data, decrypt_data
 from app.utils.email import notify_new_credentials
+from app.utils.studies import invalidate_study
+from app.utils.participants import invalidate_study_participants
+from app.utils.stats import get_counts, platform_stats
+from app.utils.pagination import paginate, estimated_total, set_next_cursor
 from app.config import get_settings
 
 router = APIRouter(prefix="/api/super-admin", tags=["Super Admin"])
 
+register_indexes("announcements", IndexModel([("createdAt", DESCENDING)]))
+
 
 # ─── helpers ──────────────────────────────────────────────────────────────────
 
@@ -38,32 +45,7 @@ async def get_platform_stats(
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
     """Full platform-wide statistics visible only to Super Admin."""
-    total_users      = await db["users"].count_documents({})
-    total_admins     = await db["users"].count_documents({"role": {"$in": ["ADMIN", "SUPER_ADMIN"]}})
-    total_sponsors   = await db["users"].count_documents({"role": "SPONSOR"})
-    total_studies    = await db["studies"].count_documents({})
-    active_studies   = await db["studies"].count_documents({"status": "ACTIVE"})
-    total_parts      = await db["participants"].count_documents({})
-    active_parts     = await db["participants"].count_documents({"status": {"$in": ["ACTIVE", "ENROLLED"]}})
-    open_aes         = await db["adverseEvents"].count_documents({"status": {"$ne": "Resolved"}})
-    collection_names = await db.list_collection_names()
-    total_leads      = await db["leads"].count_documents({}) if "leads" in collection_names else 0
-    audit_today      = await db["audit_logs"].count_documents({
-        "timestamp": {"$gte": datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)}
-    })
-
-    return {
-        "totalUsers":       total_users,
-        "totalAdmins":      total_admins,
-        "totalSponsors":    total_sponsors,
-        "totalStudies":     total_studies,
-        "activeStudies":    active_studies,
-        "totalParticipants": total_parts,
-        "activeParticipants": active_parts,
-        "openAdverseEvents": open_aes,
-        "sponsorLeads":     total_leads,
-        "auditEventsToday": audit_today,
-    }
+    return platform_stats(await get_counts(db))
 
 
 # ─── User Management ──────────────────────────────────────────────────────────
@@ -74,18 +56,25 @@ async def list_all_users(
     search: Optional[str] = None,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
     current_user=Depends(require_super_admin),
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
-    """List every user in the platform with optional role/search filter."""
+    """
+    List every user in the platform with optional role/search filter.
+    Page with `cursor` (from `nextCursor`); `total` is only sent on the first page.
+    """
     query: dict = {}
     if role:
         query["role"] = role
     if search:
         query["email"] = {"$regex": search, "$options": "i"}
 
+    docs, next_cursor = await paginate(
+        db["users"], query, "createdAt", limit=limit, cursor=cursor, skip=skip,
+    )
     users = []
-    async for u in db["users"].find(query).sort("createdAt", -1).skip(skip).limit(limit):
+    for u in docs:
         users.append({
             "id":        str(u["_id"]),
             "name":      decrypt_data(u.get("name")) or "",
@@ -96,8 +85,8 @@ async def list_all_users(
             "emailVerified": u.get("emailVerified"),
             "mustChangePassword": u.get("mustChangePassword", False),
         })
-    total = await db["users"].count_documents(query)
-    return {"users": users, "total": total}
+    total = None if cursor else await estimated_total(db["users"], query)
+    return {"users": users, "total": total, "nextCursor": next_cursor}
 
 
 class CreateUserBody(BaseModel):
@@ -128,7 +117,7 @@ async def create_user(
     doc = {
         "name":         encrypt_data(body.name),
         "email":        body.email,
-        "passwordHash": get_password_hash(body.password),
+        "passwordHash": await get_password_hash(body.password),
         "role":         body.role,
         "createdAt":    now,
         "updatedAt":    now,
@@ -190,7 +179,7 @@ async def update_user(
     if body.role is not None:
         updates["role"] = body.role
     if body.password is not None:
-        updates["passwordHash"] = get_password_hash(body.password)
+        updates["passwordHash"] = await get_password_hash(body.password)
     if body.suspended is not None:
         updates["suspended"] = body.suspended
 
@@ -228,16 +217,20 @@ async def list_all_studies(
     status: Optional[str] = None,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
     current_user=Depends(require_super_admin),
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
-    """List all studies with optional status filter."""
+    """List all studies with optional status filter, paged by `cursor`."""
     query: dict = {}
     if status:
         query["status"] = status
 
+    docs, next_cursor = await paginate(
+        db["studies"], query, "createdAt", limit=limit, cursor=cursor, skip=skip,
+    )
     studies = []
-    async for s in db["studies"].find(query).sort("createdAt", -1).skip(skip).limit(limit):
+    for s in docs:
         studies.append({
             "id":          str(s["_id"]),
             "title":       s.get("title", ""),
@@ -248,8 +241,8 @@ async def list_all_studies(
             "createdAt":   s.get("createdAt"),
             "targetParticipants": s.get("targetParticipants", 0),
         })
-    total = await db["studies"].count_documents(query)
-    return {"studies": studies, "total": total}
+    total = None if cursor else await estimated_total(db["studies"], query)
+    return {"studies": studies, "total": total, "nextCursor": next_cursor}
 
 
 class StudyStatusBody(BaseModel):
@@ -275,6 +268,7 @@ async def update_study_status(
     )
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Study not found.")
+    invalidate_study(oid)
     return {"message": f"Study status updated to {body.status}."}
 
 
@@ -297,8 +291,10 @@ async def delete_study(
     # Cascade delete associated data
     sid = str(oid)
     await db["participants"].delete_many({"studyId": sid})
+    invalidate_study_participants(sid)
     await db["taskInstances"].delete_many({"studyId": sid})
     await db["studies"].delete_one({"_id": oid})
+    invalidate_study(oid, study.get("slug"))
 
     return {"message": "Study and associated data permanently deleted."}
 
@@ -307,43 +303,53 @@ async def delete_study(
 
 @router.get("/sponsors")
 async def list_sponsors(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     current_user=Depends(require_super_admin),
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
-    """List all sponsor users."""
-    sponsors = []
-    async for u in db["users"].find({"role": "SPONSOR"}).sort("createdAt", -1):
-        sponsors.append({
+    """List sponsor users, newest first, paged by `cursor` (X-Next-Cursor)."""
+    docs, next_cursor = await paginate(db["users"], {"role": "SPONSOR"}, "createdAt", limit=limit, cursor=cursor)
+    set_next_cursor(response, next_cursor)
+    return [
+        {
             "id":        str(u["_id"]),
             "name":      decrypt_data(u.get("name")) or "",
             "email":     u.get("email", ""),
             "createdAt": u.get("createdAt"),
-        })
-    return sponsors
+        }
+        for u in docs
+    ]
 
 
 @router.get("/sponsor-leads")
 async def list_sponsor_leads(
+    response: Response,
     status: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None),
     current_user=Depends(require_super_admin),
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
-    """List all sponsor inquiry leads."""
+    """List sponsor inquiry leads, newest first, paged by `cursor` (X-Next-Cursor)."""
     query: dict = {}
     if status:
         query["status"] = status
 
-    leads = []
-    async for lead in db["leads"].find(query).sort("createdAt", -1).limit(100):
-        leads.append({
+    docs, next_cursor = await paginate(db["leads"], query, "createdAt", limit=limit, cursor=cursor)
+    set_next_cursor(response, next_cursor)
+    return [
+        {
             "id":           str(lead["_id"]),
             "companyName":  lead.get("companyName", ""),
             "contactEmail": lead.get("contactEmail", ""),
             "status":       lead.get("status", "NEW"),
             "studyType":    lead.get("studyType", ""),
             "createdAt":    lead.get("createdAt"),
-        })
-    return leads
+        }
+        for lead in docs
+    ]
 
 
 # ─── Audit Logs ──────────────────────────────────────────────────────────────
@@ -354,18 +360,22 @@ async def get_audit_logs(
     limit: int = Query(100, ge=1, le=500),
     action: Optional[str] = None,
     user_id: Optional[str] = None,
+    cursor: Optional[str] = None,
     current_user=Depends(require_super_admin),
     db: AsyncIOMotorDatabase = Depends(get_db),
 ):
-    """Full audit log access for compliance monitoring."""
+    """Full audit log access for compliance monitoring, paged by `cursor`."""
     query: dict = {}
     if action:
         query["action"] = action
     if user_id:
         query["userId"] = user_id
 
+    docs, next_cursor = await paginate(
+        db["audit_logs"], query, "timestamp", limit=limit, cursor=cursor, skip=skip,
+    )
     logs = []
-    async for log in db["audit_logs"].find(query).sort("timestamp", -1).skip(skip).limit(limit):
+    for log in docs:
         logs.append({
             "id":        str(log["_id"]),
             "userId":    log.get("userId", ""),
@@ -375,8 +385,8 @@ async def get_audit_logs(
             "ipAddress": log.get("ipAddress", ""),
             "timestamp": log.get("timestamp"),
         })
-    total = await db["audit_logs"].count_documents(query)
-    return {"logs": logs, "total": total}
+    total = None if cursor else await estimated_total(db["audit_logs"], query)
+    return {"logs": logs, "total": total, "nextCursor": next_cursor}
 
 
 # ─── System Settings ─────────────────────────────────────────────────────────
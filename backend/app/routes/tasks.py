@@ -1,14 +1,35 @@
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from bson import ObjectId
+from pymongo import ASCENDING, IndexModel
 
-from app.database import get_db
+from app.database import get_db, register_indexes, register_query_shape
 from app.models import TaskInstanceOut
 from app.auth import get_current_user, require_admin
+from app.utils.compliance import record_completion
+from app.utils.pagination import after_cursor, set_next_cursor, split_page
+from app.utils.participants import get_current_participant
+from app.utils.schedules import materialize_cohort, materialize_schedule
+from app.utils.studies import resolve_study
 
 router = APIRouter(prefix="/api/tasks", tags=["Tasks"])
 
+register_indexes(
+    "taskInstances",
+    IndexModel([("participantId", ASCENDING), ("dueDate", ASCENDING), ("_id", ASCENDING)]),
+    IndexModel([("participantId", ASCENDING), ("status", ASCENDING), ("dueDate", ASCENDING), ("_id", ASCENDING)]),
+    IndexModel([("status", ASCENDING)]),
+)
+register_indexes("tasks", IndexModel([("studyId", ASCENDING)]))
+register_query_shape("taskInstances", {"participantId": ""}, [("dueDate", 1), ("_id", 1)])
+register_query_shape("taskInstances", {"participantId": "", "status": "PENDING"}, [("dueDate", 1), ("_id", 1)])
+register_query_shape("taskInstances", {"participantId": "", "status": "COMPLETED"})
+register_query_shape("tasks", {"studyId": ""})
+
+# Task definition fields joined onto each instance
+TASK_DEF_PROJECTION = {"_id": 0, "title": 1, "description": 1, "type": 1}
+
 
 def _map_task(doc: dict, task_def: Optional[dict] = None) -> TaskInstanceOut:
     title = task_def["title"] if task_def else "Unknown Task"
@@ -31,26 +52,45 @@ def _map_task(doc: dict, task_def: Optional[dict] = None) -> TaskInstanceOut:
 
 @router.get("/me", response_model=List[TaskInstanceOut])
 async def my_tasks(
+    response: Response,
     status: Optional[str] = Query(None),
+    available_from: Optional[datetime] = Query(None, description="Only tasks available on or after this time"),
+    due_before: Optional[datetime] = Query(None, description="Only tasks due before this time"),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="Next-page cursor from X-Next-Cursor"),
+    participant: dict = Depends(get_current_participant),
     current_user=Depends(get_current_user),
-    db=Depends(get_db)
+    db=Depends(get_db),
 ):
-    """Participant: get all task instances assigned to me."""
-    participant = await db["participants"].find_one({"userId": current_user.user_id})
-    if not participant:
-        raise HTTPException(status_code=404, detail="Participant profile not found")
-
+    """Participant: get task instances assigned to me, soonest due first."""
     query: dict = {"participantId": str(participant["_id"])}
     if status:
         query["status"] = status
-
-    result = []
-    async for doc in db["taskInstances"].find(query).sort("dueDate", 1):
-        task_def = None
-        if ObjectId.is_valid(doc.get("taskId", "")):
-            task_def = await db["tasks"].find_one({"_id": ObjectId(doc["taskId"])})
-        result.append(_map_task(doc, task_def))
-    return result
+    if available_from:
+        query["availableDate"] = {"$gte": available_from}
+    if due_before:
+        query["dueDate"] = {"$lt": due_before}
+
+    # One round trip: page the instances, then join each to its task definition.
+    # taskId is stored as a string, so it is converted before matching tasks._id.
+    pipeline = [
+        {"$match": after_cursor(query, "dueDate", cursor, ASCENDING)},
+        {"$sort": {"dueDate": 1, "_id": 1}},
+        {"$limit": limit + 1},
+        {"$lookup": {
+            "from": "tasks",
+            "let": {"taskOid": {"$convert": {"input": "$taskId", "to": "objectId", "onError": None, "onNull": None}}},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$_id", "$$taskOid"]}}},
+                {"$project": TASK_DEF_PROJECTION},
+            ],
+            "as": "taskDef",
+        }},
+    ]
+    docs = await db["taskInstances"].aggregate(pipeline).to_list(None)
+    docs, next_cursor = split_page(docs, "dueDate", limit)
+    set_next_cursor(response, next_cursor)
+    return [_map_task(doc, doc["taskDef"][0] if doc.get("taskDef") else None) for doc in docs]
 
 
 # ─── Participant: Complete a Task ─────────────────────────────────────────────
@@ -65,16 +105,33 @@ async def complete_task(
     if not ObjectId.is_valid(instance_id):
         raise HTTPException(status_code=400, detail="Invalid task instance ID")
     now = datetime.now(timezone.utc)
-    result = await db["taskInstances"].update_one(
-        {"_id": ObjectId(instance_id)},
-        {"$set": {"status": "COMPLETED", "completedDate": now}}
+    before = await db["taskInstances"].find_one_and_update(
+        {"_id": ObjectId(instance_id), "status": {"$ne": "COMPLETED"}},
+        {"$set": {"status": "COMPLETED", "completedDate": now}},
+        projection={"participantId": 1, "status": 1},
     )
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Task instance not found")
+    if before is None:
+        if not await db["taskInstances"].find_one({"_id": ObjectId(instance_id)}, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="Task instance not found")
+        return {"message": "Task marked as completed"}
+    await record_completion(db, before["participantId"], before.get("status"))
     return {"message": "Task marked as completed"}
 
 
-# ─── Admin: Create Task Instances for a Participant ───────────────────────────
+# ─── Admin: Create Task Instances ─────────────────────────────────────────────
+
+@router.post("/generate/study/{study_id}", status_code=201)
+async def generate_study_tasks(
+    study_id: str,
+    current_user=Depends(require_admin),
+    db=Depends(get_db)
+):
+    """Admin: materialize the study schedule for every enrolled or active participant. Safe to re-run."""
+    if not await resolve_study(db, study_id, fields=("slug",)):
+        raise HTTPException(status_code=404, detail="Study not found")
+    created_count = await materialize_cohort(db, study_id)
+    return {"message": f"Generated {created_count} task instances for study.", "created": created_count}
+
 
 @router.post("/generate/{participant_id}", status_code=201)
 async def generate_tasks(
@@ -85,7 +142,9 @@ async def generate_tasks(
     """Admin: generate task instances for a newly enrolled participant based on the study schedule."""
     if not ObjectId.is_valid(participant_id):
         raise HTTPException(status_code=400, detail="Invalid participant ID")
-    participant = await db["participants"].find_one({"_id": ObjectId(participant_id)})
+    participant = await db["participants"].find_one(
+        {"_id": ObjectId(participant_id)}, {"studyId": 1, "enrolledAt": 1},
+    )
     if not participant:
         raise HTTPException(status_code=404, detail="Participant not found")
 
@@ -93,26 +152,5 @@ async def generate_tasks(
     if not study_id:
         raise HTTPException(status_code=400, detail="Participant is not assigned to a study")
 
-    tasks = []
-    async for task in db["tasks"].find({"studyId": study_id}):
-        tasks.append(task)
-
-    now = datetime.now(timezone.utc)
-    enrolled_date = participant.get("enrolledAt", now)
-    created_count = 0
-
-    for task in tasks:
-        available = enrolled_date + timedelta(days=task.get("dueDayOffset", 0))
-        due = available + timedelta(days=task.get("windowDays", 3))
-        instance = {
-            "participantId": participant_id,
-            "taskId": str(task["_id"]),
-            "availableDate": available,
-            "dueDate": due,
-            "status": "PENDING",
-            "createdAt": now,
-        }
-        await db["taskInstances"].insert_one(instance)
-        created_count += 1
-
+    created_count = await materialize_schedule(db, study_id, [participant])
     return {"message": f"Generated {created_count} task instances for participant."}
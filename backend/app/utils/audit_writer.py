@@ -0,0 +1,153 @@
+"""
+Buffered audit-log writer.
+
+`log_audit_event` hands entries to `audit_writer`, which queues them in
+memory and writes them with one `insert_many` whenever AUDIT_FLUSH_BATCH_SIZE
+entries are waiting or AUDIT_FLUSH_INTERVAL_SECONDS has passed. Encryption of
+the `details` field happens at flush time, off the request path.
+
+The lifespan hook calls `stop()`, which flushes everything still queued
+before the database connection closes. Callers that must have the entry on
+disk before responding pass `durable=True` to `log_audit_event`.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Optional
+from pymongo.errors import BulkWriteError
+
+from app.config import get_settings
+from app.utils.logger import logger
+from app.utils.security import encrypt_data
+
+settings = get_settings()
+
+AUDIT_COLLECTION = "audit_logs"
+
+
+def seal_entry(entry: dict) -> dict:
+    """Storage copy of an entry with `details` encrypted."""
+    sealed = dict(entry)
+    if sealed.get("details") is not None:
+        sealed["details"] = encrypt_data(str(sealed["details"]))
+    return sealed
+
+
+def _seal_batch(entries: list[dict]) -> list[dict]:
+    return [seal_entry(entry) for entry in entries]
+
+
+class AuditWriter:
+    """Background task that batches queued audit entries into `insert_many` calls."""
+
+    def __init__(self, batch_size: int, interval: float, max_queue: int):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_queue = max_queue
+        self._queue: deque[dict] = deque()
+        self._db = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stats = {
+            "enqueued": 0,
+            "written": 0,
+            "flushes": 0,
+            "flushFailures": 0,
+            "inlineWrites": 0,
+            "lastFlushMs": 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def write(self, db, entry: dict, durable: bool = False) -> None:
+        """
+        Queue an entry, or insert it immediately when `durable` is set, the
+        writer is not running, or the queue is full (backpressure, never drop).
+        """
+        if durable or not self.running or len(self._queue) >= self.max_queue:
+            self._stats["inlineWrites"] += 1
+            await db[AUDIT_COLLECTION].insert_one(seal_entry(entry))
+            return
+        self._queue.append(entry)
+        self._stats["enqueued"] += 1
+        if len(self._queue) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Write every queued entry; returns how many were written."""
+        written = 0
+        async with self._flush_lock:
+            while self._queue:
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                started = time.perf_counter()
+                try:
+                    docs = await asyncio.to_thread(_seal_batch, batch)
+                    await self._db[AUDIT_COLLECTION].insert_many(docs, ordered=False)
+                except BulkWriteError as e:
+                    # Per-document rejections would fail again: count and log them, don't re-queue
+                    errors = e.details.get("writeErrors", [])
+                    self._stats["flushFailures"] += 1
+                    logger.error(f"Audit log flush rejected {len(errors)} of {len(batch)} entries: {errors[:1]}")
+                    written += e.details.get("nInserted", 0)
+                    self._stats["written"] += e.details.get("nInserted", 0)
+                    continue
+                except Exception as e:
+                    # Keep the entries for the next flush
+                    self._queue.extendleft(reversed(batch))
+                    self._stats["flushFailures"] += 1
+                    logger.error(f"Audit log flush failed ({len(batch)} entries re-queued): {str(e)}")
+                    break
+                written += len(batch)
+                self._stats["written"] += len(batch)
+                self._stats["flushes"] += 1
+                self._stats["lastFlushMs"] = round((time.perf_counter() - started) * 1000, 2)
+        return written
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self, db) -> None:
+        if self._task is None:
+            self._db = db
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the background task and synchronously flush whatever is still queued."""
+        if self._task:
+            # Let an in-progress flush finish rather than cancelling it mid-insert
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            remaining = len(self._queue)
+            if remaining:
+                await self.flush()
+                logger.info(f"Flushed {remaining} queued audit entries on shutdown.")
+
+    def metrics(self) -> dict:
+        return {
+            "queueDepth": len(self._queue),
+            "maxQueue": self.max_queue,
+            "running": self.running,
+            **self._stats,
+        }
+
+
+audit_writer = AuditWriter(
+    batch_size=settings.AUDIT_FLUSH_BATCH_SIZE,
+    interval=settings.AUDIT_FLUSH_INTERVAL_SECONDS,
+    max_queue=settings.AUDIT_QUEUE_MAX,
+)
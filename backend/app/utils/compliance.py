@@ -0,0 +1,211 @@
+"""
+Materialized per-participant task compliance.
+
+Each participant document carries `compliance: {pending, completed, overdue}`
+task counters and a stored `complianceScore`: the percentage of tasks that
+have come due (completed or overdue) that were completed, 100 while nothing
+is due. Counters move with the task lifecycle:
+  - schedule materialization adds pending tasks
+  - completing a task moves it from pending/overdue to completed
+  - `ComplianceSweeper` moves pending tasks past their due date to OVERDUE
+
+Every change recomputes the score in the same pipeline update, so the
+cohort view can sort on an index. Participants start with zeroed counters
+and a score of 100 (`initial_compliance` at sign-up, `COMPLIANCE_DEFAULTS` at
+enrollment for profiles that predate the counters). `reconcile_compliance`
+rebuilds everything from the taskInstances collection, and runs at startup
+while any enrolled participant still lacks a score.
+"""
+import asyncio
+from datetime import datetime, timezone
+from typing import Optional
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, UpdateOne
+
+from app.config import get_settings
+from app.database import register_indexes, register_query_shape
+from app.utils.logger import logger
+from app.utils.study_counters import ENROLLED_STATUSES
+
+settings = get_settings()
+
+COUNTERS = ("pending", "completed", "overdue")
+SWEEP_BATCH = 1000
+
+register_indexes(
+    "participants",
+    IndexModel([("studyId", ASCENDING), ("status", ASCENDING), ("complianceScore", ASCENDING), ("_id", ASCENDING)]),
+)
+register_indexes("taskInstances", IndexModel([("status", ASCENDING), ("dueDate", ASCENDING)]))
+register_query_shape(
+    "participants",
+    {"studyId": {"$in": [""]}, "status": {"$in": ["ENROLLED", "ACTIVE", "COMPLETED"]}},
+    [("complianceScore", 1), ("_id", 1)],
+    name="participants:compliance",
+)
+register_query_shape("taskInstances", {"status": "PENDING", "dueDate": {"$lt": ""}}, name="taskInstances:overdue")
+
+_completed = {"$ifNull": ["$compliance.completed", 0]}
+_due = {"$add": [_completed, {"$ifNull": ["$compliance.overdue", 0]}]}
+_SCORE_STAGE = {"$set": {"complianceScore": {"$cond": [
+    {"$gt": [_due, 0]},
+    {"$round": [{"$multiply": [{"$divide": [_completed, _due]}, 100]}, 0]},
+    100,
+]}}}
+
+
+# Pipeline stage giving a participant without counters the starting values
+COMPLIANCE_DEFAULTS = {"$set": {
+    "compliance": {"$ifNull": ["$compliance", {name: 0 for name in COUNTERS}]},
+    "complianceScore": {"$ifNull": ["$complianceScore", 100]},
+}}
+
+
+def initial_compliance() -> dict:
+    """Fields for a new participant profile: no tasks yet, full score."""
+    return {"compliance": {name: 0 for name in COUNTERS}, "complianceScore": 100}
+
+
+def _counter_pipeline(delta: dict[str, int]) -> list[dict]:
+    """Pipeline update that applies `delta` to the counters (never below zero) and re-scores."""
+    return [
+        {"$set": {
+            f"compliance.{name}": {"$max": [0, {"$add": [{"$ifNull": [f"$compliance.{name}", 0]}, change]}]}
+            for name, change in delta.items()
+        }},
+        _SCORE_STAGE,
+    ]
+
+
+def _oid(participant_id: str):
+    return ObjectId(participant_id) if ObjectId.is_valid(participant_id) else participant_id
+
+
+async def apply_deltas(db, deltas: dict[str, dict[str, int]]) -> None:
+    """Apply `{participantId: {counter: change}}` in one bulk write."""
+    ops = [
+        UpdateOne({"_id": _oid(pid)}, _counter_pipeline(delta))
+        for pid, delta in deltas.items()
+        if any(delta.values())
+    ]
+    if ops:
+        await db["participants"].bulk_write(ops, ordered=False)
+
+
+async def record_completion(db, participant_id: str, previous_status: Optional[str]) -> None:
+    """A task moved to COMPLETED from `previous_status`."""
+    delta = {"completed": 1}
+    if previous_status == "OVERDUE":
+        delta["overdue"] = -1
+    elif previous_status == "PENDING":
+        delta["pending"] = -1
+    await apply_deltas(db, {participant_id: delta})
+
+
+def compliance_summary(participant: dict) -> dict:
+    counts = participant.get("compliance") or {}
+    return {
+        "completedTasks": counts.get("completed", 0),
+        "pendingTasks": counts.get("pending", 0) + counts.get("overdue", 0),
+        "overdueTasks": counts.get("overdue", 0),
+        "complianceScore": int(participant.get("complianceScore", 100)),
+    }
+
+
+async def mark_overdue(db, now: Optional[datetime] = None) -> int:
+    """Move PENDING tasks past their due date to OVERDUE; returns how many moved."""
+    now = now or datetime.now(timezone.utc)
+    moved = 0
+    while True:
+        docs = await db["taskInstances"].find(
+            {"status": "PENDING", "dueDate": {"$lt": now}}, {"participantId": 1},
+        ).limit(SWEEP_BATCH).to_list(None)
+        if not docs:
+            return moved
+        by_participant: dict[str, list] = {}
+        for doc in docs:
+            by_participant.setdefault(doc["participantId"], []).append(doc["_id"])
+
+        deltas = {}
+        for pid, ids in by_participant.items():
+            # Re-check the status so a task completed since the read is not counted as overdue
+            result = await db["taskInstances"].update_many(
+                {"_id": {"$in": ids}, "status": "PENDING"},
+                {"$set": {"status": "OVERDUE", "overdueAt": now}},
+            )
+            if result.modified_count:
+                deltas[pid] = {"pending": -result.modified_count, "overdue": result.modified_count}
+                moved += result.modified_count
+        await apply_deltas(db, deltas)
+        if len(docs) < SWEEP_BATCH:
+            return moved
+
+
+async def reconcile_compliance(db) -> int:
+    """Rebuild every participant's counters and score from taskInstances."""
+    pipeline = [{"$group": {"_id": {"p": "$participantId", "s": "$status"}, "count": {"$sum": 1}}}]
+    counts: dict[str, dict[str, int]] = {}
+    async for row in db["taskInstances"].aggregate(pipeline):
+        status = str(row["_id"].get("s") or "PENDING").lower()
+        if status in COUNTERS:
+            counts.setdefault(row["_id"]["p"], {})[status] = row["count"]
+
+    updated = 0
+    ops: list[UpdateOne] = []
+    async for p in db["participants"].find({}, {"_id": 1}):
+        values = counts.get(str(p["_id"]), {})
+        ops.append(UpdateOne({"_id": p["_id"]}, [
+            {"$set": {f"compliance.{name}": values.get(name, 0) for name in COUNTERS}},
+            _SCORE_STAGE,
+        ]))
+        if len(ops) >= SWEEP_BATCH:
+            await db["participants"].bulk_write(ops, ordered=False)
+            updated, ops = updated + len(ops), []
+    if ops:
+        await db["participants"].bulk_write(ops, ordered=False)
+        updated += len(ops)
+    logger.info(f"Reconciled compliance counters for {updated} participants.")
+    return updated
+
+
+async def ensure_compliance(db) -> None:
+    """Reconcile once if any enrolled participant predates the counters, so none sorts as unscored."""
+    missing = await db["participants"].find_one(
+        {"status": {"$in": list(ENROLLED_STATUSES)}, "complianceScore": {"$exists": False}}, {"_id": 1},
+    )
+    if missing:
+        await reconcile_compliance(db)
+
+
+class ComplianceSweeper:
+    """Background task that marks overdue tasks every `interval` seconds."""
+
+    def __init__(self, interval: int):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self, db) -> None:
+        while True:
+            try:
+                moved = await mark_overdue(db)
+                if moved:
+                    logger.info(f"Marked {moved} task instances overdue.")
+            except Exception as e:
+                logger.error(f"Overdue task sweep failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self, db) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+compliance_sweeper = ComplianceSweeper(settings.COMPLIANCE_SWEEP_INTERVAL_SECONDS)
@@ -0,0 +1,132 @@
+"""
+Materialized message threads.
+
+Every message belongs to the conversation between its sender and receiver
+(`conversationId` = the two user ids, sorted, joined by ":"). The
+`conversations` collection keeps one document per pair holding the latest
+message preview and per-user unread counters, so the inbox is one indexed read
+per page of threads. `send_message` and the mark-read routes keep it current;
+`reconcile_conversations` rebuilds it from the messages collection.
+"""
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
+
+from app.database import register_indexes, register_query_shape
+from app.utils.logger import logger
+from app.utils.security import decrypt_data, encrypt_data
+
+CONVERSATIONS = "conversations"
+PREVIEW_CHARS = 100
+
+register_indexes(
+    CONVERSATIONS,
+    IndexModel([("participants", ASCENDING), ("updatedAt", DESCENDING), ("_id", DESCENDING)]),
+)
+register_indexes(
+    "messages",
+    IndexModel([("conversationId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)]),
+)
+register_query_shape(CONVERSATIONS, {"participants": ""}, [("updatedAt", -1), ("_id", -1)])
+register_query_shape("messages", {"conversationId": ""}, [("createdAt", -1), ("_id", -1)])
+
+
+def conversation_id(user_a: str, user_b: str) -> str:
+    return ":".join(sorted((user_a, user_b)))
+
+
+def conversation_members(conv_id: str) -> list[str]:
+    return conv_id.split(":")
+
+
+async def record_message(db, message: dict, content: str) -> None:
+    """
+    Count `message` as unread for the receiver and move the thread's preview to
+    it, unless a newer message already holds the preview. Concurrent sends can
+    commit out of order.
+    """
+    sender, receiver = message["senderId"], message["receiverId"]
+    created = message["createdAt"]
+    newer = {"$lt": [{"$ifNull": ["$updatedAt", None]}, created]}
+    fields: dict = {
+        "participants": {"$ifNull": ["$participants", {"$literal": sorted({sender, receiver})}]},
+        "lastMessage": {"$cond": [newer, {"$literal": {
+            "id": message["_id"],
+            "senderId": sender,
+            "preview": encrypt_data(content[:PREVIEW_CHARS]),
+            "createdAt": created,
+        }}, "$lastMessage"]},
+        "updatedAt": {"$cond": [newer, created, "$updatedAt"]},
+    }
+    if receiver != sender:
+        fields[f"unread.{receiver}"] = {"$add": [{"$ifNull": [f"$unread.{receiver}", 0]}, 1]}
+    await db[CONVERSATIONS].update_one({"_id": message["conversationId"]}, [{"$set": fields}], upsert=True)
+
+
+async def decrement_unread(db, conv_id: str, user_id: str, count: int) -> None:
+    """Take `count` newly read messages off a user's unread counter, never below zero."""
+    if count <= 0:
+        return
+    field = f"unread.{user_id}"
+    await db[CONVERSATIONS].update_one(
+        {"_id": conv_id},
+        [{"$set": {field: {"$max": [0, {"$subtract": [{"$ifNull": [f"${field}", 0]}, count]}]}}}],
+    )
+
+
+async def reconcile_conversations(db) -> int:
+    """
+    Rebuild every conversation from the messages collection, first assigning a
+    `conversationId` to messages written before threads existed.
+    """
+    legacy = db["messages"].aggregate([
+        {"$match": {"conversationId": {"$exists": False}, "receiverId": {"$nin": [None, ""]}}},
+        {"$group": {"_id": {"s": "$senderId", "r": "$receiverId"}}},
+    ])
+    async for row in legacy:
+        pair = row["_id"]
+        await db["messages"].update_many(
+            {"senderId": pair["s"], "receiverId": pair["r"], "conversationId": {"$exists": False}},
+            {"$set": {"conversationId": conversation_id(pair["s"], pair["r"])}},
+        )
+
+    latest = db["messages"].aggregate([
+        {"$match": {"conversationId": {"$exists": True}}},
+        {"$sort": {"conversationId": 1, "createdAt": -1, "_id": -1}},
+        {"$group": {"_id": "$conversationId", "last": {"$first": "$$ROOT"}}},
+    ])
+    threads: dict[str, dict] = {}
+    async for row in latest:
+        last = row["last"]
+        threads[row["_id"]] = {
+            "participants": sorted(set(conversation_members(row["_id"]))),
+            "lastMessage": {
+                "id": last["_id"],
+                "senderId": last["senderId"],
+                "preview": encrypt_data((decrypt_data(last.get("content")) or "")[:PREVIEW_CHARS]),
+                "createdAt": last["createdAt"],
+            },
+            "updatedAt": last["createdAt"],
+            "unread": {},
+        }
+
+    unread = db["messages"].aggregate([
+        {"$match": {
+            "conversationId": {"$exists": True},
+            "read": False,
+            "$expr": {"$ne": ["$senderId", "$receiverId"]},
+        }},
+        {"$group": {"_id": {"c": "$conversationId", "u": "$receiverId"}, "count": {"$sum": 1}}},
+    ])
+    async for row in unread:
+        thread = threads.get(row["_id"]["c"])
+        if thread and row["_id"]["u"] in thread["participants"]:
+            thread["unread"][row["_id"]["u"]] = row["count"]
+
+    ops = [UpdateOne({"_id": cid}, {"$set": doc}, upsert=True) for cid, doc in threads.items()]
+    if ops:
+        await db[CONVERSATIONS].bulk_write(ops, ordered=False)
+    logger.info(f"Reconciled {len(ops)} conversations.")
+    return len(ops)
+
+
+def unread_for(conv: dict, user_id: str) -> int:
+    return max(0, (conv.get("unread") or {}).get(user_id, 0))
@@ -0,0 +1,355 @@
+"""
+Study eligibility criteria, compiled.
+
+A study's `minAge`/`maxAge`, `gender`, `regions` and `eligibilityRules` are
+compiled once into an `EligibilityPredicate`: a flat list of checks over a
+normalized screener response. Predicates are cached per study and
+`eligibilityVersion`, which `apply_study_update` bumps whenever a criterion
+is set to a different value. Each evaluation reads the current version straight from the
+database (a single-field read, not the shared study cache), so every worker
+switches to amended criteria on its next screener. The criteria themselves
+are only fetched when that version is not cached yet.
+
+Screener answers are matched case-insensitively. Booleans and "true"/"false"
+count as "yes"/"no", and an `expectedAnswer` list accepts any of its values.
+INCLUSION rules must match and EXCLUSION rules must not.
+
+The screener only always collects `age` and a free-text `location`. Any other
+criterion whose answer key is absent from a response is skipped, not failed.
+Gender and region are only checked when the response carries them. The
+location is split on commas and whitespace, and a region passes only if all of
+its words appear there as whole words ("us" does not match "Russia"). A rule
+answered but left blank fails if it is required.
+
+`reevaluate_study` re-screens every LEAD and SCREENED participant of a study
+against its current criteria, streaming through them in chunks. It promotes
+leads who now qualify and records the verdict on each screener, but never
+demotes a SCREENED participant.
+"""
+import asyncio
+import json
+import re
+from typing import Any, Callable, Iterable, Optional
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, ReturnDocument, UpdateOne
+
+from app.config import get_settings
+from app.database import register_indexes, register_query_shape
+from app.utils.cache import TTLCache
+from app.utils.logger import logger
+from app.utils.participants import invalidate_participant
+from app.utils.security import decrypt_bulk
+
+settings = get_settings()
+
+CRITERIA_FIELDS = ("minAge", "maxAge", "gender", "regions", "eligibilityRules")
+SCREENING_STATUSES = ("LEAD", "SCREENED")
+AGE_KEYS = ("age",)
+GENDER_KEYS = ("gender", "sex")
+REGION_KEYS = ("country", "region", "location")
+ANY_GENDER = "all"
+ANY_REGION = "global"
+_TOKEN_SPLIT = re.compile(r"[\s,;/]+")
+
+register_indexes(
+    "screenerResponses",
+    IndexModel([("participantId", ASCENDING), ("studyId", ASCENDING), ("completedAt", ASCENDING)]),
+)
+register_query_shape("participants", {"studyId": "", "status": {"$in": ["LEAD", "SCREENED"]}}, [("_id", 1)])
+
+_predicates = TTLCache(maxsize=settings.ELIGIBILITY_CACHE_MAX_ENTRIES, ttl=settings.ELIGIBILITY_CACHE_TTL_SECONDS)
+
+# Re-evaluations started by study updates; held so they are not garbage-collected mid-run
+_running: set[asyncio.Task] = set()
+
+
+def _norm(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = str(value).strip().lower()
+    return {"true": "yes", "false": "no"}.get(text, text) or None
+
+
+def _answers(responses: dict) -> dict[str, Any]:
+    """Responses keyed by normalized question text."""
+    return {str(k).strip().lower(): v for k, v in (responses or {}).items()}
+
+
+def _first(answers: dict, keys: Iterable[str]) -> Any:
+    for key in keys:
+        if answers.get(key) not in (None, ""):
+            return answers[key]
+    return None
+
+
+def _age(answers: dict) -> Optional[float]:
+    try:
+        return float(_first(answers, AGE_KEYS))
+    except (TypeError, ValueError):
+        return None
+
+
+# Each check returns True when the (normalized) answers pass it
+Check = Callable[[dict], bool]
+
+
+def _age_check(min_age: Optional[int], max_age: Optional[int]) -> Check:
+    def check(answers: dict) -> bool:
+        age = _age(answers)
+        if age is None:
+            return False
+        return (min_age is None or age >= min_age) and (max_age is None or age <= max_age)
+    return check
+
+
+def _choice_check(keys: tuple, allowed: frozenset) -> Check:
+    def check(answers: dict) -> bool:
+        answer = _norm(_first(answers, keys))
+        return answer is None or answer in allowed
+    return check
+
+
+def _tokens(text: str) -> frozenset:
+    return frozenset(_TOKEN_SPLIT.split(text)) - {""}
+
+
+def _region_check(regions: frozenset) -> Check:
+    # Location is free text ("San Jose, California, USA"): compare whole words, not substrings
+    wanted = [_tokens(region) for region in regions]
+
+    def check(answers: dict) -> bool:
+        answer = _norm(_first(answers, REGION_KEYS))
+        if answer is None:
+            return True
+        words = _tokens(answer)
+        return any(region <= words for region in wanted)
+    return check
+
+
+def _rule_check(rule: dict) -> Optional[Check]:
+    key = str(rule.get("question") or "").strip().lower()
+    if not key:
+        return None
+    expected = rule.get("expectedAnswer")
+    accepted = frozenset(_norm(v) for v in (expected if isinstance(expected, list) else [expected])) - {None}
+    exclusion = str(rule.get("ruleType", "INCLUSION")).upper() == "EXCLUSION"
+    required = rule.get("isRequired", True)
+
+    def check(answers: dict) -> bool:
+        if key not in answers:
+            return True  # Not asked by this screener
+        answer = _norm(answers[key])
+        if answer is None:
+            return not required
+        return (answer in accepted) != exclusion
+    return check
+
+
+class EligibilityPredicate:
+    """A study's criteria compiled into checks; call it with screener responses."""
+
+    def __init__(self, checks: list[tuple[str, Check]]):
+        self.checks = checks
+
+    def failures(self, responses: dict) -> list[str]:
+        """Descriptions of the criteria `responses` fail (empty when eligible)."""
+        answers = _answers(responses)
+        return [label for label, check in self.checks if not check(answers)]
+
+    def __call__(self, responses: dict) -> bool:
+        answers = _answers(responses)
+        return all(check(answers) for _, check in self.checks)
+
+    def evaluate_many(self, responses: Iterable[dict]) -> list[list[str]]:
+        """`failures` for each of a batch of responses."""
+        return [self.failures(r) for r in responses]
+
+
+def compile_criteria(study: dict) -> EligibilityPredicate:
+    checks: list[tuple[str, Check]] = []
+    min_age, max_age = study.get("minAge", 18), study.get("maxAge", 100)
+    if min_age is not None or max_age is not None:
+        checks.append((f"age {min_age}-{max_age}", _age_check(min_age, max_age)))
+
+    gender = _norm(study.get("gender", "All"))
+    if gender and gender != ANY_GENDER:
+        checks.append((f"gender {study['gender']}", _choice_check(GENDER_KEYS, frozenset({gender}))))
+
+    regions = frozenset(_norm(r) for r in (study.get("regions") or []) if isinstance(r, str)) - {None}
+    if regions and ANY_REGION not in regions:
+        checks.append(("region", _region_check(regions)))
+
+    for rule in study.get("eligibilityRules") or []:
+        if isinstance(rule, dict):
+            check = _rule_check(rule)
+            if check:
+                checks.append((str(rule["question"]), check))
+    return EligibilityPredicate(checks)
+
+
+def _study_query(study_ref: str) -> dict:
+    if ObjectId.is_valid(study_ref):
+        return {"$or": [{"_id": ObjectId(study_ref)}, {"slug": study_ref}]}
+    return {"slug": study_ref}
+
+
+async def get_predicate(db, study_ref: Optional[str]) -> tuple[Optional[dict], Optional[EligibilityPredicate]]:
+    """
+    The study (criteria fields and slug) and its compiled criteria. The current
+    `eligibilityVersion` is read uncached; criteria are compiled once per version.
+    """
+    if not study_ref:
+        return None, None
+    head = await db["studies"].find_one(_study_query(study_ref), {"eligibilityVersion": 1})
+    if not head:
+        return None, None
+    key = (str(head["_id"]), head.get("eligibilityVersion", 0))
+    cached = _predicates.get(key)
+    if cached is None:
+        study = await db["studies"].find_one(
+            {"_id": head["_id"]}, {field: 1 for field in (*CRITERIA_FIELDS, "slug", "eligibilityVersion")},
+        )
+        if not study:
+            return None, None
+        cached = (study, compile_criteria(study))
+        _predicates.set(key, cached)
+    return cached
+
+
+def invalidate_eligibility(study_id) -> None:
+    """Drop a study's compiled criteria after it is written."""
+    study_id = str(study_id)
+    _predicates.discard_where(lambda key, _: key[0] == study_id)
+
+
+async def apply_study_update(db, study_id: ObjectId, updates: dict) -> Optional[dict]:
+    """
+    `$set` `updates` on a study and return the stored document (None if there is
+    no such study). If a criterion now holds a different value than before the
+    write, bump `eligibilityVersion` and re-screen participants in the background.
+    """
+    updates = {k: v for k, v in updates.items() if k != "eligibilityVersion"}
+    # The pre-image of this very write, so concurrent updates each see what they changed
+    before = await db["studies"].find_one_and_update(
+        {"_id": study_id}, {"$set": updates},
+        projection={field: 1 for field in CRITERIA_FIELDS},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if before is None:
+        return None
+    if any(field in updates and updates[field] != before.get(field) for field in CRITERIA_FIELDS):
+        await db["studies"].update_one({"_id": study_id}, {"$inc": {"eligibilityVersion": 1}})
+        invalidate_eligibility(study_id)
+        schedule_reevaluation(db, str(study_id))
+    return await db["studies"].find_one({"_id": study_id})
+
+
+# ─── Re-evaluation ────────────────────────────────────────────────────────────
+
+async def _latest_responses(db, participant_ids: list[str], refs: list[str]) -> dict[str, dict]:
+    """Each participant's most recent screener for the study, decrypted."""
+    pipeline = [
+        {"$match": {"participantId": {"$in": participant_ids}, "studyId": {"$in": refs}}},
+        {"$sort": {"completedAt": -1}},
+        {"$group": {"_id": "$participantId", "screenerId": {"$first": "$_id"}, "responses": {"$first": "$responses"}}},
+    ]
+    rows = await db["screenerResponses"].aggregate(pipeline).to_list(None)
+    payloads = await decrypt_bulk(row.get("responses") for row in rows)
+    latest = {}
+    for row, payload in zip(rows, payloads):
+        try:
+            responses = json.loads(payload) if isinstance(payload, str) else payload
+        except ValueError:
+            continue
+        if isinstance(responses, dict):
+            latest[row["_id"]] = {"screenerId": row["screenerId"], "responses": responses}
+    return latest
+
+
+async def _reevaluate_chunk(db, predicate: EligibilityPredicate, refs: list[str], chunk: list[dict]) -> dict:
+    latest = await _latest_responses(db, [str(p["_id"]) for p in chunk], refs)
+    screened = [p for p in chunk if str(p["_id"]) in latest]
+    verdicts = predicate.evaluate_many(latest[str(p["_id"])]["responses"] for p in screened)
+
+    participant_ops, screener_ops, moved = [], [], []
+    for p, failed in zip(screened, verdicts):
+        screener_ops.append(UpdateOne(
+            {"_id": latest[str(p["_id"])]["screenerId"]},
+            {"$set": {"isEligible": not failed, "failedCriteria": failed}},
+        ))
+        # Only promote: screener answers do not yet cover every criterion a study can set
+        if not failed and p.get("status") == "LEAD":
+            # Guard on the old status so a participant who moved on meanwhile is left alone
+            participant_ops.append(UpdateOne(
+                {"_id": p["_id"], "status": "LEAD"}, {"$set": {"status": "SCREENED"}},
+            ))
+            moved.append(p["_id"])
+
+    if screener_ops:
+        await db["screenerResponses"].bulk_write(screener_ops, ordered=False)
+    changed = 0
+    if participant_ops:
+        result = await db["participants"].bulk_write(participant_ops, ordered=False)
+        changed = result.modified_count
+    return {"evaluated": len(screened), "moved": moved, "changed": changed}
+
+
+async def reevaluate_study(db, study_ref: str) -> dict:
+    """
+    Re-screen the study's LEAD and SCREENED participants against its current
+    criteria, `ELIGIBILITY_REEVALUATE_BATCH_SIZE` at a time. Participants
+    without a screener for the study are left as they are.
+    """
+    study, predicate = await get_predicate(db, study_ref)
+    if not study:
+        return {"evaluated": 0, "changed": 0}
+    refs = list({str(study["_id"]), study.get("slug")} - {None})
+    batch_size = settings.ELIGIBILITY_REEVALUATE_BATCH_SIZE
+
+    evaluated = changed = 0
+    cursor = db["participants"].find(
+        {"studyId": {"$in": refs}, "status": {"$in": list(SCREENING_STATUSES)}}, {"status": 1},
+    ).sort("_id", ASCENDING).batch_size(batch_size)
+    chunk: list[dict] = []
+
+    async def _flush(chunk: list[dict]) -> None:
+        nonlocal evaluated, changed
+        result = await _reevaluate_chunk(db, predicate, refs, chunk)
+        evaluated += result["evaluated"]
+        changed += result["changed"]
+        for participant_id in result["moved"]:
+            invalidate_participant(participant_id=participant_id)
+
+    async for p in cursor:
+        chunk.append(p)
+        if len(chunk) >= batch_size:
+            await _flush(chunk)
+            chunk = []
+    if chunk:
+        await _flush(chunk)
+
+    # Only LEAD -> SCREENED promotions are written, so the modified count is the exact counter delta
+    if changed:
+        await db["studies"].update_one(
+            {"_id": study["_id"]},
+            {"$inc": {"participantCounts.LEAD": -changed, "participantCounts.SCREENED": changed}},
+        )
+    logger.info(f"Re-evaluated eligibility of {evaluated} participants of study {study['_id']}; {changed} changed status.")
+    return {"evaluated": evaluated, "changed": changed}
+
+
+def schedule_reevaluation(db, study_ref: str) -> None:
+    """Run `reevaluate_study` in the background (after criteria are amended)."""
+    async def _run():
+        try:
+            await reevaluate_study(db, study_ref)
+        except Exception as e:
+            logger.error(f"Eligibility re-evaluation failed for study {study_ref}: {str(e)}")
+
+    task = asyncio.create_task(_run())
+    _running.add(task)
+    task.add_done_callback(_running.discard)
@@ -1,8 +1,8 @@
 import logging
-import smtplib
-from email.message import EmailMessage
 from typing import Optional
 from app.config import get_settings
+from app.database import get_db
+from app.utils.email_outbox import enqueue_email
 
 logger = logging.getLogger(__name__)
 
@@ -13,47 +13,18 @@ async def send_email_notification(
     html: Optional[str] = None
 ):
     """
-    Utility for sending emails securely utilizing SMTP credentials from .env.
+    Queues an email in the outbox; the background dispatcher delivers it over
+    pooled SMTP connections using the credentials from .env.
     """
-    # Still print for debugging purposes in case SMTP fails
-    print(f"\n" + "="*50)
-    print(f"[MAIL] EMAIL PREPARED FOR: {to_email}")
-    print(f"[SUBJ] SUBJECT: {subject}")
-    print(f"[BODY] BODY:\n{body}")
-    print("="*50 + "\n")
-    
-    settings = get_settings()
-    host = settings.SMTP_HOST or "smtp.gmail.com"
-    port = settings.SMTP_PORT
-    user = settings.SMTP_EMAIL
-    password = settings.SMTP_PASSWORD
-    
-    if not user or not password:
-        logger.warning(f"SMTP credentials missing. Mocked email to {to_email} only.")
-        return True
-        
+    # Bodies can carry PHI and reset codes; the outbox keeps them, the log must not
+    logger.debug(f"Queuing email to {to_email}: {subject}")
+
     try:
-        msg = EmailMessage()
-        msg["Subject"] = subject
-        msg["From"] = f"MusB Research <{user}>"
-        msg["To"] = to_email
-        msg.set_content(body)
-        
-        if html:
-            msg.add_alternative(html, subtype="html")
-            
-        with smtplib.SMTP(host, port) as server:
-            if port == 587:
-                 server.starttls()
-            server.login(str(user), str(password))
-            server.send_message(msg)
-            
-        logger.info(f"Notification email successfully dispatched to {to_email}")
-        return True
+        await enqueue_email(get_db(), to_email, subject, body, html=html)
     except Exception as e:
-        logger.error(f"Failed to send email to {to_email}: {str(e)}")
-        # We return True anyway to not block the main workflow, but logs capture the error
-        return True
+        logger.error(f"Failed to queue email to {to_email}: {str(e)}")
+    # We return True regardless to not block the main workflow, but logs capture the error
+    return True
 
 async def notify_coordinator_new_message(
     coordinator_email: str,
@@ -0,0 +1,242 @@
+"""
+Durable email outbox.
+
+Routes never talk to SMTP: `enqueue_email` stores the message in the
+`email_outbox` collection and returns. `EmailDispatcher` runs in the
+background of every worker, claims due messages atomically (so several
+workers can share one outbox), and delivers them over a small pool of
+authenticated SMTP connections driven from worker threads.
+
+Failed deliveries are retried with exponential backoff until
+`EMAIL_MAX_ATTEMPTS`, after which the message is marked FAILED. Each message
+records its status, attempt count and last error.
+
+For local testing, point SMTP_HOST/SMTP_PORT at a stand-in server such as
+`python -m aiosmtpd -n -l localhost:8025`. Without credentials the pool
+connects unauthenticated.
+"""
+import asyncio
+import smtplib
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from typing import Optional
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+
+from app.config import get_settings
+from app.database import register_indexes
+from app.utils.logger import logger
+from app.utils.security import encrypt_data, decrypt_data
+
+settings = get_settings()
+
+OUTBOX = "email_outbox"
+
+register_indexes(
+    OUTBOX,
+    IndexModel([("status", ASCENDING), ("nextAttemptAt", ASCENDING)]),
+    IndexModel([("status", ASCENDING), ("lockedUntil", ASCENDING)]),
+)
+
+# A claimed message whose worker died becomes claimable again after this lease
+CLAIM_LEASE_SECONDS = 120
+
+
+def _smtp_configured() -> bool:
+    return bool(settings.SMTP_HOST or (settings.SMTP_EMAIL and settings.SMTP_PASSWORD))
+
+
+async def enqueue_email(db, to_email: str, subject: str, body: str, html: Optional[str] = None) -> str:
+    """Store a message in the outbox for background delivery; returns its id."""
+    now = datetime.now(timezone.utc)
+    result = await db[OUTBOX].insert_one({
+        "to": to_email,
+        "subject": subject,
+        # Bodies carry OTP codes and temporary passwords: keep them encrypted at rest
+        "body": encrypt_data(body),
+        "html": encrypt_data(html) if html else None,
+        "status": "PENDING",
+        "attempts": 0,
+        "nextAttemptAt": now,
+        "createdAt": now,
+    })
+    email_dispatcher.wake()
+    return str(result.inserted_id)
+
+
+# ─── SMTP Connection Pool ─────────────────────────────────────────────────────
+
+class SMTPPool:
+    """
+    A bounded pool of logged-in SMTP connections. All smtplib calls block, so
+    they run via `asyncio.to_thread`; a connection is used by one send at a time.
+    """
+
+    def __init__(self, size: int):
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(size)
+
+    def _connect(self) -> smtplib.SMTP:
+        host = settings.SMTP_HOST or "smtp.gmail.com"
+        server = smtplib.SMTP(host, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SECONDS)
+        if settings.SMTP_PORT == 587:
+            server.starttls()
+        if settings.SMTP_EMAIL and settings.SMTP_PASSWORD:
+            server.login(str(settings.SMTP_EMAIL), str(settings.SMTP_PASSWORD))
+        return server
+
+    @staticmethod
+    def _is_alive(server: smtplib.SMTP) -> bool:
+        try:
+            return server.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def _close(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _send_blocking(self, server: Optional[smtplib.SMTP], msg: EmailMessage) -> smtplib.SMTP:
+        if server is not None and not self._is_alive(server):
+            self._close(server)
+            server = None
+        try:
+            server = server or self._connect()
+            server.send_message(msg)
+        except Exception:
+            # Never return a connection in an unknown state to the pool
+            if server is not None:
+                self._close(server)
+            raise
+        return server
+
+    async def send(self, msg: EmailMessage) -> None:
+        async with self._slots:
+            idle = None if self._idle.empty() else self._idle.get_nowait()
+            server = await asyncio.to_thread(self._send_blocking, idle, msg)
+            self._idle.put_nowait(server)
+
+    async def close(self) -> None:
+        while not self._idle.empty():
+            await asyncio.to_thread(self._close, self._idle.get_nowait())
+
+
+# ─── Dispatcher ───────────────────────────────────────────────────────────────
+
+def _build_message(doc: dict) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = doc["subject"]
+    msg["From"] = f"MusB Research <{settings.SMTP_EMAIL or settings.EMAIL_FROM}>"
+    msg["To"] = doc["to"]
+    msg.set_content(decrypt_data(doc["body"]) or "")
+    if doc.get("html"):
+        msg.add_alternative(decrypt_data(doc["html"]), subtype="html")
+    return msg
+
+
+def _backoff(attempts: int) -> timedelta:
+    delay = settings.EMAIL_RETRY_BASE_SECONDS * (2 ** (attempts - 1))
+    return timedelta(seconds=min(delay, settings.EMAIL_RETRY_MAX_SECONDS))
+
+
+class EmailDispatcher:
+    """Background task that drains the outbox through an `SMTPPool`."""
+
+    def __init__(self, poll_interval: float):
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._pool: Optional[SMTPPool] = None
+
+    def wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _claim(self, db) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        return await db[OUTBOX].find_one_and_update(
+            {"$or": [
+                {"status": "PENDING", "nextAttemptAt": {"$lte": now}},
+                {"status": "SENDING", "lockedUntil": {"$lte": now}},
+            ]},
+            {"$set": {"status": "SENDING", "lockedUntil": now + timedelta(seconds=CLAIM_LEASE_SECONDS)}},
+            sort=[("nextAttemptAt", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def _deliver(self, db, doc: dict) -> None:
+        now = datetime.now(timezone.utc)
+        attempts = doc.get("attempts", 0) + 1
+        try:
+            if _smtp_configured():
+                await self._pool.send(_build_message(doc))
+            else:
+                logger.warning(f"SMTP not configured. Mocked email to {doc['to']} only.")
+        except Exception as e:
+            failed = attempts >= settings.EMAIL_MAX_ATTEMPTS
+            await db[OUTBOX].update_one({"_id": doc["_id"]}, {
+                "$set": {
+                    "status": "FAILED" if failed else "PENDING",
+                    "attempts": attempts,
+                    "lastError": str(e),
+                    "nextAttemptAt": now + _backoff(attempts),
+                },
+                "$unset": {"lockedUntil": ""},
+            })
+            log = logger.error if failed else logger.warning
+            log(f"Email to {doc['to']} failed (attempt {attempts}): {str(e)}")
+            return
+
+        await db[OUTBOX].update_one({"_id": doc["_id"]}, {
+            "$set": {"status": "SENT", "attempts": attempts, "sentAt": now},
+            "$unset": {"lockedUntil": "", "lastError": ""},
+        })
+        logger.info(f"Notification email successfully dispatched to {doc['to']}")
+
+    async def _drain(self, db) -> None:
+        in_flight: set[asyncio.Task] = set()
+        while True:
+            while len(in_flight) >= settings.SMTP_POOL_SIZE:
+                _, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            doc = await self._claim(db)
+            if doc is None:
+                break
+            in_flight.add(asyncio.create_task(self._deliver(db, doc)))
+        if in_flight:
+            await asyncio.wait(in_flight)
+
+    async def _run(self, db) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._drain(db)
+            except Exception as e:
+                logger.error(f"Email outbox dispatch failed: {str(e)}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, db) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._pool = SMTPPool(settings.SMTP_POOL_SIZE)
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pool:
+            await self._pool.close()
+            self._pool = None
+        self._wakeup = None
+
+
+email_dispatcher = EmailDispatcher(settings.EMAIL_OUTBOX_POLL_SECONDS)
@@ -0,0 +1,79 @@
+"""
+Request-scoped batch loaders.
+
+Mappers call `loader.load(key)` instead of issuing their own `find_one`. Keys
+requested in the same event-loop tick are coalesced and resolved with a
+single `$in` query, so mapping a page of N documents costs one round trip per
+collection instead of N.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Iterable, Optional
+from bson import ObjectId
+from fastapi import Depends
+
+from app.database import get_db
+from app.utils.studies import STUDY_SUMMARY_FIELDS, resolve_studies
+
+
+class DataLoader:
+    """Coalesces `load()` calls made in the same tick into one batch call."""
+
+    def __init__(self, batch_fn: Callable[[list[str]], Awaitable[dict[str, Any]]]):
+        self._batch_fn = batch_fn
+        self._futures: dict[str, asyncio.Future] = {}
+        self._pending: list[str] = []
+
+    def load(self, key: Optional[str]) -> "asyncio.Future[Optional[dict]]":
+        loop = asyncio.get_running_loop()
+        if not key:
+            future = loop.create_future()
+            future.set_result(None)
+            return future
+        if key in self._futures:
+            return self._futures[key]
+
+        future = loop.create_future()
+        self._futures[key] = future
+        self._pending.append(key)
+        if len(self._pending) == 1:
+            loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+        return future
+
+    async def load_many(self, keys: Iterable[Optional[str]]) -> list[Optional[dict]]:
+        return list(await asyncio.gather(*(self.load(k) for k in keys)))
+
+    async def _dispatch(self) -> None:
+        keys, self._pending = self._pending, []
+        try:
+            results = await self._batch_fn(keys)
+        except Exception as e:
+            for key in keys:
+                self._futures.pop(key).set_exception(e)
+            return
+        for key in keys:
+            self._futures[key].set_result(results.get(key))
+
+
+def _object_ids(keys: list[str]) -> list[ObjectId]:
+    return [ObjectId(k) for k in keys if ObjectId.is_valid(k)]
+
+
+async def _batch_by_id(db, collection: str, keys: list[str]) -> dict[str, dict]:
+    oids = _object_ids(keys)
+    if not oids:
+        return {}
+    return {str(doc["_id"]): doc async for doc in db[collection].find({"_id": {"$in": oids}})}
+
+
+class RequestLoaders:
+    """The set of loaders shared by every mapper within one request."""
+
+    def __init__(self, db):
+        self.users = DataLoader(lambda keys: _batch_by_id(db, "users", keys))
+        # Study summaries (title, coordinator) via the shared, cached resolver
+        self.studies = DataLoader(lambda keys: resolve_studies(db, keys, STUDY_SUMMARY_FIELDS))
+
+
+def get_loaders(db=Depends(get_db)) -> RequestLoaders:
+    """Dependency: one `RequestLoaders` per request (FastAPI caches it per request)."""
+    return RequestLoaders(db)
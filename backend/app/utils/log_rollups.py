@@ -0,0 +1,252 @@
+"""
+Time-bucketed rollups for high-frequency data logs.
+
+Raw entries stay in `dataLogs`, one encrypted document each. For the types in
+LOG_ROLLUP_TYPES (VITALS and SLEEP by default), every numeric field of an
+entry's payload is also folded at ingest into per-participant, per-type
+bucket documents in `dataLogRollups`, one per hour, day and ISO week (UTC),
+each holding `{count, sum, min, max}` per metric. Trend charts read those
+buckets, so they cost O(buckets) instead of fetching and decrypting every
+reading.
+
+An hourly bucket holding a single reading reproduces that reading exactly, so
+bucket metrics are encrypted like the raw logs: each bucket stores its metrics
+as one encrypted JSON document. Mongo cannot `$inc` ciphertext, so buckets are
+updated read-modify-write: read, decrypt, merge, encrypt, and write back
+guarded on the bucket's `rev`. A write that loses a race is retried from a
+fresh read. Only the bucket keys (participant, type, granularity, start) stay
+in plaintext. `rebuild_rollups` recomputes the buckets from the raw logs.
+"""
+import asyncio
+import json
+import math
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterable, Optional
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import DuplicateKeyError
+
+from app.config import get_settings
+from app.database import register_indexes, register_query_shape
+from app.utils.logger import logger
+from app.utils.security import decrypt_bulk, encrypt_bulk
+
+settings = get_settings()
+
+ROLLUPS = "dataLogRollups"
+GRANULARITIES = ("hour", "day", "week")
+WRITE_ATTEMPTS = 5  # Read-modify-write passes before contended buckets are left to rebuild_rollups
+
+register_indexes(
+    ROLLUPS,
+    IndexModel([("participantId", ASCENDING), ("type", ASCENDING), ("granularity", ASCENDING), ("bucketStart", ASCENDING)]),
+)
+register_query_shape(ROLLUPS, {"participantId": "", "type": "VITALS", "granularity": "day"}, [("bucketStart", 1)])
+
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    ts = ts.astimezone(timezone.utc)
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    day = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return day
+    return day - timedelta(days=day.weekday())  # ISO weeks start on Monday
+
+
+def _field(name: str) -> str:
+    # Metric names become field paths: no dots, no leading $
+    return str(name).replace(".", "_").replace("$", "_")
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    elif isinstance(value, str):
+        try:
+            number = float(value)
+        except ValueError:
+            return None
+    else:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def extract_metrics(data: Any) -> dict[str, float]:
+    """Numeric fields of a log payload, including one level of nesting (`{"bp": {"sys": 120}}` -> `bp_sys`)."""
+    metrics: dict[str, float] = {}
+    if not isinstance(data, dict):
+        return metrics
+    for key, value in data.items():
+        if isinstance(value, dict):
+            for sub, sub_value in value.items():
+                number = _number(sub_value)
+                if number is not None:
+                    metrics[_field(f"{key}_{sub}")] = number
+            continue
+        number = _number(value)
+        if number is not None:
+            metrics[_field(key)] = number
+    return metrics
+
+
+def _accumulate(entries: Iterable[tuple[dict, Any]]) -> dict[tuple, dict[str, list]]:
+    """Fold entries into `{(participantId, type, granularity, bucketStart): {metric: [count, sum, min, max]}}`."""
+    buckets: dict[tuple, dict[str, list]] = {}
+    for doc, data in entries:
+        if doc["type"] not in settings.LOG_ROLLUP_TYPES:
+            continue
+        metrics = extract_metrics(data)
+        if not metrics:
+            continue
+        for granularity in GRANULARITIES:
+            key = (doc["participantId"], doc["type"], granularity, bucket_start(doc["loggedAt"], granularity))
+            bucket = buckets.setdefault(key, {})
+            for name, value in metrics.items():
+                acc = bucket.get(name)
+                if acc is None:
+                    bucket[name] = [1, value, value, value]
+                else:
+                    acc[0] += 1
+                    acc[1] += value
+                    acc[2] = min(acc[2], value)
+                    acc[3] = max(acc[3], value)
+    return buckets
+
+
+def _bucket_id(participant_id: str, type_: str, granularity: str, start: datetime) -> str:
+    return f"{participant_id}:{type_}:{granularity}:{int(start.timestamp())}"
+
+
+def _merge(metrics: dict, folded: dict[str, list]) -> dict:
+    for name, (count, total, lo, hi) in folded.items():
+        m = metrics.get(name)
+        if m is None:
+            metrics[name] = {"count": count, "sum": total, "min": lo, "max": hi}
+        else:
+            m["count"] += count
+            m["sum"] += total
+            m["min"] = min(m["min"], lo)
+            m["max"] = max(m["max"], hi)
+    return metrics
+
+
+def _load_metrics(payload: Any) -> dict:
+    try:
+        metrics = json.loads(payload) if isinstance(payload, str) else payload
+    except ValueError:
+        return {}
+    return metrics if isinstance(metrics, dict) else {}
+
+
+async def _write_buckets(db, pending: dict[str, tuple]) -> dict[str, tuple]:
+    """One read-modify-write pass over `pending` buckets; returns those whose write lost a race."""
+    ids = list(pending)
+    stored = {doc["_id"]: doc for doc in await db[ROLLUPS].find({"_id": {"$in": ids}}, {"metrics": 1, "rev": 1}).to_list(None)}
+    payloads = await decrypt_bulk(stored[i].get("metrics") if i in stored else None for i in ids)
+    merged = [json.dumps(_merge(_load_metrics(payload), pending[i][1])) for i, payload in zip(ids, payloads)]
+    ciphertexts = await encrypt_bulk(merged)
+    now = datetime.now(timezone.utc)
+
+    async def _write(bucket_id: str, ciphertext: str) -> bool:
+        doc = stored.get(bucket_id)
+        if doc is None:
+            participant_id, type_, granularity, start = pending[bucket_id][0]
+            try:
+                await db[ROLLUPS].insert_one({
+                    "_id": bucket_id,
+                    "participantId": participant_id,
+                    "type": type_,
+                    "granularity": granularity,
+                    "bucketStart": start,
+                    "metrics": ciphertext,
+                    "rev": 1,
+                    "updatedAt": now,
+                })
+            except DuplicateKeyError:
+                return False
+            return True
+        result = await db[ROLLUPS].update_one(
+            {"_id": bucket_id, "rev": doc.get("rev", 0)},
+            {"$set": {"metrics": ciphertext, "updatedAt": now}, "$inc": {"rev": 1}},
+        )
+        return result.modified_count == 1
+
+    written = await asyncio.gather(*(_write(i, c) for i, c in zip(ids, ciphertexts)))
+    return {i: pending[i] for i, ok in zip(ids, written) if not ok}
+
+
+async def record_rollups(db, entries: Iterable[tuple[dict, Any]]) -> None:
+    """
+    Fold newly stored logs into their buckets. `entries` pairs each inserted
+    document with its plaintext payload. One read and one write per touched bucket.
+    """
+    pending = {_bucket_id(*key): (key, metrics) for key, metrics in _accumulate(entries).items()}
+    try:
+        for _ in range(WRITE_ATTEMPTS):
+            if not pending:
+                return
+            pending = await _write_buckets(db, pending)
+        logger.warning(f"Data log rollups: {len(pending)} buckets still contended; rebuild_rollups repairs them.")
+    except Exception as e:
+        # Raw logs are already stored; rebuild_rollups repairs the view
+        logger.error(f"Data log rollup update failed: {str(e)}")
+
+
+async def map_buckets(docs: list[dict], metric: Optional[str] = None) -> list[dict]:
+    """Decrypt bucket documents into `{bucketStart, metrics: {name: {count, min, max, mean}}}` (only `metric`, if given)."""
+    payloads = await decrypt_bulk(doc.get("metrics") for doc in docs)
+    buckets = []
+    for doc, payload in zip(docs, payloads):
+        metrics = _load_metrics(payload)
+        if metric:
+            metrics = {metric: metrics[metric]} if metric in metrics else {}
+        buckets.append({
+            "bucketStart": doc["bucketStart"],
+            "metrics": {
+                name: {
+                    "count": m["count"],
+                    "min": m["min"],
+                    "max": m["max"],
+                    "mean": round(m["sum"] / m["count"], 3) if m.get("count") else None,
+                }
+                for name, m in metrics.items()
+            },
+        })
+    return buckets
+
+
+async def rebuild_rollups(db, participant_id: Optional[str] = None, batch_size: int = 1000) -> int:
+    """Recompute buckets from the raw logs (all participants, or one); returns the number of logs folded in."""
+    query: dict = {"type": {"$in": list(settings.LOG_ROLLUP_TYPES)}}
+    if participant_id:
+        query["participantId"] = participant_id
+    await db[ROLLUPS].delete_many(query)
+
+    folded = 0
+    batch: list[dict] = []
+    cursor = db["dataLogs"].find(query, {"participantId": 1, "type": 1, "loggedAt": 1, "data": 1}).batch_size(batch_size)
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            folded += await _fold(db, batch)
+            batch = []
+    if batch:
+        folded += await _fold(db, batch)
+    logger.info(f"Rebuilt data log rollups from {folded} entries.")
+    return folded
+
+
+async def _fold(db, docs: list[dict]) -> int:
+    payloads = await decrypt_bulk(doc.get("data") for doc in docs)
+    entries = []
+    for doc, payload in zip(docs, payloads):
+        try:
+            entries.append((doc, json.loads(payload) if isinstance(payload, str) else payload))
+        except ValueError:
+            continue
+    await record_rollups(db, entries)
+    return len(entries)
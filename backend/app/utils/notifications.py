@@ -0,0 +1,197 @@
+"""
+Notification read state and unread counters.
+
+Personal notifications carry their own `status`. Broadcasts (`userId: "ADMIN"`)
+are a single shared document, so who has read them lives per user in the
+`notification_inbox` collection instead: a `readUpTo` watermark (set by
+mark-all-read) plus the ids read individually since then.
+
+Each inbox document also holds an `unread` counter, incremented when a
+notification is created and decremented when one is read, so the bell icon is
+one point read. Broadcast counters are fanned out to the (few) staff users at
+write time; the documents themselves are still fanned out on read. A missing
+counter is rebuilt from the notifications on first use.
+
+Every write that can change a user's unread total also bumps the inbox's
+`rev`, whether or not a counter exists yet. A rebuild reads `rev` before
+counting and stores its count only if `rev` is unchanged. A count that raced
+a new or newly read notification is discarded and taken again.
+
+`readIds` is kept short. Once it passes READ_IDS_COMPACT_AT, `readUpTo`
+advances past every broadcast that is read and the ids it now covers are
+pulled. READ_IDS_MAX hard-caps the list for a user who leaves an old broadcast
+unread indefinitely. The oldest ids then drop off, and those broadcasts count
+as unread again.
+"""
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from app.utils.cache import TTLCache
+from app.utils.logger import logger
+from app.utils.realtime import BROADCAST, BROADCAST_ROLES
+
+INBOX = "notification_inbox"
+READ_IDS_COMPACT_AT = 100
+READ_IDS_MAX = 1000
+RECOUNT_ATTEMPTS = 3
+
+_staff_ids = TTLCache(maxsize=1, ttl=60)
+
+
+async def _staff_user_ids(db) -> list[str]:
+    ids = _staff_ids.get("staff")
+    if ids is None:
+        docs = await db["users"].find({"role": {"$in": list(BROADCAST_ROLES)}}, {"_id": 1}).to_list(None)
+        ids = [str(doc["_id"]) for doc in docs]
+        _staff_ids.set("staff", ids)
+    return ids
+
+
+def _adjust_unread(delta: int) -> list[dict]:
+    """
+    Pipeline update moving an existing counter by `delta` (never below zero) and
+    bumping `rev` either way. A missing counter stays missing.
+    """
+    return [{"$set": {
+        "rev": {"$add": [{"$ifNull": ["$rev", 0]}, 1]},
+        "unread": {"$cond": [
+            {"$eq": [{"$type": "$unread"}, "missing"]},
+            "$$REMOVE",
+            {"$max": [0, {"$add": ["$unread", delta]}]},
+        ]},
+    }}]
+
+
+async def create_notification(db, doc: dict) -> str:
+    """Insert a notification and count it as unread for everyone it is addressed to."""
+    doc = {"status": "UNREAD", "createdAt": datetime.now(timezone.utc), **doc}
+    result = await db["notifications"].insert_one(doc)
+    recipients = await _staff_user_ids(db) if doc["userId"] == BROADCAST else [doc["userId"]]
+    if recipients:
+        # A user without a counter has it rebuilt on their next read; the rev bump fails any rebuild in flight
+        try:
+            await db[INBOX].bulk_write(
+                [UpdateOne({"_id": uid}, _adjust_unread(1), upsert=True) for uid in recipients], ordered=False,
+            )
+        except Exception as e:
+            logger.error(f"Unread counter update failed: {str(e)}")
+    return str(result.inserted_id)
+
+
+def visible_to(user_id: str) -> dict:
+    return {"userId": {"$in": [BROADCAST, user_id]}}
+
+
+async def get_inbox(db, user_id: str) -> dict:
+    inbox = await db[INBOX].find_one({"_id": user_id})
+    return inbox or {"_id": user_id, "readIds": []}
+
+
+def is_read(doc: dict, inbox: dict) -> bool:
+    if doc.get("userId") != BROADCAST:
+        return doc.get("status") == "READ"
+    read_up_to = inbox.get("readUpTo")
+    if read_up_to and doc.get("createdAt") and doc["createdAt"] <= read_up_to:
+        return True
+    return doc["_id"] in inbox.get("readIds", [])
+
+
+async def _count_unread(db, user_id: str, inbox: dict) -> int:
+    personal = await db["notifications"].count_documents({"userId": user_id, "status": "UNREAD"})
+    broadcast_query: dict = {"userId": BROADCAST, "_id": {"$nin": inbox.get("readIds", [])}}
+    if inbox.get("readUpTo"):
+        broadcast_query["createdAt"] = {"$gt": inbox["readUpTo"]}
+    broadcasts = await db["notifications"].count_documents(broadcast_query)
+    return personal + broadcasts
+
+
+async def unread_count(db, user_id: str) -> int:
+    inbox = await db[INBOX].find_one({"_id": user_id}, {"unread": 1})
+    if inbox and "unread" in inbox:
+        return max(0, inbox["unread"])
+    count = 0
+    for _ in range(RECOUNT_ATTEMPTS):
+        inbox = await get_inbox(db, user_id)
+        count = await _count_unread(db, user_id, inbox)
+        # Store the count only if nothing touched the inbox while counting
+        rev = inbox.get("rev")
+        try:
+            result = await db[INBOX].update_one(
+                {"_id": user_id, "rev": rev if rev is not None else {"$exists": False}},
+                {"$set": {"unread": count}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            continue  # The inbox was created meanwhile
+        if result.matched_count or result.upserted_id is not None:
+            return count
+    return count  # Still contended; serve this count and rebuild on the next read
+
+
+async def _decrement(db, user_id: str) -> None:
+    await db[INBOX].update_one({"_id": user_id}, _adjust_unread(-1), upsert=True)
+
+
+async def _compact_read_ids(db, user_id: str) -> None:
+    """Advance `readUpTo` past every broadcast read so far and drop the ids it now covers."""
+    inbox = await get_inbox(db, user_id)
+    read_ids = inbox.get("readIds", [])
+    query: dict = {"userId": BROADCAST, "_id": {"$nin": read_ids}}
+    if inbox.get("readUpTo"):
+        query["createdAt"] = {"$gt": inbox["readUpTo"]}
+    oldest_unread = await db["notifications"].find_one(query, {"createdAt": 1}, sort=[("createdAt", 1)])
+    # Everything strictly older than the oldest unread broadcast has been read
+    covered_query: dict = {"userId": BROADCAST}
+    if oldest_unread:
+        covered_query["createdAt"] = {"$lt": oldest_unread["createdAt"]}
+    newest_read = await db["notifications"].find_one(covered_query, {"createdAt": 1}, sort=[("createdAt", -1)])
+    if not newest_read:
+        return
+    mark = newest_read["createdAt"]
+    covered = await db["notifications"].find(
+        {"_id": {"$in": read_ids}, "createdAt": {"$lte": mark}}, {"_id": 1},
+    ).to_list(None)
+    await db[INBOX].update_one(
+        {"_id": user_id},
+        {"$max": {"readUpTo": mark}, "$pull": {"readIds": {"$in": [doc["_id"] for doc in covered]}}},
+    )
+
+
+async def mark_read(db, user_id: str, notification: dict) -> bool:
+    """Mark one notification read for `user_id`; returns False if it already was."""
+    if notification.get("userId") != BROADCAST:
+        flipped = await db["notifications"].find_one_and_update(
+            {"_id": notification["_id"], "status": "UNREAD"},
+            {"$set": {"status": "READ"}},
+            projection={"_id": 1},
+        )
+        if flipped is None:
+            return False
+    else:
+        inbox = await get_inbox(db, user_id)
+        if is_read(notification, inbox):
+            return False
+        try:
+            await db[INBOX].update_one(
+                {"_id": user_id, "readIds": {"$ne": notification["_id"]}},
+                {"$push": {"readIds": {"$each": [notification["_id"]], "$slice": -READ_IDS_MAX}}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False  # Read concurrently: the inbox exists and already lists it
+        if len(inbox.get("readIds", [])) + 1 >= READ_IDS_COMPACT_AT:
+            await _compact_read_ids(db, user_id)
+    await _decrement(db, user_id)
+    return True
+
+
+async def mark_all_read(db, user_id: str) -> None:
+    now = datetime.now(timezone.utc)
+    await db["notifications"].update_many({"userId": user_id, "status": "UNREAD"}, {"$set": {"status": "READ"}})
+    # Dropping the counter (rather than zeroing it) means notifications racing this write are recounted
+    await db[INBOX].update_one(
+        {"_id": user_id},
+        {"$set": {"readUpTo": now, "readIds": []}, "$unset": {"unread": ""}, "$inc": {"rev": 1}},
+        upsert=True,
+    )
@@ -1,42 +1,100 @@
-import random
+"""
+One-time passcodes.
+
+Codes are stored as keyed hashes, one per (identifier, purpose), in a store
+selected by OTP_STORE:
+  - "mongo" (default): the `otps` collection, shared by every worker; a TTL
+    index on `expires_at` sweeps stale codes and verification consumes the
+    code atomically with `find_one_and_delete`
+  - "memory": a per-process dict, for tests and single-process development
+"""
+import hashlib
+import hmac
+import secrets
 import string
 from datetime import datetime, timedelta, timezone
+from typing import Optional
+from pymongo import ASCENDING, IndexModel
+
+from app.config import get_settings
+from app.database import get_db, register_indexes
+
+settings = get_settings()
+
+OTP_COLLECTION = "otps"
+
+register_indexes(OTP_COLLECTION, IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0))
+
+
+def _hash_code(key: str, code: str) -> str:
+    return hmac.new(settings.SECRET_KEY.encode(), f"{key}:{code}".encode(), hashlib.sha256).hexdigest()
+
+
+class MemoryOTPStore:
+    def __init__(self):
+        self._codes: dict[str, dict] = {}
+
+    async def save(self, key: str, code_hash: str, expires_at: datetime) -> None:
+        now = datetime.now(timezone.utc)
+        # Sweep expired entries so abandoned codes don't accumulate
+        for stale in [k for k, v in self._codes.items() if v["expires_at"] <= now]:
+            del self._codes[stale]
+        self._codes[key] = {"code_hash": code_hash, "expires_at": expires_at}
+
+    async def consume(self, key: str, code_hash: str) -> bool:
+        data = self._codes.get(key)
+        if not data:
+            return False
+        if datetime.now(timezone.utc) > data["expires_at"]:
+            self._codes.pop(key, None)
+            return False
+        if hmac.compare_digest(data["code_hash"], code_hash):
+            self._codes.pop(key, None)  # One-time use
+            return True
+        return False
+
 
-# Mock storage for OTPs (In-memory for demo, should be Redis/DB in prod)
-otp_store = {}
+class MongoOTPStore:
+    async def save(self, key: str, code_hash: str, expires_at: datetime) -> None:
+        await get_db()[OTP_COLLECTION].replace_one(
+            {"_id": key},
+            {"code_hash": code_hash, "expires_at": expires_at},
+            upsert=True,
+        )
 
-def generate_otp(identifier: str, purpose: str = "LOGIN", length: int = 6) -> str:
+    async def consume(self, key: str, code_hash: str) -> bool:
+        # Match and delete in one step so a code can be used exactly once across workers
+        doc = await get_db()[OTP_COLLECTION].find_one_and_delete({
+            "_id": key,
+            "code_hash": code_hash,
+            "expires_at": {"$gt": datetime.now(timezone.utc)},
+        })
+        return doc is not None
+
+
+def _build_store():
+    if settings.OTP_STORE == "memory":
+        return MemoryOTPStore()
+    return MongoOTPStore()
+
+
+otp_store = _build_store()
+
+
+async def generate_otp(identifier: str, purpose: str = "LOGIN", length: int = 6) -> str:
     """Generate a numeric OTP and store it with an expiry and purpose."""
-    otp = "".join(random.choices(string.digits, k=length))
-    expiry = datetime.now(timezone.utc) + timedelta(minutes=10)
-    
-    # Store with purpose to ensure valid action context
-    otp_store[f"{identifier}:{purpose}"] = {"code": otp, "expires_at": expiry}
-    return otp
+    otp = "".join(secrets.choice(string.digits) for _ in range(length))
+    expiry = datetime.now(timezone.utc) + timedelta(minutes=settings.OTP_TTL_MINUTES)
 
-def verify_otp(identifier: str, code: str, purpose: str = "LOGIN") -> bool:
-    """Verify an OTP for a given identifier and purpose."""
+    # Keyed by purpose to ensure valid action context; a new code replaces the previous one
     key = f"{identifier}:{purpose}"
-    data = otp_store.get(key)
-    if not data:
-        return False
-    
-    expiry = data.get("expires_at")
-    if not expiry:
-        return False
-        
-    if isinstance(expiry, str):
-        try:
-            expiry = datetime.fromisoformat(expiry.replace("Z", "+00:00"))
-        except ValueError:
-            return False
-            
-    if datetime.now(timezone.utc) > expiry:
-        otp_store.pop(key, None)
+    await otp_store.save(key, _hash_code(key, otp), expiry)
+    return otp
+
+
+async def verify_otp(identifier: str, code: Optional[str], purpose: str = "LOGIN") -> bool:
+    """Verify (and consume) an OTP for a given identifier and purpose."""
+    if not code:
         return False
-        
-    if data.get("code") == code:
-        otp_store.pop(key, None) # One-time use
-        return True
-    
-    return False
+    key = f"{identifier}:{purpose}"
+    return await otp_store.consume(key, _hash_code(key, code))
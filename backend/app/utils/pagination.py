@@ -0,0 +1,103 @@
+"""
+Keyset (cursor) pagination.
+
+List endpoints page with `paginate()`: rows are ordered by `(sort_field, _id)`
+and each page hands back an opaque cursor encoding the last row's pair, so
+page N costs one index seek instead of skipping N × limit documents. Indexes
+backing a paginated query should end with `(sort_field, _id)` in the same
+direction. Endpoints that return an envelope put the cursor in `nextCursor`;
+endpoints that return a bare list send it in the `X-Next-Cursor` header.
+"""
+import base64
+from typing import Any, Optional
+import bson
+from fastapi import HTTPException, Response
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import ExecutionTimeout
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Filtered totals are counted with this time budget and omitted if it is exceeded
+COUNT_MAX_TIME_MS = 500
+
+
+def encode_cursor(doc: dict, sort_field: str) -> str:
+    raw = bson.encode({"v": doc.get(sort_field), "id": doc["_id"]})
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple[Any, Any]:
+    try:
+        data = bson.decode(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return data["v"], data["id"]
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _after(sort_field: str, direction: int, value: Any, last_id: Any) -> dict:
+    """Filter for rows strictly after `(value, last_id)`; missing values sort lowest."""
+    op = "$lt" if direction == DESCENDING else "$gt"
+    if value is None:
+        branches = [{sort_field: None, "_id": {op: last_id}}]
+        if direction == ASCENDING:
+            branches.append({sort_field: {"$ne": None}})
+    else:
+        branches = [{sort_field: {op: value}}, {sort_field: value, "_id": {op: last_id}}]
+        if direction == DESCENDING:
+            branches.append({sort_field: None})
+    return {"$or": branches}
+
+
+async def paginate(
+    collection,
+    query: dict,
+    sort_field: str,
+    *,
+    limit: int,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    direction: int = DESCENDING,
+    projection: Optional[dict] = None,
+) -> tuple[list[dict], Optional[str]]:
+    """
+    Fetch one page of `query` ordered by `(sort_field, _id)`. Returns the page
+    and the cursor for the next one (None on the last page). `skip` is only
+    honoured without a cursor, for clients that still page by offset.
+    """
+    filter = after_cursor(query, sort_field, cursor, direction)
+    find = collection.find(filter, projection).sort([(sort_field, direction), ("_id", direction)])
+    if skip and not cursor:
+        find = find.skip(skip)
+    docs = await find.limit(limit + 1).to_list(None)
+    return split_page(docs, sort_field, limit)
+
+
+def after_cursor(query: dict, sort_field: str, cursor: Optional[str], direction: int = DESCENDING) -> dict:
+    """`query` narrowed to rows after `cursor`, for callers building their own pipeline."""
+    if not cursor:
+        return query
+    after = _after(sort_field, direction, *decode_cursor(cursor))
+    return {"$and": [query, after]} if query else after
+
+
+def split_page(docs: list[dict], sort_field: str, limit: int) -> tuple[list[dict], Optional[str]]:
+    """Trim a `limit + 1` fetch to one page and the cursor for the next."""
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, encode_cursor(docs[-1], sort_field)
+    return docs, None
+
+
+async def estimated_total(collection, query: dict) -> Optional[int]:
+    """Total for the first page: collection metadata when unfiltered, else a time-boxed count."""
+    if not query:
+        return await collection.estimated_document_count()
+    try:
+        return await collection.count_documents(query, maxTimeMS=COUNT_MAX_TIME_MS)
+    except ExecutionTimeout:
+        return None
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
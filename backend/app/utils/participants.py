@@ -0,0 +1,60 @@
+"""
+Current-participant resolution.
+
+Almost every participant-facing endpoint starts by loading the caller's
+participant profile. `get_current_participant` resolves it once per request
+from a short-TTL in-process cache; routes that change a participant's status,
+study, arm or profile fields must call `invalidate_participant` after writing.
+"""
+from typing import Optional
+from fastapi import Depends, HTTPException
+
+from app.auth import get_current_user
+from app.config import get_settings
+from app.database import get_db
+from app.models import TokenData
+from app.utils.cache import TTLCache
+
+settings = get_settings()
+
+_participant_cache = TTLCache(
+    maxsize=settings.PARTICIPANT_CACHE_MAX_ENTRIES,
+    ttl=settings.PARTICIPANT_CACHE_TTL_SECONDS,
+)
+
+
+async def resolve_participant(db, user_id: str) -> Optional[dict]:
+    """Return the participant profile owned by `user_id`, if any."""
+    cached = _participant_cache.get(user_id)
+    if cached is not None:
+        return dict(cached)
+    participant = await db["participants"].find_one({"userId": user_id})
+    if participant:
+        _participant_cache.set(user_id, participant)
+        return dict(participant)
+    return None
+
+
+async def get_current_participant(
+    current_user: TokenData = Depends(get_current_user),
+    db=Depends(get_db),
+) -> dict:
+    """Dependency: the authenticated user's participant profile, or 404."""
+    participant = await resolve_participant(db, current_user.user_id)
+    if not participant:
+        raise HTTPException(status_code=404, detail="Participant profile not found")
+    return participant
+
+
+def invalidate_participant(user_id: Optional[str] = None, participant_id=None) -> None:
+    """Drop a cached profile by owning user id and/or participant id."""
+    if user_id:
+        _participant_cache.pop(user_id)
+    if participant_id:
+        participant_id = str(participant_id)
+        _participant_cache.discard_where(lambda _, p: str(p.get("_id")) == participant_id)
+
+
+def invalidate_study_participants(study_id: str) -> None:
+    """Drop every cached profile enrolled in `study_id` (e.g. after a cascade delete)."""
+    _participant_cache.discard_where(lambda _, p: p.get("studyId") == study_id)
@@ -0,0 +1,98 @@
+"""
+Off-loop password hashing.
+
+bcrypt is deliberately slow and would block the event loop for the whole
+hash, so every hash and check runs on a dedicated thread pool (bcrypt
+releases the GIL) capped at BCRYPT_MAX_CONCURRENCY. Excess calls wait in the
+executor queue; how long they waited is tracked for `/api/metrics`.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+import bcrypt
+
+from app.config import get_settings
+
+settings = get_settings()
+
+T = TypeVar("T")
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+
+def _check(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+    except ValueError:
+        # Missing or malformed stored hash
+        return False
+
+
+def hash_rounds(hashed: str) -> Optional[int]:
+    """Work factor encoded in a bcrypt hash (`$2b$<rounds>$...`)."""
+    try:
+        return int(hashed.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    def __init__(self, rounds: int, max_concurrency: int):
+        self.rounds = rounds
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="bcrypt")
+        self._in_flight = 0
+        self._completed = 0
+        self._queue_ms_total = 0.0
+        self._queue_ms_max = 0.0
+
+    async def _run(self, fn: Callable[..., T], *args) -> T:
+        submitted = time.perf_counter()
+        started: list[float] = []
+
+        def _timed() -> T:
+            started.append(time.perf_counter())
+            return fn(*args)
+
+        self._in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, _timed)
+        finally:
+            # Counters are only touched on the event loop; the gap to `started` is time spent queued
+            self._in_flight -= 1
+            if started:
+                waited_ms = (started[0] - submitted) * 1000
+                self._completed += 1
+                self._queue_ms_total += waited_ms
+                self._queue_ms_max = max(self._queue_ms_max, waited_ms)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(_check, password, hashed or "")
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """True when a stored hash was made with a different work factor than configured."""
+        rounds = hash_rounds(hashed)
+        return rounds is not None and rounds != self.rounds
+
+    def metrics(self) -> dict:
+        running = min(self._in_flight, self.max_concurrency)
+        return {
+            "rounds": self.rounds,
+            "running": running,
+            "queued": self._in_flight - running,
+            "completed": self._completed,
+            "avgQueueMs": round(self._queue_ms_total / self._completed, 2) if self._completed else 0.0,
+            "maxQueueMs": round(self._queue_ms_max, 2),
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(settings.BCRYPT_ROUNDS, settings.BCRYPT_MAX_CONCURRENCY)
@@ -1,11 +1,38 @@
-from datetime import datetime, timezone, timedelta
-from typing import Dict, List, Tuple
-from fastapi import Request, HTTPException, status
+"""
+Sliding-window-counter rate limiting.
+
+Each (scope, client) pair keeps two fixed-size counters: the current window
+and the previous one. The effective count is
+`previous * (1 - elapsed / window) + current`, which approximates a true
+sliding window in O(1) time and memory per key.
+
+The auth limits (RATE_LIMITS) keep their counters in a pluggable store
+selected by RATE_LIMIT_STORE:
+  - "memory": per-process LRU (bounded by RATE_LIMIT_MEMORY_MAX_KEYS)
+  - "mongo":  shared by every gunicorn worker, via atomic `$inc` upserts on
+              `rate_limits`, expired by a TTL index
+The app-wide default limit runs on every request, so it always counts in
+memory, per worker, and costs no database round trip.
+
+Clients are identified by `client_ip`. X-Forwarded-For is only trusted for the
+TRUSTED_PROXY_HOPS entries our own proxies append, never the client-supplied
+part of the header.
+"""
+import asyncio
+import math
 import time
+from datetime import datetime, timezone
+from typing import Dict, NamedTuple, Optional
+from fastapi import Request, HTTPException, status
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
-# In-memory store: {ip_address: [(timestamp, endpoint), ...]}
-# Using float timestamp for precision and memory efficiency
-request_log: Dict[str, List[Tuple[float, str]]] = {}
+from app.config import get_settings
+from app.database import get_db, register_indexes
+from app.utils.cache import TTLCache
+from app.utils.logger import logger
+
+settings = get_settings()
 
 # Rate limit configuration (requests per time window)
 RATE_LIMITS = {
@@ -15,49 +42,146 @@ RATE_LIMITS = {
     "/api/auth/verify/check": {"requests": 10, "window_minutes": 15},  # 10 checks per 15 min
 }
 
+# Applies to every request (the app-wide middleware in main.py)
+DEFAULT_LIMIT = {"requests": settings.RATE_LIMIT_DEFAULT_PER_MINUTE, "window_minutes": 1}
+
+RATE_LIMIT_COLLECTION = "rate_limits"
+
+register_indexes(
+    RATE_LIMIT_COLLECTION,
+    IndexModel([("expiresAt", ASCENDING)], expireAfterSeconds=0),
+)
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after: int
+
+
+# ─── Stores ───────────────────────────────────────────────────────────────────
+
+class MemoryStore:
+    """Per-process counters; least recently used keys are evicted first."""
+
+    def __init__(self, max_keys: int):
+        self._counters = TTLCache(maxsize=max_keys)
+
+    async def hit(self, key: str, bucket: int, window: int) -> tuple[int, int]:
+        current = self._counters.get((key, bucket), 0) + 1
+        # A counter is needed for its own window and as the "previous" one after it
+        self._counters.set((key, bucket), current, ttl=2 * window)
+        return self._counters.get((key, bucket - 1), 0), current
+
+
+class MongoStore:
+    """Counters shared by every worker: one small document per key and window."""
+
+    @staticmethod
+    async def _increment(coll, key: str, bucket: int, window: int) -> int:
+        expires_at = datetime.fromtimestamp((bucket + 2) * window, tz=timezone.utc)
+        update = {"$inc": {"count": 1}, "$setOnInsert": {"expiresAt": expires_at}}
+        try:
+            doc = await coll.find_one_and_update(
+                {"_id": f"{key}:{bucket}"}, update, upsert=True, return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Lost a concurrent upsert race: the document exists now
+            doc = await coll.find_one_and_update(
+                {"_id": f"{key}:{bucket}"}, update, return_document=ReturnDocument.AFTER,
+            )
+        return doc["count"]
+
+    async def hit(self, key: str, bucket: int, window: int) -> tuple[int, int]:
+        coll = get_db()[RATE_LIMIT_COLLECTION]
+        current, previous = await asyncio.gather(
+            self._increment(coll, key, bucket, window),
+            coll.find_one({"_id": f"{key}:{bucket - 1}"}, {"count": 1}),
+        )
+        return (previous or {}).get("count", 0), current
+
+
+# ─── Engine ───────────────────────────────────────────────────────────────────
+
+class RateLimiter:
+    def __init__(self, store):
+        self.store = store
+
+    async def hit(self, key: str, limit: int, window: int) -> RateLimitResult:
+        """Count one request against `key` and report whether it is within `limit` per `window` seconds."""
+        now = time.time()
+        bucket = int(now // window)
+        elapsed = now - bucket * window
+        previous, current = await self.store.hit(key, bucket, window)
+        weighted = previous * (1 - elapsed / window) + current
+        if weighted <= limit:
+            return RateLimitResult(True, limit, int(limit - weighted), 0)
+
+        # Time until the previous window's weight has decayed enough, else until the next window
+        if current <= limit and previous > 0:
+            wait = window * (1 - (limit - current) / previous) - elapsed
+        else:
+            wait = window - elapsed
+        return RateLimitResult(False, limit, 0, max(1, math.ceil(wait)))
+
+
+def _build_store():
+    if settings.RATE_LIMIT_STORE == "mongo":
+        return MongoStore()
+    return MemoryStore(settings.RATE_LIMIT_MEMORY_MAX_KEYS)
+
+
+limiter = RateLimiter(_build_store())
+default_limiter = RateLimiter(MemoryStore(settings.RATE_LIMIT_MEMORY_MAX_KEYS))
+
+
+def client_ip(request: Request) -> Optional[str]:
+    """
+    Client address. Behind TRUSTED_PROXY_HOPS reverse proxies it is the entry
+    the outermost proxy appended to X-Forwarded-For; anything to its left was
+    sent by the client and could be forged.
+    """
+    hops = settings.TRUSTED_PROXY_HOPS
+    forwarded = request.headers.get("X-Forwarded-For")
+    if hops > 0 and forwarded:
+        entries = [entry.strip() for entry in forwarded.split(",") if entry.strip()]
+        if entries:
+            return entries[-min(hops, len(entries))]
+    return request.client.host if request.client else None
+
+
+async def _hit(scope: str, ip: str, config: Dict[str, int], limiter: RateLimiter = limiter) -> RateLimitResult:
+    try:
+        return await limiter.hit(f"{scope}|{ip}", config["requests"], config["window_minutes"] * 60)
+    except Exception as e:
+        # Fail open: a store outage must not take authentication down with it
+        logger.error(f"Rate limit store unavailable: {str(e)}")
+        return RateLimitResult(True, config["requests"], config["requests"], 0)
+
 
 async def rate_limit_check(request: Request, endpoint: str) -> None:
     """
-    Robust sliding window rate limiting.
+    Sliding window rate limiting.
     Rejects requests if they exceed limits set in RATE_LIMITS.
     """
-    # Get client IP (handle proxies)
-    ip = request.headers.get("X-Forwarded-For") or request.client.host
+    ip = client_ip(request)
     if not ip:
         return  # Should not happen in proper setup
 
-    now = time.time()
-    
-    # Get config for this endpoint
     config = RATE_LIMITS.get(endpoint, {"requests": 100, "window_minutes": 1})
-    window_seconds = config["window_minutes"] * 60
-    max_requests = config["requests"]
-
-    # Initialize log for this IP if not exists
-    if ip not in request_log:
-        request_log[ip] = []
-
-    # Cleanup old requests for this IP and endpoint to create the sliding window
-    # Filter for the specific endpoint and within the window
-    cutoff = now - window_seconds
-    
-    # We keep other endpoint logs but filter current one
-    current_endpoint_logs = [t for t, ep in request_log[ip] if ep == endpoint and t > cutoff]
-    
-    if len(current_endpoint_logs) >= max_requests:
-        # Calculate when the next request will be allowed
-        earliest_request_time = current_endpoint_logs[0]
-        retry_after = int(earliest_request_time + window_seconds - now)
-        
+    result = await _hit(endpoint, ip, config)
+    if not result.allowed:
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail=f"Too many attempts. Please try again in {retry_after} seconds.",
-            headers={"Retry-After": str(retry_after)}
+            detail=f"Too many attempts. Please try again in {result.retry_after} seconds.",
+            headers={"Retry-After": str(result.retry_after)}
         )
 
-    # Add current request to log
-    request_log[ip].append((now, endpoint))
-    
-    # Periodically cleanup the entire ip log (e.g. if > 100 entries)
-    if len(request_log[ip]) > 100:
-         request_log[ip] = [(t, ep) for t, ep in request_log[ip] if t > (now - 3600)] # Keep only last hour of everything
+
+async def check_default_limit(request: Request) -> Optional[RateLimitResult]:
+    """App-wide per-client limit (per worker); returns None when the request cannot be attributed."""
+    ip = client_ip(request)
+    if not ip:
+        return None
+    return await _hit("*", ip, DEFAULT_LIMIT, default_limiter)
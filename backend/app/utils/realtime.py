@@ -0,0 +1,222 @@
+"""
+Server push for notifications and messages.
+
+Connected clients (SSE or WebSocket, see routes/events.py) subscribe to an
+in-process `EventBus`. Every worker runs its own `RealtimeFeed`, which tails
+inserts into `notifications` and `messages` and publishes them on its local
+bus, so a write made by any worker or node reaches every connection. The feed
+is selected by REALTIME_SOURCE:
+  - "change_stream": Mongo change streams (replica sets and Atlas)
+  - "poll": query for `_id`s newer than the last one seen, only while at
+    least one client is connected on this worker
+  - "auto" (default): change streams, falling back to polling on a
+    standalone server that does not support them
+
+A subscriber that falls more than REALTIME_QUEUE_SIZE events behind is sent
+a single "resync" event telling it to refetch rather than an unbounded backlog.
+"""
+import asyncio
+from datetime import datetime, timezone
+from typing import Optional
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import OperationFailure
+
+from app.config import get_settings
+from app.utils.logger import logger
+from app.utils.security import decrypt_data
+
+settings = get_settings()
+
+WATCHED = ("notifications", "messages")
+
+# `userId` sentinel for notifications addressed to every staff user
+BROADCAST = "ADMIN"
+BROADCAST_ROLES = ("ADMIN", "COORDINATOR", "PI", "DATA_MANAGER", "SUPER_ADMIN")
+
+# Raised by servers that cannot open change streams (standalone mongod)
+CHANGE_STREAMS_UNSUPPORTED = (40573, 40324)
+
+POLL_BATCH = 500
+
+
+def notification_payload(doc: dict) -> dict:
+    return {
+        "id": str(doc["_id"]),
+        "title": doc.get("title", "Notification"),
+        "content": doc.get("content", ""),
+        "type": doc.get("type", "INFO"),
+        "status": doc.get("status", "UNREAD"),
+        "studyId": doc.get("studyId"),
+        "createdAt": doc.get("createdAt", datetime.now(timezone.utc)),
+    }
+
+
+def message_payload(doc: dict) -> dict:
+    return {
+        "id": str(doc["_id"]),
+        "senderId": doc["senderId"],
+        "receiverId": doc.get("receiverId"),
+        "conversationId": doc.get("conversationId"),
+        "content": decrypt_data(doc.get("content")),
+        "read": doc.get("read", False),
+        "createdAt": doc["createdAt"],
+    }
+
+
+# ─── Bus ──────────────────────────────────────────────────────────────────────
+
+class Subscription:
+    def __init__(self, user_id: str, role: Optional[str], queue_size: int):
+        self.user_id = user_id
+        self.role = role
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._lagged = False
+
+    def offer(self, event: dict) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self._lagged = True
+
+    async def next(self, timeout: float) -> Optional[dict]:
+        """The next event, or None if nothing arrived within `timeout` seconds."""
+        if self._lagged:
+            self._lagged = False
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            return {"type": "resync"}
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBus:
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._by_user: dict[str, set[Subscription]] = {}
+        self._staff: set[Subscription] = set()
+
+    def subscribe(self, user_id: str, role: Optional[str]) -> Subscription:
+        sub = Subscription(user_id, role, self.queue_size)
+        self._by_user.setdefault(user_id, set()).add(sub)
+        if role in BROADCAST_ROLES:
+            self._staff.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        subs = self._by_user.get(sub.user_id)
+        if subs is not None:
+            subs.discard(sub)
+            if not subs:
+                del self._by_user[sub.user_id]
+        self._staff.discard(sub)
+
+    def publish(self, user_id: str, event: dict) -> None:
+        targets = self._staff if user_id == BROADCAST else self._by_user.get(user_id, ())
+        for sub in tuple(targets):
+            sub.offer(event)
+
+    def listening(self, user_id: str) -> bool:
+        return bool(self._by_user.get(user_id))
+
+    def __len__(self) -> int:
+        return sum(len(subs) for subs in self._by_user.values())
+
+
+event_bus = EventBus(settings.REALTIME_QUEUE_SIZE)
+
+
+# ─── Feed ─────────────────────────────────────────────────────────────────────
+
+class RealtimeFeed:
+    """Background task that publishes new notifications and messages on the local bus."""
+
+    def __init__(self, bus: EventBus, source: str, poll_interval: float):
+        self.bus = bus
+        self.source = source
+        self.poll_interval = poll_interval
+        self.active_source = source
+        self._task: Optional[asyncio.Task] = None
+        self._resume_token = None
+
+    def _dispatch(self, collection: str, doc: dict) -> None:
+        if collection == "notifications":
+            event = jsonable_encoder({"id": str(doc["_id"]), "type": "notification", "data": notification_payload(doc)})
+            self.bus.publish(doc.get("userId"), event)
+            return
+        # Skip decrypting messages nobody on this worker is listening for
+        recipients = {doc.get("senderId"), doc.get("receiverId")} - {None}
+        if not any(self.bus.listening(uid) for uid in recipients):
+            return
+        event = jsonable_encoder({"id": str(doc["_id"]), "type": "message", "data": message_payload(doc)})
+        for uid in recipients:
+            self.bus.publish(uid, event)
+
+    async def _watch(self, db) -> None:
+        pipeline = [{"$match": {"operationType": "insert", "ns.coll": {"$in": list(WATCHED)}}}]
+        async with db.watch(pipeline, resume_after=self._resume_token) as stream:
+            async for change in stream:
+                self._resume_token = stream.resume_token
+                try:
+                    self._dispatch(change["ns"]["coll"], change["fullDocument"])
+                except Exception as e:
+                    logger.error(f"Realtime dispatch failed: {str(e)}")
+
+    async def _poll(self, db) -> None:
+        # ObjectIds are generated client-side, so this ordering is as good as clock sync between nodes
+        last_seen: dict[str, ObjectId] = {}
+        while True:
+            if not len(self.bus):
+                # Nobody listening: skip the backlog rather than replaying it on the next connect
+                last_seen.clear()
+            for collection in WATCHED:
+                if collection not in last_seen:
+                    last_seen[collection] = ObjectId.from_datetime(datetime.now(timezone.utc))
+                    continue
+                docs = await db[collection].find({"_id": {"$gt": last_seen[collection]}}) \
+                    .sort("_id", 1).limit(POLL_BATCH).to_list(None)
+                for doc in docs:
+                    self._dispatch(collection, doc)
+                if docs:
+                    last_seen[collection] = docs[-1]["_id"]
+            await asyncio.sleep(self.poll_interval)
+
+    async def _run(self, db) -> None:
+        while True:
+            source = self.active_source
+            try:
+                if source == "poll":
+                    await self._poll(db)
+                else:
+                    await self._watch(db)
+            except OperationFailure as e:
+                if source == "auto" and e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    logger.info("Change streams unavailable; realtime feed is polling instead.")
+                    self.active_source = "poll"
+                    continue
+                logger.error(f"Realtime feed failed: {str(e)}")
+                self._resume_token = None
+            except Exception as e:
+                logger.error(f"Realtime feed failed: {str(e)}")
+            await asyncio.sleep(1)
+
+    def start(self, db) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def metrics(self) -> dict:
+        return {"source": self.active_source, "subscribers": len(self.bus)}
+
+
+realtime_feed = RealtimeFeed(event_bus, settings.REALTIME_SOURCE, settings.REALTIME_POLL_SECONDS)
@@ -0,0 +1,182 @@
+"""
+Schedule materialization.
+
+A study's schedule is its `timepoints` (dayOffset + task references) expanded
+against its task definitions. `materialize_schedule` writes the resulting
+task instances for a list of participants, and `materialize_cohort` does it
+for every enrolled participant of a study. Writes are unordered
+`insert_many` batches, and a unique index on
+(participantId, taskId, timepoint) makes re-running either one a no-op for
+instances that already exist. New instances are added to each participant's
+pending compliance counter.
+
+Studies without timepoints fall back to one instance per task definition at
+its own `dueDayOffset`.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterable, Iterable, Optional
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import BulkWriteError
+
+from app.config import get_settings
+from app.database import register_indexes
+from app.utils.compliance import apply_deltas
+from app.utils.logger import logger
+from app.utils.studies import resolve_study
+
+settings = get_settings()
+
+register_indexes(
+    "taskInstances",
+    IndexModel(
+        [("participantId", ASCENDING), ("taskId", ASCENDING), ("timepoint", ASCENDING)],
+        unique=True,
+        # Instances created before timepoints were recorded are left out of the constraint
+        partialFilterExpression={"timepoint": {"$type": "string"}},
+        name="schedule_slot_unique",
+    ),
+)
+
+DUPLICATE_KEY = 11000
+COHORT_STATUSES = ("ENROLLED", "ACTIVE")
+
+
+def _study_refs(study: dict) -> list[str]:
+    """Every value a document may use to reference the study (participants and tasks accept id or slug)."""
+    return list({str(study["_id"]), study.get("slug")} - {None})
+
+
+async def load_schedule(db, study_ref: str) -> tuple[Optional[dict], list[dict]]:
+    """
+    Resolve a study's schedule into slots of
+    `{taskId, timepoint, dayOffset, windowDays}`. Returns the study alongside
+    (None if it does not exist).
+    """
+    study = await resolve_study(db, study_ref, fields=("slug", "timepoints"))
+    if not study:
+        return None, []
+    study_id = str(study["_id"])
+    refs = _study_refs(study)
+    task_defs = await db["tasks"].find({"studyId": {"$in": refs}}).to_list(None)
+
+    # Timepoints may reference a task definition by id or by title
+    by_ref: dict[str, dict] = {}
+    for task in task_defs:
+        by_ref[str(task["_id"])] = task
+        if task.get("title"):
+            by_ref.setdefault(task["title"], task)
+
+    slots = []
+    timepoints = study.get("timepoints") or []
+    for tp in timepoints:
+        for ref in tp.get("tasks", []):
+            task = by_ref.get(ref)
+            if not task:
+                logger.warning(f"Study {study_id} timepoint '{tp.get('name')}' references unknown task '{ref}'")
+                continue
+            slots.append({
+                "taskId": str(task["_id"]),
+                "timepoint": tp.get("name") or f"Day {tp.get('dayOffset', 0)}",
+                "dayOffset": tp.get("dayOffset", 0),
+                "windowDays": task.get("windowDays", 3),
+            })
+    if not timepoints:
+        for task in task_defs:
+            offset = task.get("dueDayOffset", 0)
+            slots.append({
+                "taskId": str(task["_id"]),
+                "timepoint": f"Day {offset}",
+                "dayOffset": offset,
+                "windowDays": task.get("windowDays", 3),
+            })
+    return study, slots
+
+
+def expand_schedule(participant: dict, study_id: str, slots: list[dict], now: datetime) -> list[dict]:
+    """Task instance documents for one participant, anchored on their enrollment date."""
+    anchor = participant.get("enrolledAt") or now
+    if anchor.tzinfo is None:
+        anchor = anchor.replace(tzinfo=timezone.utc)
+    participant_id = str(participant["_id"])
+    instances = []
+    for slot in slots:
+        available = anchor + timedelta(days=slot["dayOffset"])
+        instances.append({
+            "participantId": participant_id,
+            "studyId": study_id,
+            "taskId": slot["taskId"],
+            "timepoint": slot["timepoint"],
+            "availableDate": available,
+            "dueDate": available + timedelta(days=slot["windowDays"]),
+            "status": "PENDING",
+            "createdAt": now,
+        })
+    return instances
+
+
+async def _insert_batch(db, docs: list[dict]) -> int:
+    if not docs:
+        return 0
+    failed: set[int] = set()
+    try:
+        await db["taskInstances"].insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        failed = {err["index"] for err in errors}
+        # Slots that already exist are expected on re-runs; anything else is reported
+        other = [err for err in errors if err.get("code") != DUPLICATE_KEY]
+        if other:
+            logger.error(f"Schedule materialization rejected {len(other)} task instances: {other[0].get('errmsg')}")
+
+    added: dict[str, dict[str, int]] = {}
+    for i, doc in enumerate(docs):
+        if i not in failed:
+            added.setdefault(doc["participantId"], {"pending": 0})["pending"] += 1
+    await apply_deltas(db, added)
+    return len(docs) - len(failed)
+
+
+async def _write(db, study_id: str, slots: list[dict], participants, now: datetime) -> int:
+    created = 0
+    batch: list[dict] = []
+
+    async def _flush() -> None:
+        nonlocal created, batch
+        created += await _insert_batch(db, batch)
+        batch = []
+
+    if isinstance(participants, AsyncIterable):
+        async for participant in participants:
+            batch.extend(expand_schedule(participant, study_id, slots, now))
+            if len(batch) >= settings.SCHEDULE_INSERT_BATCH_SIZE:
+                await _flush()
+    else:
+        for participant in participants:
+            batch.extend(expand_schedule(participant, study_id, slots, now))
+            if len(batch) >= settings.SCHEDULE_INSERT_BATCH_SIZE:
+                await _flush()
+    await _flush()
+    return created
+
+
+async def materialize_schedule(db, study_ref: str, participants: Iterable[dict]) -> int:
+    """Create any missing task instances for `participants` (all in study `study_ref`); returns how many were created."""
+    study, slots = await load_schedule(db, study_ref)
+    if not study or not slots:
+        return 0
+    return await _write(db, str(study["_id"]), slots, participants, datetime.now(timezone.utc))
+
+
+async def materialize_cohort(db, study_ref: str, statuses: Iterable[str] = COHORT_STATUSES) -> int:
+    """Create any missing task instances for every participant of a study in `statuses`."""
+    study, slots = await load_schedule(db, study_ref)
+    if not study or not slots:
+        return 0
+    study_id = str(study["_id"])
+    cursor = db["participants"].find(
+        {"studyId": {"$in": _study_refs(study)}, "status": {"$in": list(statuses)}},
+        {"_id": 1, "enrolledAt": 1},
+    ).batch_size(settings.SCHEDULE_INSERT_BATCH_SIZE)
+    created = await _write(db, study_id, slots, cursor, datetime.now(timezone.utc))
+    logger.info(f"Materialized {created} task instances for study {study_id}.")
+    return created
@@ -1,9 +1,15 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Iterable, Optional, Sequence
 from cryptography.fernet import Fernet
 from app.config import get_settings
 
 settings = get_settings()
 cipher_suite = Fernet(settings.ENCRYPTION_KEY.encode())
 
+_decrypt_pool: Optional[Executor] = None
+
 def encrypt_data(data: str) -> str:
     """Encrypts a string of data."""
     if not data:
@@ -19,3 +25,67 @@ def decrypt_data(encrypted_data: str) -> str:
     except Exception:
         # If decryption fails (e.g., data was not encrypted), return as is
         return encrypted_data
+
+# ─── Bulk Encryption / Decryption ─────────────────────────────────────────────
+
+def decrypt_many(values: Sequence[Optional[str]]) -> list:
+    """Decrypts a batch of strings serially (one pool work item)."""
+    return [decrypt_data(v) for v in values]
+
+def encrypt_many(values: Sequence[Optional[str]]) -> list:
+    """Encrypts a batch of strings serially (one pool work item)."""
+    return [encrypt_data(v) for v in values]
+
+def _get_decrypt_pool() -> Executor:
+    global _decrypt_pool
+    if _decrypt_pool is None:
+        workers = settings.DECRYPT_WORKERS or os.cpu_count() or 1
+        if settings.DECRYPT_POOL == "process":
+            # Child processes rebuild `cipher_suite` from the same settings on import
+            _decrypt_pool = ProcessPoolExecutor(max_workers=workers)
+        else:
+            _decrypt_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="decrypt")
+    return _decrypt_pool
+
+async def _bulk(many, one, values: Iterable[Any], chunk_size: Optional[int]) -> list:
+    values = list(values)
+    positions = [i for i, v in enumerate(values) if isinstance(v, str) and v]
+    if len(positions) <= settings.DECRYPT_INLINE_MAX:
+        return [one(v) if isinstance(v, str) else v for v in values]
+
+    chunk_size = chunk_size or settings.DECRYPT_CHUNK_SIZE
+    inputs = [values[i] for i in positions]
+    loop = asyncio.get_running_loop()
+    pool = _get_decrypt_pool()
+    chunks = await asyncio.gather(*(
+        loop.run_in_executor(pool, many, inputs[start:start + chunk_size])
+        for start in range(0, len(inputs), chunk_size)
+    ))
+    result = list(values)
+    for i, output in zip(positions, (v for chunk in chunks for v in chunk)):
+        result[i] = output
+    return result
+
+async def decrypt_bulk(values: Iterable[Any], chunk_size: Optional[int] = None) -> list:
+    """
+    Decrypts a batch of ciphertexts off the event loop, split into chunks
+    across the decrypt pool. Order is preserved; non-string values are
+    returned untouched. Small batches are decrypted inline.
+    """
+    return await _bulk(decrypt_many, decrypt_data, values, chunk_size)
+
+async def encrypt_bulk(values: Iterable[Any], chunk_size: Optional[int] = None) -> list:
+    """Encrypts a batch of strings the same way `decrypt_bulk` decrypts them (same pool)."""
+    return await _bulk(encrypt_many, encrypt_data, values, chunk_size)
+
+async def decrypt_fields(docs: Sequence[dict], fields: Sequence[str]) -> list[dict]:
+    """Decrypts `fields` of every document in one bulk call; returns one {field: plaintext} per doc."""
+    plain = await decrypt_bulk(doc.get(f) for doc in docs for f in fields)
+    n = len(fields)
+    return [dict(zip(fields, plain[i * n:(i + 1) * n])) for i in range(len(docs))]
+
+def shutdown_decrypt_pool() -> None:
+    global _decrypt_pool
+    if _decrypt_pool is not None:
+        _decrypt_pool.shutdown(wait=False, cancel_futures=True)
+        _decrypt_pool = None
@@ -0,0 +1,157 @@
+"""
+Dashboard statistics.
+
+All admin, super-admin and sponsor KPIs derive from a handful of per-collection
+`$group` counts. `collect_counts` fetches them with one round trip per
+collection (run concurrently, preferring secondaries), and `StatsSnapshotter`
+refreshes them in the background so dashboard polling reads a snapshot
+instead of re-counting on every request.
+"""
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import Optional
+from pymongo import ReadPreference
+
+from app.config import get_settings
+from app.utils.logger import logger
+
+settings = get_settings()
+
+_snapshot: Optional[dict] = None
+_snapshot_at: float = 0.0
+
+
+async def _group_counts(db, collection: str, field: str) -> dict[str, int]:
+    coll = db.get_collection(collection, read_preference=ReadPreference.SECONDARY_PREFERRED)
+    pipeline = [{"$group": {"_id": f"${field}", "count": {"$sum": 1}}}]
+    return {str(row["_id"]): row["count"] async for row in coll.aggregate(pipeline)}
+
+
+async def _audit_events_today(db) -> int:
+    coll = db.get_collection("audit_logs", read_preference=ReadPreference.SECONDARY_PREFERRED)
+    midnight = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return await coll.count_documents({"timestamp": {"$gte": midnight}})
+
+
+async def collect_counts(db) -> dict:
+    """Fetch every dashboard count concurrently: one query per collection."""
+    participants, tasks, aes, users, studies, leads, audit_today = await asyncio.gather(
+        _group_counts(db, "participants", "status"),
+        _group_counts(db, "taskInstances", "status"),
+        _group_counts(db, "adverseEvents", "status"),
+        _group_counts(db, "users", "role"),
+        _group_counts(db, "studies", "status"),
+        db["leads"].estimated_document_count(),
+        _audit_events_today(db),
+    )
+    return {
+        "participants": participants,
+        "taskInstances": tasks,
+        "adverseEvents": aes,
+        "users": users,
+        "studies": studies,
+        "leads": leads,
+        "auditToday": audit_today,
+    }
+
+
+async def get_counts(db) -> dict:
+    """Return the background snapshot if fresh, otherwise count live."""
+    global _snapshot, _snapshot_at
+    interval = settings.STATS_SNAPSHOT_INTERVAL_SECONDS
+    if _snapshot is not None and interval > 0 and time.monotonic() - _snapshot_at < interval * 2:
+        return _snapshot
+    _snapshot, _snapshot_at = await collect_counts(db), time.monotonic()
+    return _snapshot
+
+
+def _sum(counts: dict[str, int], *keys: str) -> int:
+    return sum(counts.get(k, 0) for k in keys) if keys else sum(counts.values())
+
+
+def admin_dashboard_stats(counts: dict) -> dict:
+    p, t, ae = counts["participants"], counts["taskInstances"], counts["adverseEvents"]
+    total_tasks = _sum(t)
+    completed = t.get("COMPLETED", 0)
+    return {
+        "totalLeads": _sum(p),
+        "screened": p.get("SCREENED", 0),
+        "consented": p.get("CONSENTED", 0),
+        "enrolled": p.get("ENROLLED", 0),
+        "activeParticipants": _sum(p, "ACTIVE", "ENROLLED"),
+        "openAEs": _sum(ae) - ae.get("Resolved", 0),
+        "complianceRate": round((completed / max(total_tasks, 1)) * 100, 1) if total_tasks > 0 else 0,
+    }
+
+
+def recruitment_funnel(counts: dict) -> dict:
+    p = counts["participants"]
+    return {
+        "leads": _sum(p),
+        "screened": _sum(p, "SCREENED", "CONSENTED", "ENROLLED", "ACTIVE", "COMPLETED"),
+        "consented": _sum(p, "CONSENTED", "ENROLLED", "ACTIVE", "COMPLETED"),
+        "enrolled": _sum(p, "ENROLLED", "ACTIVE", "COMPLETED"),
+    }
+
+
+def platform_stats(counts: dict) -> dict:
+    u, s, p, ae = counts["users"], counts["studies"], counts["participants"], counts["adverseEvents"]
+    return {
+        "totalUsers":       _sum(u),
+        "totalAdmins":      _sum(u, "ADMIN", "SUPER_ADMIN"),
+        "totalSponsors":    u.get("SPONSOR", 0),
+        "totalStudies":     _sum(s),
+        "activeStudies":    s.get("ACTIVE", 0),
+        "totalParticipants": _sum(p),
+        "activeParticipants": _sum(p, "ACTIVE", "ENROLLED"),
+        "openAdverseEvents": _sum(ae) - ae.get("Resolved", 0),
+        "sponsorLeads":     counts["leads"],
+        "auditEventsToday": counts["auditToday"],
+    }
+
+
+def sponsor_stats(counts: dict) -> dict:
+    s, p = counts["studies"], counts["participants"]
+    total_participants = _sum(p)
+    completed = p.get("COMPLETED", 0)
+    return {
+        "totalStudies": _sum(s),
+        "activeStudies": _sum(s, "ACTIVE", "RECRUITING"),
+        "totalParticipants": total_participants,
+        "enrolledParticipants": _sum(p, "ENROLLED", "ACTIVE", "COMPLETED"),
+        "completionRate": round((completed / total_participants * 100) if total_participants > 0 else 0, 1),
+    }
+
+
+class StatsSnapshotter:
+    """Background task that refreshes the dashboard counts every `interval` seconds."""
+
+    def __init__(self, interval: int):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self, db) -> None:
+        global _snapshot, _snapshot_at
+        while True:
+            try:
+                _snapshot, _snapshot_at = await collect_counts(db), time.monotonic()
+            except Exception as e:
+                logger.error(f"Stats snapshot refresh failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self, db) -> None:
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+stats_snapshotter = StatsSnapshotter(settings.STATS_SNAPSHOT_INTERVAL_SECONDS)
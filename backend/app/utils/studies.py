@@ -0,0 +1,86 @@
+"""
+Shared study resolver.
+
+Studies are referenced throughout the platform either by ObjectId string or
+by slug. `resolve_study` / `resolve_studies` look them up by id first, then
+slug, and cache the result (per requested projection) in-process. Every route
+that writes a study must call `invalidate_study` afterwards.
+"""
+from typing import Iterable, Optional
+from bson import ObjectId
+
+from app.config import get_settings
+from app.utils.cache import TTLCache
+
+settings = get_settings()
+
+_study_cache = TTLCache(
+    maxsize=settings.STUDY_CACHE_MAX_ENTRIES,
+    ttl=settings.STUDY_CACHE_TTL_SECONDS,
+)
+
+# Fields needed to label a study in participant/coordinator views.
+STUDY_SUMMARY_FIELDS = ("title", "coordinatorId")
+
+
+def _fields_key(fields: Optional[Iterable[str]]) -> Optional[tuple]:
+    return tuple(sorted(set(fields))) if fields else None
+
+
+def _projection(fields_key: Optional[tuple]) -> Optional[dict]:
+    if not fields_key:
+        return None
+    # slug is always kept so slug-keyed entries can be invalidated
+    return {field: 1 for field in (*fields_key, "slug")}
+
+
+async def resolve_study(db, id_or_slug: Optional[str], fields: Optional[Iterable[str]] = None) -> Optional[dict]:
+    """Find a study by ObjectId, else by slug. Pass `fields` to project."""
+    if not id_or_slug:
+        return None
+    results = await resolve_studies(db, [id_or_slug], fields)
+    return results.get(id_or_slug)
+
+
+async def resolve_studies(db, keys: Iterable[str], fields: Optional[Iterable[str]] = None) -> dict[str, dict]:
+    """Batch form of `resolve_study`: cached keys are served locally, the rest in one query."""
+    fields_key = _fields_key(fields)
+    found: dict[str, dict] = {}
+    misses: list[str] = []
+    for key in dict.fromkeys(k for k in keys if k):
+        cached = _study_cache.get((key, fields_key))
+        if cached is not None:
+            found[key] = dict(cached)
+        else:
+            misses.append(key)
+
+    if misses:
+        by_id: dict[str, dict] = {}
+        by_slug: dict[str, dict] = {}
+        oids = [ObjectId(k) for k in misses if ObjectId.is_valid(k)]
+        query = {"$or": [{"_id": {"$in": oids}}, {"slug": {"$in": misses}}]}
+        async for doc in db["studies"].find(query, _projection(fields_key)):
+            by_id[str(doc["_id"])] = doc
+            if doc.get("slug"):
+                by_slug[doc["slug"]] = doc
+        for key in misses:
+            doc = by_id.get(key) or by_slug.get(key)
+            if doc:
+                _study_cache.set((key, fields_key), doc)
+                found[key] = dict(doc)
+    return found
+
+
+def invalidate_study(study_id=None, slug: Optional[str] = None) -> None:
+    """Drop every cached projection of a study after it is written."""
+    study_id = str(study_id) if study_id else None
+    names = {n for n in (study_id, slug) if n}
+
+    def _matches(key, doc) -> bool:
+        return (
+            key[0] in names
+            or (study_id is not None and str(doc.get("_id")) == study_id)
+            or (slug is not None and doc.get("slug") == slug)
+        )
+
+    _study_cache.discard_where(_matches)
@@ -0,0 +1,99 @@
+"""
+Materialized per-study participant counters.
+
+Each study document carries `participantCounts: {<status>: n}`. Every route
+that changes a participant's status or study reports the transition here so
+the counters move with a single `$inc`; `reconcile_study_counters` rebuilds
+them from the participants collection, and runs at startup while any study
+still lacks the field (data written before the counters existed).
+"""
+from typing import Optional
+from pymongo import UpdateOne
+
+from app.utils.logger import logger
+from app.utils.studies import resolve_study, resolve_studies
+
+ENROLLED_STATUSES = ("ENROLLED", "ACTIVE", "COMPLETED")
+
+
+async def _study_oid(db, study_ref: Optional[str]):
+    if not study_ref:
+        return None
+    study = await resolve_study(db, study_ref, fields=("_id",))
+    return study["_id"] if study else None
+
+
+async def record_status_transition(db, before: Optional[dict], after: Optional[dict]) -> None:
+    """
+    Apply a participant transition to the study counters. `before`/`after`
+    are participant documents (or projections holding `studyId` and `status`);
+    pass None for a participant that did not exist / no longer exists.
+    """
+    before = before or {}
+    after = after or {}
+    old_study, old_status = before.get("studyId"), before.get("status")
+    new_study, new_status = after.get("studyId"), after.get("status")
+    if (old_study, old_status) == (new_study, new_status):
+        return
+
+    old_oid = await _study_oid(db, old_study)
+    new_oid = await _study_oid(db, new_study)
+    increments: dict = {}
+    if old_oid is not None and old_status:
+        increments.setdefault(old_oid, {})[f"participantCounts.{old_status}"] = -1
+    if new_oid is not None and new_status:
+        key = f"participantCounts.{new_status}"
+        bucket = increments.setdefault(new_oid, {})
+        bucket[key] = bucket.get(key, 0) + 1
+
+    for oid, inc in increments.items():
+        inc = {k: v for k, v in inc.items() if v}
+        if inc:
+            await db["studies"].update_one({"_id": oid}, {"$inc": inc})
+
+
+def study_participant_totals(study: dict) -> dict:
+    """Sponsor-facing totals derived from a study's materialized counters."""
+    counts = study.get("participantCounts") or {}
+    return {
+        "participantCount": sum(counts.values()),
+        "enrolledCount": sum(counts.get(s, 0) for s in ENROLLED_STATUSES),
+        "completedCount": counts.get("COMPLETED", 0),
+    }
+
+
+async def reconcile_study_counters(db) -> int:
+    """Rebuild every study's `participantCounts` from the participants collection."""
+    pipeline = [
+        {"$match": {"studyId": {"$nin": [None, ""]}}},
+        {"$group": {"_id": {"studyId": "$studyId", "status": "$status"}, "count": {"$sum": 1}}},
+    ]
+    grouped: dict[str, dict[str, int]] = {}
+    async for row in db["participants"].aggregate(pipeline):
+        grouped.setdefault(row["_id"]["studyId"], {})[str(row["_id"].get("status") or "LEAD")] = row["count"]
+
+    # Participants reference studies by id or slug: fold both onto the study _id
+    studies = await resolve_studies(db, grouped.keys(), fields=("_id",))
+    totals: dict = {}
+    for ref, counts in grouped.items():
+        study = studies.get(ref)
+        if not study:
+            continue
+        merged = totals.setdefault(study["_id"], {})
+        for status, n in counts.items():
+            merged[status] = merged.get(status, 0) + n
+
+    ops = [
+        UpdateOne({"_id": study["_id"]}, {"$set": {"participantCounts": totals.get(study["_id"], {})}})
+        async for study in db["studies"].find({}, {"_id": 1})
+    ]
+    if ops:
+        await db["studies"].bulk_write(ops, ordered=False)
+    logger.info(f"Reconciled participant counters for {len(ops)} studies.")
+    return len(ops)
+
+
+async def ensure_study_counters(db) -> None:
+    """Reconcile once if any study predates the counters, so they never start from zero."""
+    if await db["studies"].find_one({"participantCounts": {"$exists": False}}, {"_id": 1}):
+        await reconcile_study_counters(db)
@@ -0,0 +1,297 @@
+"""
+Vectorized vitals analytics for coordinators.
+
+A participant's VITALS, SLEEP and MOOD logs are decrypted once, split into
+one NumPy series per metric (`VITALS.heartRate`, `SLEEP.hours`, ...), and
+summarized with array operations:
+  - baseline: mean/std of readings before study day BASELINE_DAYS (falling
+    back to the first readings if there are none)
+  - change from baseline per study timepoint (or per study week when the
+    study defines no timepoints)
+  - daily means with a trailing ROLLING_DAYS rolling mean
+  - out-of-range flags against reference ranges for well-known metrics, or
+    baseline ± 3 std otherwise
+
+Results are cached per participant (VITALS_ANALYTICS_CACHE_* settings) and
+keyed on the participant's `logsUpdatedAt`, which ingestion bumps, so a new
+log invalidates the entry on every worker. Cache misses are loaded
+VITALS_ANALYTICS_CHUNK_SIZE participants at a time, so only one chunk's
+decrypted logs are held at once. The NumPy work runs in the default executor,
+off the event loop.
+"""
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import Any, Iterable, Optional
+import numpy as np
+from bson import ObjectId
+
+from app.config import get_settings
+from app.utils.cache import TTLCache
+from app.utils.log_rollups import extract_metrics
+from app.utils.security import decrypt_bulk
+from app.utils.studies import resolve_studies
+
+settings = get_settings()
+
+ANALYTIC_TYPES = ("VITALS", "SLEEP", "MOOD")
+BASELINE_DAYS = 7
+BASELINE_MIN_READINGS = 3
+ROLLING_DAYS = 7
+MAX_DAILY_SPAN = 1095
+RECENT_FLAGS = 10
+DAY = 86400.0
+
+# Inclusive reference ranges for common payload fields; anything else is judged against its own baseline
+REFERENCE_RANGES: dict[str, tuple[float, float]] = {
+    "heartRate": (40, 120),
+    "hr": (40, 120),
+    "pulse": (40, 120),
+    "systolic": (90, 180),
+    "diastolic": (50, 110),
+    "spo2": (92, 100),
+    "oxygenSaturation": (92, 100),
+    "temperature": (35.0, 38.5),
+    "respiratoryRate": (10, 24),
+}
+
+_cache = TTLCache(
+    maxsize=settings.VITALS_ANALYTICS_CACHE_MAX_ENTRIES,
+    ttl=settings.VITALS_ANALYTICS_CACHE_TTL_SECONDS,
+)
+
+
+async def mark_logs_updated(db, participant_id: str) -> None:
+    """Record that a participant has new logs, invalidating their cached analytics everywhere."""
+    _cache.pop(participant_id)
+    if ObjectId.is_valid(participant_id):
+        await db["participants"].update_one(
+            {"_id": ObjectId(participant_id)}, {"$set": {"logsUpdatedAt": datetime.now(timezone.utc)}},
+        )
+
+
+def _timestamp(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _iso_day(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).date().isoformat()
+
+
+def _round(value: Any, digits: int = 3) -> Optional[float]:
+    value = float(value)
+    return round(value, digits) if np.isfinite(value) else None
+
+
+# ─── Series ───────────────────────────────────────────────────────────────────
+
+def build_series(entries: Iterable[tuple[dict, Any]]) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """`{"TYPE.metric": (timestamps, values)}` from (log document, plaintext payload) pairs, time-ordered."""
+    times: dict[str, list[float]] = {}
+    values: dict[str, list[float]] = {}
+    for doc, data in entries:
+        ts = _timestamp(doc["loggedAt"])
+        for name, value in extract_metrics(data).items():
+            key = f"{doc['type']}.{name}"
+            times.setdefault(key, []).append(ts)
+            values.setdefault(key, []).append(value)
+    series = {}
+    for key in times:
+        t = np.asarray(times[key], dtype=np.float64)
+        v = np.asarray(values[key], dtype=np.float64)
+        order = np.argsort(t, kind="stable")
+        series[key] = (t[order], v[order])
+    return series
+
+
+def _timepoint_offsets(timepoints: list[dict], last_day: int) -> tuple[np.ndarray, list[str]]:
+    points = sorted(
+        ((int(tp.get("dayOffset", 0)), tp.get("name") or f"Day {tp.get('dayOffset', 0)}") for tp in timepoints),
+        key=lambda p: p[0],
+    )
+    if not points:
+        points = [(week * 7, f"Week {week + 1}") for week in range(max(last_day, 0) // 7 + 1)]
+    return np.asarray([p[0] for p in points], dtype=np.int64), [p[1] for p in points]
+
+
+def analyze_series(
+    t: np.ndarray,
+    v: np.ndarray,
+    anchor: float,
+    metric: str,
+    timepoints: list[dict],
+) -> dict:
+    day = np.floor((t - anchor) / DAY).astype(np.int64)
+
+    # Baseline
+    base_mask = day < BASELINE_DAYS
+    if not base_mask.any():
+        base_mask = np.zeros(len(v), dtype=bool)
+        base_mask[:BASELINE_MIN_READINGS] = True
+    base = v[base_mask]
+    baseline, spread = float(base.mean()), float(base.std())
+
+    # Change from baseline per timepoint: each reading belongs to the latest timepoint at or before its day
+    offsets, names = _timepoint_offsets(timepoints, int(day.max()))
+    slot = np.searchsorted(offsets, day, side="right") - 1
+    in_slot = slot >= 0
+    counts = np.bincount(slot[in_slot], minlength=len(offsets))
+    sums = np.bincount(slot[in_slot], weights=v[in_slot], minlength=len(offsets))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+    timepoint_rows = [
+        {
+            "name": name,
+            "dayOffset": int(offset),
+            "n": int(n),
+            "mean": _round(mean),
+            "change": _round(mean - baseline),
+            "pctChange": _round((mean - baseline) / baseline * 100, 1) if baseline else None,
+        }
+        for name, offset, n, mean in zip(names, offsets, counts, means)
+        if n
+    ]
+
+    # Out-of-range flags
+    field = metric.split(".", 1)[-1]
+    if field in REFERENCE_RANGES:
+        low, high = REFERENCE_RANGES[field]
+    elif spread > 0:
+        low, high = baseline - 3 * spread, baseline + 3 * spread
+    else:
+        low = high = None
+    flagged = (v < low) | (v > high) if low is not None else np.zeros(len(v), dtype=bool)
+    flagged_idx = np.flatnonzero(flagged)[-RECENT_FLAGS:]
+
+    result = {
+        "n": int(len(v)),
+        "baseline": {"mean": _round(baseline), "std": _round(spread), "n": int(len(base))},
+        "latest": {"value": _round(v[-1]), "at": datetime.fromtimestamp(t[-1], tz=timezone.utc)},
+        "changeFromBaseline": _round(v[-1] - baseline),
+        "timepoints": timepoint_rows,
+        "outOfRange": {
+            "low": _round(low) if low is not None else None,
+            "high": _round(high) if high is not None else None,
+            "count": int(flagged.sum()),
+            "recent": [
+                {"value": _round(v[i]), "at": datetime.fromtimestamp(t[i], tz=timezone.utc)} for i in flagged_idx
+            ],
+        },
+    }
+
+    # Daily means and a trailing rolling mean, from cumulative sums over the day index
+    recent = day > day.max() - MAX_DAILY_SPAN  # A stray timestamp must not blow up the day range
+    first = int(day[recent].min())
+    span = int(day.max()) - first + 1
+    daily_counts = np.bincount(day[recent] - first, minlength=span)
+    daily_sums = np.bincount(day[recent] - first, weights=v[recent], minlength=span)
+    csum = np.concatenate(([0.0], np.cumsum(daily_sums)))
+    ccount = np.concatenate(([0], np.cumsum(daily_counts)))
+    idx = np.arange(span)
+    lo = np.maximum(0, idx + 1 - ROLLING_DAYS)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        daily_mean = daily_sums / daily_counts
+        rolling = (csum[idx + 1] - csum[lo]) / (ccount[idx + 1] - ccount[lo])
+    present = np.flatnonzero(daily_counts)
+    result["daily"] = [
+        {
+            "studyDay": first + int(i),
+            "date": _iso_day(anchor + (first + int(i)) * DAY),
+            "n": int(daily_counts[i]),
+            "mean": _round(daily_mean[i]),
+            "rollingMean": _round(rolling[i]),
+        }
+        for i in present
+    ]
+    return result
+
+
+def analyze_participant(participant: dict, entries: list[tuple[dict, Any]], timepoints: list[dict]) -> dict:
+    series = build_series(entries)
+    if not series:
+        return {"participantId": str(participant["_id"]), "metrics": {}}
+    enrolled = participant.get("enrolledAt")
+    anchor = _timestamp(enrolled) if enrolled else min(t[0] for t, _ in series.values())
+    return {
+        "participantId": str(participant["_id"]),
+        "anchor": datetime.fromtimestamp(anchor, tz=timezone.utc),
+        "metrics": {key: analyze_series(t, v, anchor, key, timepoints) for key, (t, v) in series.items()},
+    }
+
+
+# ─── Loading ──────────────────────────────────────────────────────────────────
+
+async def _load_entries(db, participant_ids: list[str]) -> dict[str, list[tuple[dict, Any]]]:
+    """Decrypted analytic logs for several participants, most recent VITALS_ANALYTICS_MAX_READINGS each."""
+    def _recent(pid: str):
+        return db["dataLogs"].find(
+            {"participantId": pid, "type": {"$in": list(ANALYTIC_TYPES)}},
+            {"participantId": 1, "type": 1, "loggedAt": 1, "data": 1},
+        ).sort("loggedAt", -1).limit(settings.VITALS_ANALYTICS_MAX_READINGS).to_list(None)
+
+    docs = [doc for batch in await asyncio.gather(*(_recent(pid) for pid in participant_ids)) for doc in batch]
+    payloads = await decrypt_bulk(doc.get("data") for doc in docs)
+    grouped: dict[str, list[tuple[dict, Any]]] = {pid: [] for pid in participant_ids}
+    for doc, payload in zip(docs, payloads):
+        try:
+            data = json.loads(payload) if isinstance(payload, str) else payload
+        except ValueError:
+            continue
+        grouped[doc["participantId"]].append((doc, data))
+    return grouped
+
+
+async def participant_analytics(db, participants: list[dict]) -> list[dict]:
+    """Analytics for each participant, served from the cache where still current."""
+    results: dict[str, dict] = {}
+    misses: list[dict] = []
+    for p in participants:
+        pid = str(p["_id"])
+        cached = _cache.get(pid)
+        if cached is not None and cached[0] == p.get("logsUpdatedAt"):
+            results[pid] = cached[1]
+        else:
+            misses.append(p)
+
+    if misses:
+        studies = await resolve_studies(db, {p["studyId"] for p in misses if p.get("studyId")}, fields=("timepoints",))
+        loop = asyncio.get_running_loop()
+        chunk_size = settings.VITALS_ANALYTICS_CHUNK_SIZE
+        for start in range(0, len(misses), chunk_size):
+            chunk = misses[start:start + chunk_size]
+            entries = await _load_entries(db, [str(p["_id"]) for p in chunk])
+            analyzed = await asyncio.gather(*(
+                loop.run_in_executor(
+                    None, analyze_participant, p, entries[str(p["_id"])],
+                    (studies.get(p.get("studyId")) or {}).get("timepoints") or [],
+                )
+                for p in chunk
+            ))
+            for p, result in zip(chunk, analyzed):
+                results[str(p["_id"])] = result
+                _cache.set(str(p["_id"]), (p.get("logsUpdatedAt"), result))
+    return [results[str(p["_id"])] for p in participants]
+
+
+def cohort_summary(analytics: list[dict]) -> dict:
+    """Per-metric cohort aggregates over participants' latest change from baseline."""
+    changes: dict[str, list[float]] = {}
+    flagged: dict[str, int] = {}
+    for a in analytics:
+        for key, m in a["metrics"].items():
+            if m["changeFromBaseline"] is not None:
+                changes.setdefault(key, []).append(m["changeFromBaseline"])
+            if m["outOfRange"]["count"]:
+                flagged[key] = flagged.get(key, 0) + 1
+    summary = {}
+    for key, values in changes.items():
+        arr = np.asarray(values, dtype=np.float64)
+        summary[key] = {
+            "participants": int(arr.size),
+            "meanChange": _round(arr.mean()),
+            "medianChange": _round(np.median(arr)),
+            "participantsOutOfRange": flagged.get(key, 0),
+        }
+    return summary
@@ -0,0 +1,82 @@
+"""
+Token Verification Benchmark
+============================
+Measures `get_current_user` throughput for:
+  - before:    PEM parsed on every call (the previous decode path)
+  - uncached:  pre-parsed RS256 key, signature verified on every call
+  - cached:    repeat requests served from the verified-token cache
+
+Uses the configured PRIVATE_KEY/PUBLIC_KEY, or a throwaway pair if unset.
+
+Usage:
+    python benchmark_auth.py [--iterations 2000]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from datetime import timedelta
+from typing import Optional
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from dotenv import load_dotenv
+
+load_dotenv()
+
+if not os.getenv("PRIVATE_KEY") or not os.getenv("PUBLIC_KEY"):
+    _key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    os.environ["PRIVATE_KEY"] = _key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption(),
+    ).decode()
+    os.environ["PUBLIC_KEY"] = _key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode()
+
+from jose import jwt  # noqa: E402
+
+from app import auth  # noqa: E402
+
+
+def _decode_with_pem(token: str):
+    """The previous implementation: re-read the PEM string for every request."""
+    public_key_pem = auth.settings.PUBLIC_KEY.replace("\\n", "\n").encode()
+    return jwt.decode(token, public_key_pem, algorithms=["RS256"])
+
+
+async def _measure(label: str, iterations: int, call, baseline: Optional[float] = None) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await call()
+    elapsed = time.perf_counter() - start
+    speedup = f"  ({baseline / elapsed:.1f}x)" if baseline else ""
+    print(f"  {label:<10} {iterations / elapsed:>12,.0f} req/sec{speedup}")
+    return elapsed
+
+
+async def _uncached(token: str):
+    auth._token_cache.clear()
+    return await auth.get_current_user(token)
+
+
+async def _before(token: str):
+    return _decode_with_pem(token)
+
+
+async def run(iterations: int) -> None:
+    token = auth.create_access_token(
+        {"sub": "000000000000000000000000", "email": "bench@example.com", "role": "PARTICIPANT", "modules": ["VCT"]},
+        expires_delta=timedelta(minutes=30),
+    )
+    print(f"get_current_user x {iterations:,}")
+    before = await _measure("before", iterations, lambda: _before(token))
+    await _measure("uncached", iterations, lambda: _uncached(token), before)
+    await _measure("cached", iterations, lambda: auth.get_current_user(token), before)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark access-token verification throughput")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
@@ -0,0 +1,70 @@
+"""
+Decryption Benchmark
+====================
+Measures rows/sec for serial `decrypt_data` against `decrypt_bulk` on the
+thread and process pools, using export-shaped rows (4 encrypted fields each).
+
+Usage:
+    python benchmark_decrypt.py [--rows 20000] [--chunk-size 256] [--workers 0]
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from typing import Optional
+
+from cryptography.fernet import Fernet
+from dotenv import load_dotenv
+
+load_dotenv()
+# A throwaway key keeps the benchmark runnable without a configured .env
+os.environ.setdefault("ENCRYPTION_KEY", Fernet.generate_key().decode())
+
+from app.utils import security  # noqa: E402
+
+FIELDS_PER_ROW = 4
+
+
+def _make_ciphertexts(rows: int) -> list[str]:
+    sample = security.encrypt_data('{"systolic": 121, "diastolic": 79, "heartRate": 64}')
+    return [sample] * (rows * FIELDS_PER_ROW)
+
+
+def _report(label: str, rows: int, elapsed: float, baseline: Optional[float] = None) -> None:
+    speedup = f"  ({baseline / elapsed:.2f}x)" if baseline else ""
+    print(f"  {label:<22} {rows / elapsed:>12,.0f} rows/sec{speedup}")
+
+
+async def _bulk(values: list[str], chunk_size: int) -> float:
+    await security.decrypt_bulk(values[:security.settings.DECRYPT_INLINE_MAX + 1], chunk_size)  # warm the pool
+    start = time.perf_counter()
+    await security.decrypt_bulk(values, chunk_size)
+    return time.perf_counter() - start
+
+
+async def run(rows: int, chunk_size: int, workers: int) -> None:
+    values = _make_ciphertexts(rows)
+    security.settings.DECRYPT_WORKERS = workers
+    print(f"Decrypting {rows:,} rows x {FIELDS_PER_ROW} fields (chunk={chunk_size}, workers={workers or os.cpu_count()})")
+
+    start = time.perf_counter()
+    for v in values:
+        security.decrypt_data(v)
+    serial = time.perf_counter() - start
+    _report("serial decrypt_data", rows, serial)
+
+    for pool in ("thread", "process"):
+        security.shutdown_decrypt_pool()
+        security.settings.DECRYPT_POOL = pool
+        _report(f"decrypt_bulk ({pool})", rows, await _bulk(values, chunk_size), serial)
+    security.shutdown_decrypt_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark bulk decryption throughput")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=0, help="Pool size (0 = one per CPU)")
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.chunk_size, args.workers))
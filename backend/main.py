@@ -1,29 +1,50 @@
-from fastapi import FastAPI, Request, Response
+from fastapi import Depends, FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
 
 from app.config import get_settings
-from app.database import connect_db, close_db
+from app.auth import load_jwt_keys, require_super_admin
+from app.database import connect_db, close_db, get_db
+from app.utils.audit_writer import audit_writer
+from app.utils.compliance import compliance_sweeper, ensure_compliance
+from app.utils.email_outbox import email_dispatcher
+from app.utils.pagination import NEXT_CURSOR_HEADER
+from app.utils.passwords import password_hasher
+from app.utils.rate_limit import check_default_limit
+from app.utils.realtime import realtime_feed
+from app.utils.security import shutdown_decrypt_pool
+from app.utils.stats import stats_snapshotter
+from app.utils.study_counters import ensure_study_counters
 from app.routes import (
     auth, studies, participants, adverse_events, messages, 
     tasks, documents, data_logs, sponsor, audit, scheduling, inventory, admin,
-    assessments, notifications, export
+    assessments, notifications, export, events
 )
 from app.routes import super_admin
 
 settings = get_settings()
 
-# ─── Rate Limiting ────────────────────────────────────────────────────────────
-limiter = Limiter(key_func=get_remote_address, default_limits=["200 per minute"])
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown lifecycle hooks."""
+    load_jwt_keys()
     await connect_db()
+    await ensure_study_counters(get_db())
+    await ensure_compliance(get_db())
+    stats_snapshotter.start(get_db())
+    email_dispatcher.start(get_db())
+    audit_writer.start(get_db())
+    realtime_feed.start(get_db())
+    compliance_sweeper.start(get_db())
     yield
+    await compliance_sweeper.stop()
+    await realtime_feed.stop()
+    await email_dispatcher.stop()
+    await stats_snapshotter.stop()
+    await audit_writer.stop()
+    shutdown_decrypt_pool()
+    password_hasher.shutdown()
     await close_db()
 
 
@@ -36,8 +57,22 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+# ─── Rate Limiting ────────────────────────────────────────────────────────────
+# Same sliding-window engine and store as the per-endpoint auth limits
+RATE_LIMIT_EXEMPT_PATHS = {"/", "/api/health"}
+
+@app.middleware("http")
+async def default_rate_limit(request: Request, call_next):
+    if request.method == "OPTIONS" or request.url.path in RATE_LIMIT_EXEMPT_PATHS:
+        return await call_next(request)
+    result = await check_default_limit(request)
+    if result and not result.allowed:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": f"Rate limit exceeded: {result.limit} per 1 minute"},
+            headers={"Retry-After": str(result.retry_after)},
+        )
+    return await call_next(request)
 
 # ─── Security Headers Middleware ──────────────────────────────────────────────
 @app.middleware("http")
@@ -58,6 +93,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # ─── Routers ─────────────────────────────────────────────────────────────────
@@ -78,6 +114,7 @@ app.include_router(admin.router)
 app.include_router(assessments.router)
 app.include_router(notifications.router)
 app.include_router(export.router)
+app.include_router(events.router)
 app.include_router(super_admin.router)
 
 
@@ -97,3 +134,15 @@ def root():
 @app.get("/api/health", tags=["Root"])
 def health():
     return {"status": "healthy"}
+
+
+# ─── Metrics ──────────────────────────────────────────────────────────────────
+
+@app.get("/api/metrics", tags=["Root"])
+def metrics(current_user=Depends(require_super_admin)):
+    """Per-worker queue and background-task metrics."""
+    return {
+        "auditWriter": audit_writer.metrics(),
+        "passwordHasher": password_hasher.metrics(),
+        "realtime": realtime_feed.metrics(),
+    }
@@ -0,0 +1,41 @@
+"""
+Verify Query Plans
+==================
+Creates every index declared by the routers, then runs explain() on each
+registered canonical query and exits non-zero if any is served by a COLLSCAN.
+
+Usage:
+    python verify_indexes.py
+"""
+
+import asyncio
+import importlib
+import pkgutil
+import sys
+
+import app.routes
+from app import database
+
+
+def load_routers() -> None:
+    """Import every router module; each registers its indexes and query shapes at import."""
+    for module in pkgutil.iter_modules(app.routes.__path__):
+        importlib.import_module(f"app.routes.{module.name}")
+
+
+async def verify() -> int:
+    load_routers()
+    try:
+        await database.connect_db()
+        await database.verify_query_plans()
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        await database.close_db()
+    print("✅ All registered query shapes are index-backed.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(verify()))